@@ -0,0 +1,218 @@
+###########################################
+## Offline bulk import for SPADE corpora ##
+###########################################
+
+## CorpusContext.load writes each discourse to the graph database in transactions, which is
+## the slowest part of importing a large corpus.  The functions here write parsed discourses
+## to the node and relationship files read by neo4j-admin import instead, build the graph
+## database from them while it is stopped, and then add the indexes, hierarchy and sound file
+## information that a normal import would create.  The database must be local, as the
+## importer writes straight into its data directory.
+
+import os
+import sys
+import csv
+import shutil
+import subprocess
+from collections import namedtuple
+
+from polyglotdb.acoustics.io import setup_audio
+
+## sound file information of a discourse, as used by setup_audio
+SoundFile = namedtuple('SoundFile', ['name', 'wav_path'])
+
+## python types of the property types in the import file headers
+property_types = {'boolean': bool, 'long': int, 'double': float, 'string': str}
+
+
+def column_type(kinds):
+    """Import file type of a column from the python types of the values seen in it"""
+
+    if not kinds:
+        return 'string'
+    if kinds == {bool}:
+        return 'boolean'
+    if kinds == {int}:
+        return 'long'
+    if kinds <= {int, float}:
+        return 'double'
+    return 'string'
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def supports(parser):
+    """Check whether the corpus of a parser can be bulk imported (subannotations are not written)"""
+
+    return not parser.hierarchy.subannotations
+
+
+class ImportFileWriter(object):
+    """Writes parsed discourses to headerless node and relationship files, one group of
+    files per kind of node or relationship; the headers are written by finish, once the
+    types of all the property values are known.  Corpora with subannotations are imported
+    normally instead (see supports)."""
+
+    def __init__(self, directory, corpus_name, hierarchy):
+        self.directory = directory
+        self.corpus_name = corpus_name
+        self.hierarchy = hierarchy
+        self.files = {}
+        self.headers = {}
+        self.kinds = {}
+        self.speakers = set()
+        self.types = set()
+        self.sound_files = []
+        os.makedirs(directory, exist_ok=True)
+
+    def group(self, name, kind, header, properties=()):
+        """Open the file of a group on first use; `header` holds the id and label columns,
+        `properties` the property columns, whose types are inferred"""
+
+        if name not in self.files:
+            f = open(os.path.join(self.directory, '{}.csv'.format(name)), 'w', newline='', encoding='utf8')
+            self.files[name] = (kind, f, csv.writer(f))
+            self.headers[name] = (header, list(properties))
+            self.kinds[name] = [set() for _ in properties]
+        return self.files[name][2]
+
+    def write(self, name, row, properties=()):
+        kinds = self.kinds[name]
+        for i, value in enumerate(properties):
+            if value is not None:
+                kinds[i].add(type(value))
+        self.files[name][2].writerow([format_value(x) for x in list(row) + list(properties)])
+
+    def add_discourse(self, data):
+        corpus = self.corpus_name
+        self.group('discourses', 'nodes', ['name:ID(Discourse)', ':LABEL'])
+        self.write('discourses', [data.name, 'Discourse;{}'.format(corpus)])
+        if data.wav_path:
+            self.sound_files.append(SoundFile(data.name, data.wav_path))
+        for speaker, channel in getattr(data, 'speaker_channel_mapping', {}).items():
+            self.add_speaker(speaker)
+            self.group('speaks_in', 'relationships', [':START_ID(Speaker)', ':END_ID(Discourse)', ':TYPE'],
+                       ['channel'])
+            self.write('speaks_in', [speaker, data.name, 'speaks_in'], [channel])
+
+        written = set()
+        for annotation_type in data.highest_to_lowest():
+            supertype = data[annotation_type].supertype
+            token_keys = data[annotation_type].token_property_keys
+            type_keys = data[annotation_type].type_property_keys
+            tokens = '{}_tokens'.format(annotation_type)
+            types = '{}_types'.format(annotation_type)
+            self.group(tokens, 'nodes', ['id:ID({})'.format(annotation_type), ':LABEL', 'begin:double', 'end:double'],
+                       token_keys)
+            self.group(types, 'nodes', ['id:ID({}_type)'.format(annotation_type), ':LABEL'], type_keys)
+            for relationship, end in [('is_a', '{}_type'.format(annotation_type)), ('spoken_in', 'Discourse'),
+                                      ('spoken_by', 'Speaker'), ('precedes', annotation_type),
+                                      ('contained_by', supertype)]:
+                if end is not None:
+                    self.group('{}_{}'.format(annotation_type, relationship), 'relationships',
+                               [':START_ID({})'.format(annotation_type), ':END_ID({})'.format(end), ':TYPE'])
+            token_label = '{};{};speech'.format(annotation_type, corpus)
+            type_label = '{}_type;{}'.format(annotation_type, corpus)
+            precedes = []
+            for d in data[annotation_type]:
+                ## as in a normal import, annotations without times are left out
+                if d.begin is None or d.end is None:
+                    continue
+                written.add(d.id)
+                token_properties = dict(zip(d.token_keys(), d.token_values()))
+                self.write(tokens, [d.id, token_label, d.begin, d.end], [token_properties.get(k) for k in token_keys])
+                type_id = d.sha(corpus=corpus)
+                if (annotation_type, type_id) not in self.types:
+                    self.types.add((annotation_type, type_id))
+                    type_properties = dict(zip(d.type_keys(), d.type_values()))
+                    self.write(types, [type_id, type_label], [type_properties.get(k) for k in type_keys])
+                self.write('{}_is_a'.format(annotation_type), [d.id, type_id, 'is_a'])
+                self.write('{}_spoken_in'.format(annotation_type), [d.id, data.name, 'spoken_in'])
+                if d.speaker is not None:
+                    self.add_speaker(d.speaker)
+                    self.write('{}_spoken_by'.format(annotation_type), [d.id, d.speaker, 'spoken_by'])
+                if d.previous_id is not None:
+                    precedes.append([d.previous_id, d.id, 'precedes'])
+                if supertype is not None and d.super_id in written:
+                    self.write('{}_contained_by'.format(annotation_type), [d.id, d.super_id, 'contained_by'])
+            ## relationships to annotations that were left out are left out too, so that the
+            ## importer never meets a missing node
+            for row in precedes:
+                if row[0] in written:
+                    self.write('{}_precedes'.format(annotation_type), row)
+
+    def add_speaker(self, speaker):
+        if speaker not in self.speakers:
+            self.speakers.add(speaker)
+            self.group('speakers', 'nodes', ['name:ID(Speaker)', ':LABEL'])
+            self.write('speakers', [speaker, 'Speaker;{}'.format(self.corpus_name)])
+
+    def property_types(self, name):
+        """Names and python types of the property columns of a group"""
+
+        header, properties = self.headers[name]
+        return [(k, property_types[column_type(kinds)]) for k, kinds in zip(properties, self.kinds[name])]
+
+    def finish(self):
+        """Close the data files and write their headers, returning the importer arguments"""
+
+        self.group('corpus', 'nodes', ['name', ':LABEL'])
+        self.write('corpus', [self.corpus_name, 'Corpus'])
+        arguments = []
+        for name, (kind, f, writer) in sorted(self.files.items()):
+            f.close()
+            header, properties = self.headers[name]
+            header = header + ['{}:{}'.format(k, column_type(kinds)) for k, kinds in zip(properties, self.kinds[name])]
+            header_path = os.path.join(self.directory, '{}_header.csv'.format(name))
+            with open(header_path, 'w', newline='', encoding='utf8') as h:
+                csv.writer(h).writerow(header)
+            arguments.append('--{}={},{}'.format(kind, header_path, f.name))
+        return arguments
+
+
+def run_import(neo4j_dir, arguments):
+    """Build the graph database of a stopped local server from the import files"""
+
+    graph_dir = os.path.join(neo4j_dir, 'data', 'databases', 'graph.db')
+    if os.path.exists(graph_dir):
+        shutil.rmtree(graph_dir)
+    admin = os.path.join(neo4j_dir, 'bin', 'neo4j-admin')
+    if sys.platform == 'win32':
+        admin += '.bat'
+    command = [admin, 'import', '--database=graph.db', '--ignore-empty-strings=true'] + arguments
+    subprocess.check_call(command)
+
+
+def finish_import(c, writer):
+    """Add what a normal import creates besides the nodes and relationships: indexes,
+    the annotation hierarchy with its properties, and the discourses' sound files"""
+
+    c.execute_cypher('CREATE CONSTRAINT ON (node:Corpus) ASSERT node.name IS UNIQUE')
+    c.execute_cypher('CREATE INDEX ON :Discourse(name)')
+    c.execute_cypher('CREATE INDEX ON :Speaker(name)')
+    for annotation_type in writer.hierarchy.annotation_types:
+        c.execute_cypher('CREATE INDEX ON :{}(id)'.format(annotation_type))
+        c.execute_cypher('CREATE INDEX ON :{}(begin)'.format(annotation_type))
+        c.execute_cypher('CREATE INDEX ON :{}(end)'.format(annotation_type))
+        c.execute_cypher('CREATE INDEX ON :{}_type(id)'.format(annotation_type))
+
+    c.hierarchy = writer.hierarchy
+    c.encode_hierarchy()
+    for annotation_type in writer.hierarchy.annotation_types:
+        if '{}_tokens'.format(annotation_type) not in writer.files:
+            continue
+        token_properties = writer.property_types('{}_tokens'.format(annotation_type))
+        if token_properties:
+            c.hierarchy.add_token_properties(c, annotation_type, token_properties)
+        type_properties = writer.property_types('{}_types'.format(annotation_type))
+        if type_properties:
+            c.hierarchy.add_type_properties(c, annotation_type, type_properties)
+
+    for sound_file in writer.sound_files:
+        setup_audio(c, sound_file)
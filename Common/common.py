@@ -14,34 +14,92 @@ import sys
 
 sys.path.insert(0, '/mnt/e/Dev/Polyglot/PolyglotDB')
 import re
+import glob
 import yaml
 import csv
+import copy
+import json
+import pickle
+import shutil
+import hashlib
 import platform
+import queue
+import tempfile
+import threading
+import subprocess
+from contextlib import ExitStack
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import polyglotdb.io as pgio
 
 ## PolyglotDB functions
 from polyglotdb import CorpusContext
 from polyglotdb.utils import ensure_local_database_running
 from polyglotdb.config import CorpusConfig
+from polyglotdb.exceptions import ParseError
 from polyglotdb.io.enrichment import enrich_speakers_from_csv, enrich_lexicon_from_csv
-from polyglotdb.acoustics.formants.refined import analyze_formant_points_refinement
+from polyglotdb.acoustics.segments import generate_segments
 from polyglotdb.client.client import PGDBClient, ClientError
 
+## acoustic analysis functions
+from conch import analyze_segments
+from conch.analysis.praat import PraatAnalysisFunction
+
+## SPADE functions
+import discourse_enrichment
+import bulk_import
+import lexicon_store
+from sibilant_measures import analyze_sibilants
+from measure_cache import MeasureCache, content_hash
+import multitaper_measures
+from formant_refinement import refine_formant_points, output_columns
+from spectra_store import SpectraStore
+
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # =============== CONFIGURATION ===============
 ## default values for connecting to the server
 server_ip = "localhost"
 docker_ip = "app"
-server_port = 8080
+## the server port can be overridden per process (e.g., by run_all_corpora.py
+## when several corpora are processed at once, each worker using its own server)
+server_port = int(os.environ.get('SPADE_SERVER_PORT', 8080))
 
 ## default values for formant enrichment (see formant analysis functions below)
 duration_threshold = 0.05
 nIterations = 20
+## when refinement of a speaker's vowel stops: after max_iterations, once the share of tokens whose
+## selected number of formants changed in an iteration is at most changed_share, or once the prototype
+## means moved by at most prototype_shift (a Mahalanobis distance; null to not use it).  A corpus can
+## override these with a formant_convergence mapping in its YAML file.
+formant_convergence = {'max_iterations': nIterations, 'changed_share': 0, 'prototype_shift': None}
+
+## measures produced by the sibilant Praat script, and the number of
+## tokens written back to the database per statement
+sibilant_measures = ['cog', 'peak', 'slope', 'spread']
+write_batch_size = 5000
+
+## point measures that formant refinement can write to the vowels (which of them are written
+## depends on the PolyglotDB version), kept in the measurement cache
+formant_point_properties = ([(column, float) for column in output_columns] +
+                            [('num_formants', float), ('Fx', int), ('drop_formant', int)])
 
 ## default paths
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sibilant_script_path = os.path.join(base_dir, 'Common', 'sibilant_jane_optimized.praat')
+sibilant_batch_script_path = os.path.join(base_dir, 'Common', 'sibilant_jane_batch.praat')
+sibilant_numpy_path = os.path.join(base_dir, 'Common', 'sibilant_measures.py')
+snapshot_dir = os.path.join(base_dir, 'snapshots')
+parse_cache_dir = os.path.join(base_dir, 'parse_cache')
+lexicon_cache_dir = os.path.join(base_dir, 'lexicon_cache')
+acoustic_cache_path = os.path.join(base_dir, 'acoustic_cache', 'measures.sqlite')
+
+## configuration keys that determine the state of an imported and enriched corpus
+snapshot_keys = ['corpus_directory', 'input_format', 'dialect_code', 'unisyn_spade_directory',
+                 'speaker_enrichment_file', 'vowel_inventory', 'extra_syllabic_segments', 'pauses']
+## the parts of a database directory that hold the data (rather than the server's configuration)
+snapshot_data_dirs = [os.path.join('neo4j', 'data'), os.path.join('influxdb', 'data'),
+                      os.path.join('influxdb', 'meta'), os.path.join('influxdb', 'wal')]
 
 # =============================================
 now = datetime.now()
@@ -72,6 +130,108 @@ def save_performance_benchmark(config, task, time_taken):
         writer.writerow([platform.node(), config.corpus_name, date, get_size_of_corpus(config), task, time_taken])
 
 
+def load_benchmarks():
+    """Read the saved benchmarks as a list of rows (see save_performance_benchmark)"""
+
+    benchmark_file = os.path.join(base_dir, 'benchmarks', 'benchmarks.csv')
+    if not os.path.exists(benchmark_file):
+        return []
+    rows = []
+    with open(benchmark_file, 'r', encoding='utf8') as f:
+        for row in csv.DictReader(f):
+            try:
+                row['Corpus_size'] = float(row['Corpus_size'])
+                row['Time'] = float(row['Time'])
+            except (TypeError, ValueError):
+                continue
+            rows.append(row)
+    return rows
+
+
+def fit_runtime_models(benchmarks):
+    """Fit a least-squares line (time = intercept + slope * corpus size) for each task"""
+
+    by_task = {}
+    for row in benchmarks:
+        by_task.setdefault(row['Task'], []).append((row['Corpus_size'], row['Time']))
+    models = {}
+    for task, points in by_task.items():
+        n = len(points)
+        mean_size = sum(x for x, _ in points) / n
+        mean_time = sum(y for _, y in points) / n
+        variance = sum((x - mean_size) ** 2 for x, _ in points)
+        if variance == 0:
+            slope = 0
+        else:
+            slope = max(0, sum((x - mean_size) * (y - mean_time) for x, y in points) / variance)
+        models[task] = (mean_time - slope * mean_size, slope)
+    return models
+
+
+## Benchmarked stages of the import and enrichment shared by the analysis scripts (see prepare_corpus)
+preparation_stages = ['import', 'lexicon_enrichment', 'speaker_enrichment', 'utterance_encoding', 'syllable_encoding',
+                      'discourse_enrichment', 'count_encoding', 'stress_encoding', 'stress_encoding_from_pattern']
+
+## Stages that only some corpora run, depending on their configuration (enrichment engine, stress source)
+optional_stages = {'discourse_enrichment', 'stress_encoding', 'stress_encoding_from_pattern'}
+
+## Benchmarked stages run by each analysis script (with multitaper_measures, the sibilant export's time includes
+## the multitaper measurement, whose own multitaper_measures benchmark is therefore not counted again)
+script_stages = {
+    'formant.py': preparation_stages + ['vowel_encoding', 'formant_acoustic_analysis', 'formant_export'],
+    'formant_track.py': preparation_stages + ['vowel_encoding', 'formant_acoustic_analysis', 'formant_tracks_export'],
+    'rhotics.py': preparation_stages + ['vowel_encoding', 'formant_acoustic_analysis', 'rhotics_export'],
+    'sibilant.py': preparation_stages + ['sibilant_encoding', 'sibilant_acoustic_analysis', 'sibilant_export'],
+    'sibilant_full.py': preparation_stages + ['sibilant_encoding', 'sibilant_acoustic_analysis',
+                                              'sibilant_full_export'],
+    'duration.py': preparation_stages + ['duration_export'],
+    'svlr.py': preparation_stages + ['svlr_export'],
+    'utterances.py': preparation_stages + ['utterance_export'],
+    'polysyllabic.py': preparation_stages + ['polysyllabic_export'],
+    'basic_queries.py': preparation_stages + ['basic_query'],
+    'basic_size_queries.py': ['import'],
+}
+
+
+def predict_runtimes(corpora, stages, benchmarks=None):
+    """Predict the runtime of the given stages on each corpus from the stage models and the corpus's own
+    benchmark history, returning None for corpora that have never been benchmarked.  Optional stages
+    count only if the corpus has run them before."""
+
+    if benchmarks is None:
+        benchmarks = load_benchmarks()
+    models = fit_runtime_models(benchmarks)
+    history = {}
+    for row in benchmarks:
+        ## keep the most recent size and the set of tasks run for each corpus
+        corpus_history = history.setdefault(row['Corpus'], {'size': None, 'tasks': set()})
+        corpus_history['size'] = row['Corpus_size']
+        corpus_history['tasks'].add(row['Task'])
+    predictions = {}
+    for corpus in corpora:
+        if corpus not in history:
+            predictions[corpus] = None
+            continue
+        size = history[corpus]['size']
+        tasks = [t for t in stages if t in models and (t in history[corpus]['tasks'] or t not in optional_stages)]
+        predictions[corpus] = sum(max(0, models[t][0] + models[t][1] * size) for t in tasks)
+    return predictions
+
+
+def schedule_longest_first(predictions, workers):
+    """Order jobs by longest predicted runtime first (LPT), with jobs lacking a prediction
+    given the median prediction, and estimate the makespan on the given number of workers"""
+
+    known = sorted(x for x in predictions.values() if x is not None)
+    default = known[len(known) // 2] if known else 0
+    estimates = {k: default if v is None else v for k, v in predictions.items()}
+    order = sorted(estimates, key=lambda k: estimates[k], reverse=True)
+    loads = [0] * max(1, workers)
+    for job in order:
+        loads[loads.index(min(loads))] += estimates[job]
+    return order, max(loads)
+
+
 def load_config(corpus_name):
     """Open the YAML configuration file and check it is correctly structured"""
 
@@ -113,150 +273,771 @@ def call_back(*args):
 def reset(corpus_name):
     """Remove the database files produced from import."""
 
-    with ensure_local_database_running(corpus_name, port=8080, ip=server_ip, token=load_token()) as params:
+    with ensure_local_database_running(corpus_name, port=server_port, ip=server_ip, token=load_token()) as params:
         config = CorpusConfig(corpus_name, **params)
         with CorpusContext(config) as c:
             print('Resetting the corpus.')
             c.reset()
+    remove_manifest(corpus_name)
+
+def config_hash(corpus_conf):
+    """Hash the parts of a corpus configuration that affect import and enrichment"""
+
+    data = {k: corpus_conf.get(k) for k in snapshot_keys}
+    ## the encoders used for enrichment (see basic_enrichment)
+    data['enrichment_engine'] = corpus_conf.get('enrichment_engine', 'database')
+    data['enrichment_pool'] = corpus_conf.get('enrichment_workers', 1) > 1
+    data = json.dumps(data, sort_keys=True)
+    return hashlib.sha1(data.encode('utf8')).hexdigest()[:12]
+
+
+def get_snapshot_path(corpus_name, corpus_conf):
+    return os.path.join(snapshot_dir, '{}_{}'.format(corpus_name, config_hash(corpus_conf)))
+
+
+def save_snapshot(corpus_name, corpus_conf, ip=server_ip):
+    """Copy the data directories of an imported and enriched corpus's database into the snapshot directory."""
+
+    snapshot_path = get_snapshot_path(corpus_name, corpus_conf)
+    client = PGDBClient('http://{}:{}'.format(ip, server_port), token=load_token())
+    data_dir = client.get_directory(corpus_name)
+    ## the database must be stopped so that its files are consistent on disk
+    try:
+        client.stop_database(corpus_name)
+    except ClientError:
+        pass
+    print('Saving snapshot of {} to {}'.format(corpus_name, snapshot_path))
+    beg = time.time()
+    temp_path = snapshot_path + '_incomplete'
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    for directory in snapshot_data_dirs:
+        if os.path.exists(os.path.join(data_dir, directory)):
+            shutil.copytree(os.path.join(data_dir, directory), os.path.join(temp_path, directory))
+    if os.path.exists(snapshot_path):
+        shutil.rmtree(snapshot_path)
+    os.rename(temp_path, snapshot_path)
+    ## keep the stage manifest alongside, so that restoring brings back the record of completed stages
+    if os.path.exists(get_manifest_path(corpus_name)):
+        shutil.copyfile(get_manifest_path(corpus_name), snapshot_path + '_manifest.json')
+    print('Saving snapshot took: {}'.format(time.time() - beg))
+
+
+def restore_snapshot(corpus_name, corpus_conf, ip=server_ip):
+    """Replace the data directories of a corpus's database with its snapshot, returning False if there is none.
+    The server's configuration (ports, memory) in the database directory is left as it is."""
+
+    snapshot_path = get_snapshot_path(corpus_name, corpus_conf)
+    if not os.path.exists(snapshot_path):
+        print('No snapshot found for {} at {}.'.format(corpus_name, snapshot_path))
+        return False
+    client = PGDBClient('http://{}:{}'.format(ip, server_port), token=load_token())
+    try:
+        client.create_database(corpus_name)
+    except ClientError:
+        pass
+    try:
+        client.stop_database(corpus_name)
+    except ClientError:
+        pass
+    data_dir = client.get_directory(corpus_name)
+    print('Restoring {} from {}'.format(corpus_name, snapshot_path))
+    beg = time.time()
+    for directory in snapshot_data_dirs:
+        if os.path.exists(os.path.join(data_dir, directory)):
+            shutil.rmtree(os.path.join(data_dir, directory))
+        if os.path.exists(os.path.join(snapshot_path, directory)):
+            shutil.copytree(os.path.join(snapshot_path, directory), os.path.join(data_dir, directory))
+    remove_manifest(corpus_name)
+    if os.path.exists(snapshot_path + '_manifest.json'):
+        shutil.copyfile(snapshot_path + '_manifest.json', get_manifest_path(corpus_name))
+    print('Restoring snapshot took: {}'.format(time.time() - beg))
+    return True
+
+
+## Stage manifest
+## Each corpus directory holds a manifest recording the stages below that have completed,
+## together with a hash of their inputs, so that an interrupted run can resume.  Manifests
+## started when the corpus was imported are "tracked" and decide on their own whether a stage
+## must be run (this catches stages that stopped part way through); for corpora imported
+## before manifests existed, the checks on the database are used instead.
+manifest_lock = threading.Lock()
+
+
+def get_manifest_path(corpus_name):
+    return os.path.join(base_dir, corpus_name, '{}_manifest.json'.format(corpus_name))
+
+
+def load_manifest(corpus_name):
+    path = get_manifest_path(corpus_name)
+    if not os.path.exists(path):
+        return {'corpus': corpus_name, 'tracked': False, 'stages': {}, 'discourses': {}}
+    with open(path, 'r', encoding='utf8') as f:
+        return json.load(f)
+
+
+def save_manifest(corpus_name, manifest):
+    path = get_manifest_path(corpus_name)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
 
-def loading(config, corpus_dir, textgrid_format):
-    """Load the corpus"""
+
+def remove_manifest(corpus_name):
+    path = get_manifest_path(corpus_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def file_fingerprint(path):
+    """Cheap stand-in for the contents of an input file: its path, size and modification time"""
+
+    if not os.path.exists(path):
+        return [path, None, None]
+    stat = os.stat(path)
+    return [path, stat.st_size, int(stat.st_mtime)]
+
+
+def hash_inputs(inputs):
+    data = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf8')).hexdigest()
+
+
+def stage_done(config, stage, inputs=None, in_database=False):
+    """Check whether a stage has completed with the same inputs"""
+
+    manifest = load_manifest(config.corpus_name)
+    if not manifest['tracked']:
+        return in_database
+    record = manifest['stages'].get(stage)
+    return record is not None and record['inputs'] == hash_inputs(inputs)
+
+
+def record_stage(config, stage, inputs=None, time_taken=None):
+    with manifest_lock:
+        manifest = load_manifest(config.corpus_name)
+        manifest['stages'][stage] = {'inputs': hash_inputs(inputs), 'date': date, 'time': time_taken}
+        manifest['discourses'].pop(stage, None)
+        save_manifest(config.corpus_name, manifest)
+
+
+def completed_discourses(config, stage, inputs=None):
+    """Get the discourses already processed by an interrupted per-discourse stage"""
+
+    record = load_manifest(config.corpus_name)['discourses'].get(stage)
+    if record is None or record['inputs'] != hash_inputs(inputs):
+        return set()
+    return set(record['completed'])
+
+
+def record_discourse(config, stage, discourse, inputs=None):
+    with manifest_lock:
+        manifest = load_manifest(config.corpus_name)
+        record = manifest['discourses'].get(stage)
+        if record is None or record['inputs'] != hash_inputs(inputs):
+            record = {'inputs': hash_inputs(inputs), 'completed': []}
+            manifest['discourses'][stage] = record
+        record['completed'].append(discourse)
+        save_manifest(config.corpus_name, manifest)
+
+
+def loading(config, corpus_dir, textgrid_format, workers=None, incremental=False, bulk=False):
+    """Load the corpus, parsing discourses in `workers` processes (default: all available cores).
+    With `incremental`, an existing corpus gets only the discourses that are new or whose files changed.
+    With `bulk`, a new corpus is written with the database's offline importer (see bulk_import.py)."""
 
     ## first check if a database for the corpus
     ## has already been created
+    inputs = [corpus_dir, textgrid_format]
     with CorpusContext(config) as c:
         exists = c.exists()
-    if exists:
-        print('Corpus already loaded, skipping import.')
-        return
+        if exists and stage_done(config, 'import', inputs, in_database=True):
+            if incremental:
+                incremental_load(c, get_parser(corpus_dir, textgrid_format), corpus_dir, workers)
+            else:
+                print('Corpus already loaded, skipping import.')
+            return
+        elif exists and 'import' in load_manifest(config.corpus_name)['stages']:
+            ## never throw away a finished import without being asked to
+            print('The corpus {} was imported from other inputs than {} ({} format); rerun with -r to reset '
+                  'it and import again.'.format(config.corpus_name, corpus_dir, textgrid_format))
+            sys.exit(1)
+        elif exists:
+            ## a previous import stopped part way through
+            print('Corpus import was incomplete, resetting.')
+            c.reset()
     if not os.path.exists(corpus_dir):
         print('The path {} does not exist.'.format(corpus_dir))
         sys.exit(1)
 
     ## if there is no database file,
-    ## begin with importing the corpus
+    ## begin with importing the corpus and a fresh manifest
+    remove_manifest(config.corpus_name)
+    with manifest_lock:
+        manifest = load_manifest(config.corpus_name)
+        manifest['tracked'] = True
+        save_manifest(config.corpus_name, manifest)
+    print('loading')
+    parser = get_parser(corpus_dir, textgrid_format)
+    parser.call_back = call_back
+    beg = time.time()
+    if workers is None:
+        workers = available_cores()
+    if bulk and not bulk_import.supports(parser):
+        print('The corpus has subannotations, which bulk import does not write; importing it normally instead.')
+        bulk = False
+    if bulk:
+        bulk_load(config, parser, corpus_dir, workers)
+    else:
+        with CorpusContext(config) as c:
+            parallel_load(c, parser, corpus_dir, workers)
+    end = time.time()
+    time_taken = end - beg
+    print('Loading took: {}'.format(time_taken))
+    save_performance_benchmark(config, 'import', time_taken)
+    record_stage(config, 'import', inputs, time_taken)
+    with manifest_lock:
+        manifest = load_manifest(config.corpus_name)
+        manifest['discourse_files'] = discourse_fingerprints(parser, corpus_dir)
+        save_manifest(config.corpus_name, manifest)
+
+
+def get_parser(corpus_dir, textgrid_format):
+    """Use the appropriate importer based on the format of the corpus"""
+
     textgrid_format = textgrid_format.upper()
+    if textgrid_format in ["BUCKEYE", "B"]:
+        parser = pgio.inspect_buckeye(corpus_dir)
+    elif textgrid_format == "CSV":
+        parser = pgio.inspect_buckeye(corpus_dir)
+    elif textgrid_format.lower() in ["FAVE", "F"]:
+        parser = pgio.inspect_fave(corpus_dir)
+    elif textgrid_format == "ILG":
+        parser = pgio.inspect_ilg(corpus_dir)
+    elif textgrid_format in ["LABBCAT", "L"]:
+        parser = pgio.inspect_labbcat(corpus_dir)
+    elif textgrid_format in ["P", "PARTITUR"]:
+        parser = pgio.inspect_partitur(corpus_dir)
+    elif textgrid_format in ["MAUS", "W"]:
+        parser = pgio.inspect_maus(corpus_dir)
+    elif textgrid_format in ["TIMIT", "T"]:
+        parser = pgio.inspect_timit(corpus_dir)
+    elif textgrid_format in ["W", "maus"]:
+        parser = pgio.inspect_maus(corpus_dir)
+    else:
+        parser = pgio.inspect_mfa(corpus_dir)
+    ## the settings that key the parse cache are taken now, as parsing a file can change the
+    ## tiers of some parsers
+    parser.cache_settings = parser_settings(parser)
+    return parser
+
+
+def available_cores():
+    """Number of cores this process may run on (respecting any pinning by run_all_corpora.py)"""
+
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def ordered_map(executor, function, items, ahead):
+    """Like executor.map, but keeps at most `ahead` results in flight so that
+    results are streamed to the consumer without holding all of them in memory"""
+
+    pending = []
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= ahead:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def stem_fingerprints(path):
+    """Fingerprint all files of a discourse: those sharing the name of its transcript (e.g. the
+    .words and .phones files of Buckeye, or the .wrd and .phn files of TIMIT, and the audio)"""
+
+    stem = os.path.splitext(path)[0]
+    return [file_fingerprint(f) for f in sorted(glob.glob(glob.escape(stem) + '.*'))]
+
+
+def parser_settings(parser):
+    """The settings of a parser that decide its parses, as plain values: its attributes, with
+    annotation tiers reduced to their definitions"""
+
+    def plain(value):
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return [plain(x) for x in value]
+        if isinstance(value, (set, frozenset)):
+            return sorted((plain(x) for x in value), key=str)
+        if isinstance(value, dict):
+            return {str(k): plain(v) for k, v in value.items()}
+        if callable(value):
+            return getattr(value, '__name__', type(value).__name__)
+        if hasattr(value, '__dict__'):
+            ## (skipping any annotations a tier holds from a previous parse)
+            return [type(value).__name__, {k: plain(v) for k, v in vars(value).items() if not k.startswith('_')
+                                           and k != 'speaker'}]
+        return str(value)
+
+    return {k: plain(v) for k, v in vars(parser).items() if k not in ('call_back', 'stop_check')}
+
+
+def parse_cache_path(parser, corpus_name, path, kind):
+    """Cache file for the parse of `path`, keyed by the parser and its settings, and the size and
+    modification time of every file of the discourse"""
+
+    settings = getattr(parser, 'cache_settings', None)
+    if settings is None:
+        settings = parser_settings(parser)
+    key = hash_inputs([type(parser).__name__, settings, corpus_name, stem_fingerprints(path)])
+    return os.path.join(parse_cache_dir, corpus_name, '{}.{}.pickle'.format(key, kind))
+
+
+def cached_parse(path, function):
+    """Load a parse from the cache, or run `function` and cache its result"""
+
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            print('Could not read parse cache {}, parsing again.'.format(path))
+    data = function()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    return data
+
+
+def parse_information(parser, corpus_name, path):
+    return cached_parse(parse_cache_path(parser, corpus_name, path, 'information'),
+                        partial(parser.parse_information, path, corpus_name))
+
+
+def parse_discourse(parser, corpus_name, path):
+    return cached_parse(parse_cache_path(parser, corpus_name, path, 'discourse'),
+                        partial(parser.parse_discourse, path))
+
+
+def prune_parse_cache(parser, corpus_name, paths):
+    """Remove cached parses of files that are no longer in the corpus or have changed since"""
+
+    corpus_cache_dir = os.path.join(parse_cache_dir, corpus_name)
+    if not os.path.isdir(corpus_cache_dir):
+        return
+    keep = set()
+    for path in paths:
+        for kind in ['information', 'discourse']:
+            keep.add(os.path.basename(parse_cache_path(parser, corpus_name, path, kind)))
+    for filename in os.listdir(corpus_cache_dir):
+        if filename not in keep:
+            os.remove(os.path.join(corpus_cache_dir, filename))
+
+
+def find_discourse_files(parser, corpus_dir):
+    """Get the paths of the files in a corpus directory that the parser can read"""
+
+    paths = []
+    for root, subdirs, files in os.walk(corpus_dir, followlinks=True):
+        for filename in files:
+            if parser.match_extension(filename):
+                paths.append(os.path.join(root, filename))
+    if not paths:
+        raise ParseError('No files in the specified directory matched the parser. '
+                         'Please check to make sure you have the correct parser.')
+    return sorted(paths)
+
+
+def parallel_load(c, parser, corpus_dir, workers, paths=None):
+    """Import a corpus directory (or the given files in it) as CorpusContext.load does, but with
+    discourses parsed in a pool of processes and streamed to the database as they are parsed.
+    Parses are cached in parse_cache_dir, so re-importing unchanged files skips parsing."""
+
+    call_back = parser.call_back
+    ## the parser is sent to the worker processes, so must not hold the call back
+    parser.call_back = None
+    if paths is None:
+        paths = find_discourse_files(parser, corpus_dir)
+        prune_parse_cache(parser, c.corpus_name, paths)
+    print('Parsing {} files with {} processes'.format(len(paths), workers))
+
+    ## first pass: collect the speakers, types and headers of all discourses
+    types = {}
+    type_headers = None
+    token_headers = None
+    speakers = set()
+    could_not_parse = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_information, parser, c.corpus_name, path) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                information = future.result()
+            except ParseError:
+                could_not_parse.append(path)
+                continue
+            speakers.update(information['speakers'])
+            type_headers = information['type_headers']
+            token_headers = information['token_headers']
+            for k, v in information['types'].items():
+                types.setdefault(k, set()).update(v)
+        c.initialize_import(speakers, token_headers, parser.hierarchy.subannotations)
+        c.add_types(types, type_headers)
+
+        ## second pass: parse each discourse and write it as soon as it is ready
+        ## (a file can still fail here, e.g. if it changed since the first pass)
+        paths = [x for x in paths if x not in could_not_parse]
+        parsed = ordered_map(executor, partial(try_parse_discourse, parser, c.corpus_name), paths, workers * 2)
+        for i, (path, data) in enumerate(zip(paths, parsed)):
+            if data is None:
+                could_not_parse.append(path)
+                continue
+            if call_back is not None:
+                call_back('Importing discourse {} of {}...'.format(i + 1, len(paths)))
+            c.add_discourse(data)
+    c.finalize_import(speakers, token_headers, parser.hierarchy, call_back, parser.stop_check)
+    parser.call_back = call_back
+    if could_not_parse:
+        print('Could not parse: {}'.format(', '.join(could_not_parse)))
+    return could_not_parse
+
+
+def try_parse_discourse(parser, corpus_name, path):
+    try:
+        return parse_discourse(parser, corpus_name, path)
+    except ParseError:
+        return None
+
+
+def bulk_load(config, parser, corpus_dir, workers):
+    """Import a corpus directory by writing import files for the graph database's offline importer,
+    which rebuilds the (stopped) local database from them, rather than through transactions."""
+
+    paths = find_discourse_files(parser, corpus_dir)
+    prune_parse_cache(parser, config.corpus_name, paths)
+    import_dir = config.temporary_directory('bulk_import')
+    writer = bulk_import.ImportFileWriter(import_dir, config.corpus_name, parser.hierarchy)
+    print('Writing import files for {} files with {} processes'.format(len(paths), workers))
+    could_not_parse = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = ordered_map(executor, partial(try_parse_discourse, parser, config.corpus_name), paths, workers * 2)
+        for i, (path, data) in enumerate(zip(paths, results)):
+            if data is None:
+                could_not_parse.append(path)
+                continue
+            if parser.call_back is not None:
+                parser.call_back('Writing discourse {} of {}...'.format(i + 1, len(paths)))
+            writer.add_discourse(data)
+    arguments = writer.finish()
+
+    ## the importer writes the database files directly, so the server must be local and stopped
+    client = PGDBClient('http://{}:{}'.format(config.host, server_port), token=load_token())
+    neo4j_dir = os.path.join(client.get_directory(config.corpus_name), 'neo4j')
+    client.stop_database(config.corpus_name)
+    bulk_import.run_import(neo4j_dir, arguments)
+    client.start_database(config.corpus_name)
     with CorpusContext(config) as c:
-        print('loading')
-
-        ## Use the appropriate importer based
-        ## on the format of the corpus
-        if textgrid_format in ["BUCKEYE", "B"]:
-            parser = pgio.inspect_buckeye(corpus_dir)
-        elif textgrid_format == "CSV":
-            parser = pgio.inspect_buckeye(corpus_dir)
-        elif textgrid_format.lower() in ["FAVE", "F"]:
-            parser = pgio.inspect_fave(corpus_dir)
-        elif textgrid_format == "ILG":
-            parser = pgio.inspect_ilg(corpus_dir)
-        elif textgrid_format in ["LABBCAT", "L"]:
-            parser = pgio.inspect_labbcat(corpus_dir)
-        elif textgrid_format in ["P", "PARTITUR"]:
-            parser = pgio.inspect_partitur(corpus_dir)
-        elif textgrid_format in ["MAUS", "W"]:
-            parser = pgio.inspect_maus(corpus_dir)
-        elif textgrid_format in ["TIMIT", "T"]:
-            parser = pgio.inspect_timit(corpus_dir)
-        elif textgrid_format in ["W", "maus"]:
-            parser = pgio.inspect_maus(corpus_dir)
-        else:
-            parser = pgio.inspect_mfa(corpus_dir)
-        parser.call_back = call_back
+        bulk_import.finish_import(c, writer)
+    shutil.rmtree(import_dir)
+    if could_not_parse:
+        print('Could not parse: {}'.format(', '.join(could_not_parse)))
+    return could_not_parse
+
+
+def discourse_fingerprints(parser, corpus_dir):
+    """Fingerprint the transcript and audio files (all files sharing the transcript's name) of each discourse"""
+
+    fingerprints = {}
+    for path in find_discourse_files(parser, corpus_dir):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        fingerprints[stem] = {'path': path, 'hash': hash_inputs(stem_fingerprints(path))}
+    return fingerprints
+
+
+def incremental_load(c, parser, corpus_dir, workers=None):
+    """Import discourses that are new to the corpus and replace those whose files have changed,
+    marking them for enrichment (see basic_enrichment)."""
+
+    fingerprints = discourse_fingerprints(parser, corpus_dir)
+    manifest = load_manifest(c.corpus_name)
+    ## corpora imported before fingerprints were kept have theirs recorded now
+    recorded = manifest.get('discourse_files', {})
+    existing = set(c.discourses)
+    new = [d for d in fingerprints if d not in existing]
+    changed = [d for d in fingerprints if d in existing and d in recorded
+               and recorded[d]['hash'] != fingerprints[d]['hash']]
+    if not new and not changed:
+        print('No new or changed discourses, skipping import.')
+    else:
+        print('Importing {} new and {} changed discourses'.format(len(new), len(changed)))
         beg = time.time()
-        c.load(parser, corpus_dir)
-        end = time.time()
-        time_taken = end - beg
-        print('Loading took: {}'.format(time_taken))
-    save_performance_benchmark(config, 'import', time_taken)
+        for d in changed:
+            c.remove_discourse(d)
+        ## importing resets the hierarchy to that of the parser, so keep the enriched one
+        hierarchy = c.hierarchy
+        parallel_load(c, parser, corpus_dir, workers or available_cores(),
+                      paths=[fingerprints[d]['path'] for d in new + changed])
+        c.hierarchy = hierarchy
+        c.encode_hierarchy()
+        time_taken = time.time() - beg
+        print('Incremental import took: {}'.format(time_taken))
+        save_performance_benchmark(c.config, 'incremental_import', time_taken)
+
+    affected = new + changed
+    with manifest_lock:
+        manifest = load_manifest(c.corpus_name)
+        manifest['discourse_files'] = fingerprints
+        if affected:
+            manifest['pending_enrichment'] = sorted(set(manifest.get('pending_enrichment', []) + affected))
+            ## type- and speaker-level enrichment is cheap to redo for the new words and speakers
+            for stage in list(manifest['stages']):
+                if stage.startswith('lexicon_enrichment') or stage == 'speaker_enrichment':
+                    del manifest['stages'][stage]
+            ## acoustic analyses that go by discourse continue with just the affected discourses;
+            ## others (such as formant refinement, which is by speaker) are redone
+            if 'sibilant_acoustic_analysis' in manifest['stages']:
+                record = manifest['stages'].pop('sibilant_acoustic_analysis')
+                manifest['discourses']['sibilant_acoustic_analysis'] = {
+                    'inputs': record['inputs'], 'completed': sorted(existing - set(changed))}
+            elif 'sibilant_acoustic_analysis' in manifest['discourses']:
+                record = manifest['discourses']['sibilant_acoustic_analysis']
+                record['completed'] = [d for d in record['completed'] if d not in changed]
+            for stage in list(manifest['stages']):
+                if stage.startswith('formant_acoustic_analysis'):
+                    del manifest['stages'][stage]
+        save_manifest(c.corpus_name, manifest)
+    if affected and not manifest['tracked']:
+        print('Warning: this corpus was imported without a stage manifest, so acoustic analyses will not '
+              'be rerun for the new discourses.')
+
+
+def prepare_corpus(config, corpus_conf, enrich=True):
+    """Import the corpus if needed and perform the lexical, speaker and basic linguistic enrichment
+    shared by all analysis scripts (only the import, if not `enrich`)."""
+
+    loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'],
+            incremental=corpus_conf.get('incremental_import', False), bulk=corpus_conf.get('bulk_import', False))
+    if not enrich:
+        return
+    lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
+    speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
+    basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'],
+                     workers=corpus_conf.get('enrichment_workers', 1),
+                     engine=corpus_conf.get('enrichment_engine', 'database'))
+
+
+def run_by_discourse(config, function, workers):
+    """Run function(c, discourse) for every discourse of the corpus in `workers` threads, sharing a pool
+    of `workers` database connections"""
+
+    with CorpusContext(config) as c:
+        discourses = sorted(c.discourses)
+    contexts = queue.Queue()
+    with ExitStack() as stack:
+        for i in range(min(workers, len(discourses))):
+            contexts.put(stack.enter_context(CorpusContext(config)))
+
+        def job(discourse):
+            c = contexts.get()
+            try:
+                function(c, discourse)
+            finally:
+                contexts.put(c)
 
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i, _ in enumerate(executor.map(job, discourses)):
+                if (i + 1) % 100 == 0 or i + 1 == len(discourses):
+                    call_back('Enriched discourse {} of {}...'.format(i + 1, len(discourses)))
 
-def basic_enrichment(config, syllabics, pauses):
-    """Enrich the corpus database with syllable and utterance information."""
+
+def get_stress_source(g, syllabics):
+    """Where syllable stress comes from: the words' stress patterns, digits on the vowel labels, or nowhere"""
+
+    if syllabics and g.hierarchy.has_type_property('word', 'stresspattern'):
+        return 'stresspattern'
+    elif syllabics and re.search(r"\d", syllabics[0]):
+        return 'vowel_labels'
+    return None
+
+
+def basic_enrichment(config, syllabics, pauses, workers=1, engine='database'):
+    """Enrich the corpus database with syllable and utterance information.
+    With more than one worker, discourses are encoded in parallel (see discourse_enrichment.py).
+    With the 'client' engine, syllables, stress and counts are worked out in Python from one read of
+    each discourse rather than by the database's encoders."""
 
     with CorpusContext(config) as g:
-        if not 'utterance' in g.annotation_types:
+        stress_source = get_stress_source(g, syllabics)
+        pending = load_manifest(config.corpus_name).get('pending_enrichment', [])
+        if pending and 'utterance' in g.annotation_types:
+            ## discourses added by an incremental import are enriched on their own
+            print('enriching {} new discourses'.format(len(pending)))
+            begin = time.time()
+            if syllabics:
+                g.encode_syllabic_segments(syllabics)
+            discourse_enrichment.enrich_discourses(g, pending, syllabics if 'syllable' in g.annotation_types else [],
+                                                   pauses, min_pause_length=0.15, stress_source=stress_source)
+            time_taken = time.time() - begin
+            print('Discourse enrichment took: {}'.format(time_taken))
+            save_performance_benchmark(config, 'discourse_enrichment', time_taken)
+        if pending:
+            with manifest_lock:
+                manifest = load_manifest(config.corpus_name)
+                manifest.pop('pending_enrichment', None)
+                save_manifest(config.corpus_name, manifest)
+
+        if not stage_done(config, 'utterance_encoding', pauses, 'utterance' in g.annotation_types):
+            if 'utterance' in g.annotation_types:
+                ## a previous encoding stopped part way through, or used other pauses
+                g.reset_utterances()
             ## encode utterances based on presence of an intervening pause
             ## default 150ms
             print('encoding utterances')
             begin = time.time()
-            g.encode_pauses(pauses)
-            g.encode_utterances(min_pause_length=0.15)
+            if workers > 1:
+                discourse_enrichment.prepare_utterance_encoding(g)
+                run_by_discourse(config, partial(discourse_enrichment.encode_utterance_stage, pauses=pauses,
+                                                 min_pause_length=0.15, speakers=g.speakers), workers)
+                discourse_enrichment.finish_utterance_encoding(g, pauses)
+            else:
+                g.encode_pauses(pauses)
+                g.encode_utterances(min_pause_length=0.15)
             time_taken = time.time() - begin
             print('Utterance enrichment took: {}'.format(time_taken))
             save_performance_benchmark(config, 'utterance_encoding', time_taken)
-
-        if syllabics and 'syllable' not in g.annotation_types:
+            record_stage(config, 'utterance_encoding', pauses, time_taken)
+
+        ## properties set by the count encoding (or along with syllables by the client engine)
+        count_inputs = [syllabics, pauses]
+        count_properties = [('utterance', 'num_words', int)]
+        if syllabics:
+            count_properties += [('utterance', 'num_syllables', int), ('utterance', 'speech_rate', float),
+                                 ('word', 'num_syllables', int), ('syllable', 'position_in_word', int),
+                                 ('syllable', 'num_phones', int)]
+
+        if syllabics and not stage_done(config, 'syllable_encoding', syllabics, 'syllable' in g.annotation_types):
+            if 'syllable' in g.annotation_types:
+                g.reset_syllables()
             ## encode syllabic information using maxmimum-onset principle
             print('encoding syllables')
             begin = time.time()
             g.encode_syllabic_segments(syllabics)
-            g.encode_syllables('maxonset')
+            if engine == 'client':
+                onsets = discourse_enrichment.find_onsets(g, syllabics)
+                discourse_enrichment.prepare_syllable_encoding(g)
+                run_by_discourse(config, partial(discourse_enrichment.encode_syllables_and_counts,
+                                                 syllabics=syllabics, onsets=onsets,
+                                                 stress_source=stress_source), workers)
+                discourse_enrichment.finish_syllable_encoding(g)
+            elif workers > 1:
+                onsets = discourse_enrichment.find_onsets(g, syllabics)
+                discourse_enrichment.prepare_syllable_encoding(g)
+                run_by_discourse(config, partial(discourse_enrichment.encode_syllable_stage, syllabics=syllabics,
+                                                 onsets=onsets), workers)
+                discourse_enrichment.finish_syllable_encoding(g)
+            else:
+                g.encode_syllables('maxonset')
             time_taken = time.time() - begin
             print('Syllable enrichment took: {}'.format(time.time() - begin))
             save_performance_benchmark(config, 'syllable_encoding', time_taken)
-
-        print('enriching utterances')
-        if syllabics and not g.hierarchy.has_token_property('utterance', 'speech_rate'):
-            begin = time.time()
-            g.encode_rate('utterance', 'syllable', 'speech_rate')
-            time_taken = time.time() - begin
-            print('Speech rate encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'speech_rate_encoding', time_taken)
-
-        if not g.hierarchy.has_token_property('utterance', 'num_words'):
-            begin = time.time()
-            g.encode_count('utterance', 'word', 'num_words')
-            time_taken = time.time() - begin
-            print('Word count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_words_encoding', time_taken)
-
-        if syllabics and not g.hierarchy.has_token_property('utterance', 'num_syllables'):
-            begin = time.time()
-            g.encode_count('utterance', 'syllable', 'num_syllables')
-            time_taken = time.time() - begin
-            print('Syllable count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_syllables_encoding', time_taken)
-
-        if syllabics and not g.hierarchy.has_token_property('syllable', 'position_in_word'):
-            print('enriching syllables')
-            begin = time.time()
-            g.encode_position('word', 'syllable', 'position_in_word')
-            time_taken = time.time() - begin
-            print('Syllable position encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'position_in_word_encoding', time_taken)
-
-        if syllabics and not g.hierarchy.has_token_property('syllable', 'num_phones'):
+            record_stage(config, 'syllable_encoding', syllabics, time_taken)
+            if engine == 'client':
+                ## the counts and stress were set along with the syllables
+                for annotation_type, name, property_type in count_properties:
+                    g.hierarchy.add_token_properties(g, annotation_type, [(name, property_type)])
+                if stress_source == 'stresspattern':
+                    g.hierarchy.add_token_properties(g, 'syllable', [('stress', str)])
+                elif stress_source == 'vowel_labels':
+                    ## as encode_stress_to_syllables, stress from vowel labels is set on syllable types
+                    g.hierarchy.add_type_properties(g, 'syllable', [('stress', str)])
+                if stress_source is not None:
+                    record_stage(config, 'stress_encoding', [syllabics, stress_source], 0)
+                g.encode_hierarchy()
+                record_stage(config, 'count_encoding', count_inputs, 0)
+
+        ## speech rate, word and syllable counts, syllable positions and phone counts are computed
+        ## together, one discourse at a time; they overwrite any earlier values, so are simply
+        ## rerun if they did not finish
+        if not stage_done(config, 'count_encoding', count_inputs,
+                          all(g.hierarchy.has_token_property(a, p) for a, p, t in count_properties)):
+            print('enriching utterances, words and syllables')
             begin = time.time()
-            g.encode_count('syllable', 'phone', 'num_phones')
+            run_by_discourse(config, partial(discourse_enrichment.encode_discourse_features,
+                                             syllables=bool(syllabics)), workers)
+            for annotation_type, name, property_type in count_properties:
+                g.hierarchy.add_token_properties(g, annotation_type, [(name, property_type)])
+            g.encode_hierarchy()
             time_taken = time.time() - begin
-            print('Phone count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_phones_encoding', time_taken)
-
-        if syllabics and not g.hierarchy.has_token_property('word', 'num_syllables'):
-            begin = time.time()
-            g.encode_count('word', 'syllable', 'num_syllables')
-            time_taken = time.time() - begin
-            print('Syllable count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_syllables_encoding', time_taken)
+            print('Count encoding took: {}'.format(time_taken))
+            save_performance_benchmark(config, 'count_encoding', time_taken)
+            record_stage(config, 'count_encoding', count_inputs, time_taken)
 
         print('enriching syllables')
         ## generate the word-level stress pattern, either from an external pronunciation dictionary
         ## or by the presence of numeric values on the vowel phones
-        if syllabics and g.hierarchy.has_type_property('word', 'stresspattern') and not g.hierarchy.has_token_property(
-                'syllable',
-                'stress'):
+        if syllabics and g.hierarchy.has_type_property('word', 'stresspattern') and not stage_done(
+                config, 'stress_encoding', [syllabics, 'stresspattern'],
+                g.hierarchy.has_token_property('syllable', 'stress')):
             begin = time.time()
             g.encode_stress_from_word_property('stresspattern')
             time_taken = time.time() - begin
             print("encoded stress")
             save_performance_benchmark(config, 'stress_encoding_from_pattern', time_taken)
-        elif syllabics and re.search(r"\d", syllabics[0]) and not g.hierarchy.has_type_property('syllable',
-                                                                                                'stress'):  # If stress is included in the vowels
+            record_stage(config, 'stress_encoding', [syllabics, 'stresspattern'], time_taken)
+        elif syllabics and re.search(r"\d", syllabics[0]) and not stage_done(
+                config, 'stress_encoding', [syllabics, 'vowel_labels'],
+                g.hierarchy.has_type_property('syllable', 'stress')):  # If stress is included in the vowels
             begin = time.time()
             g.encode_stress_to_syllables("[0-9]", clean_phone_label=False)
             time_taken = time.time() - begin
             print("encoded stress")
             save_performance_benchmark(config, 'stress_encoding', time_taken)
+            record_stage(config, 'stress_encoding', [syllabics, 'vowel_labels'], time_taken)
+
+
+def corpus_lexicon(g):
+    """Get the (lower case) labels of all word types in the corpus"""
+
+    statement = '''MATCH (wt:word_type:{corpus})
+    RETURN DISTINCT wt.label AS label'''.format(corpus=g.cypher_safe_name)
+    return {r['label'].lower() for r in g.execute_cypher(statement) if r['label'] is not None}
+
+
+def get_lexicon_store(path):
+    """Path of the compiled store of an enrichment CSV, compiling it if the CSV is new or has changed"""
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    store_path = os.path.join(lexicon_cache_dir, '{}_{}.lex'.format(name, hash_inputs(file_fingerprint(path))))
+    if not os.path.exists(store_path):
+        print('Compiling {}'.format(path))
+        os.makedirs(lexicon_cache_dir, exist_ok=True)
+        lexicon_store.compile_lexicon(path, store_path)
+        ## stores compiled from earlier versions of the file
+        for f in glob.glob(os.path.join(glob.escape(lexicon_cache_dir), '{}_*.lex'.format(glob.escape(name)))):
+            if f != store_path:
+                os.remove(f)
+    return store_path
+
+
+def write_lexicon_subset(path, lexicon, output_path):
+    """Write the header and the rows for words in `lexicon` of an enrichment CSV, looked up in its
+    compiled store.  Returns the number of rows written."""
+
+    kept = 0
+    with lexicon_store.LexiconStore(get_lexicon_store(path)) as store, \
+            open(output_path, 'w', encoding='utf8', newline='') as out:
+        out.write(store.header)
+        for word in sorted(lexicon):
+            line = store.get(word)
+            if line is not None:
+                out.write(line)
+                kept += 1
+    return kept
 
 
 def lexicon_enrichment(config, unisyn_spade_directory, dialect_code):
@@ -268,25 +1049,37 @@ def lexicon_enrichment(config, unisyn_spade_directory, dialect_code):
             unisyn_spade_directory))
         return
     with CorpusContext(config) as g:
-
+        lexicon = None
         for lf in os.listdir(enrichment_dir):
             path = os.path.join(enrichment_dir, lf)
+            stage = 'lexicon_enrichment:{}'.format(lf)
             if lf == 'rule_applications.csv':
-                if g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel1'.lower()):
+                if stage_done(config, stage, file_fingerprint(path),
+                              g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel1'.lower())):
                     print('Dialect independent enrichment already loaded, skipping.')
                     continue
             elif lf.startswith(dialect_code):
-                if g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel2_{}'.format(
-                        dialect_code).lower()):
+                if stage_done(config, stage, file_fingerprint(path),
+                              g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel2_{}'.format(
+                                  dialect_code).lower())):
                     print('Dialect specific enrichment already loaded, skipping.')
                     continue
             else:
                 continue
             begin = time.time()
-            enrich_lexicon_from_csv(g, path)
+            ## the enrichment files cover all of UNISYN, so only the words in the corpus are loaded
+            if lexicon is None:
+                lexicon = corpus_lexicon(g)
+            filtered_path = os.path.join(g.config.temporary_directory('lexicon'), lf)
+            kept = write_lexicon_subset(path, lexicon, filtered_path)
+            print('Loading {} of the corpus\'s {} word types from {}'.format(kept, len(lexicon), lf))
+            if kept:
+                enrich_lexicon_from_csv(g, filtered_path)
+            os.remove(filtered_path)
             time_taken = time.time() - begin
             print('Lexicon enrichment took: {}'.format(time.time() - begin))
             save_performance_benchmark(config, 'lexicon_enrichment', time_taken)
+            record_stage(config, stage, file_fingerprint(path), time_taken)
 
 
 def speaker_enrichment(config, speaker_file):
@@ -296,21 +1089,100 @@ def speaker_enrichment(config, speaker_file):
         print('Could not find {}, skipping speaker enrichment.'.format(speaker_file))
         return
     with CorpusContext(config) as g:
-        if not g.hierarchy.has_speaker_property('gender'):
+        if not stage_done(config, 'speaker_enrichment', file_fingerprint(speaker_file),
+                          g.hierarchy.has_speaker_property('gender')):
             begin = time.time()
             enrich_speakers_from_csv(g, speaker_file)
             time_taken = time.time() - begin
             print('Speaker enrichment took: {}'.format(time.time() - begin))
             save_performance_benchmark(config, 'speaker_enrichment', time_taken)
+            record_stage(config, 'speaker_enrichment', file_fingerprint(speaker_file), time_taken)
         else:
             print('Speaker enrichment already done, skipping.')
 
 
-def sibilant_acoustic_analysis(config, sibilant_segments, ignored_speakers=None):
-    """Encode sibilant class and analyze sibilants using the praat script."""
+def save_phone_measures(c, output, measures, property_types=None):
+    """Write point measures of phones back to the database, many tokens per statement."""
+
+    if property_types is None:
+        property_types = {m: float for m in measures}
+    c.hierarchy.add_token_properties(c, 'phone', [(m, property_types[m]) for m in measures])
+    c.encode_hierarchy()
+    data = [{'id': seg['id'], 'measures': {m: values.get(m) for m in measures}}
+            for seg, values in output.items() if values]
+    statement = '''WITH $data as data
+    UNWIND data as d
+    MATCH (n:phone:{corpus_name}) WHERE n.id = d.id
+    SET n += d.measures'''.format(corpus_name=c.cypher_safe_name)
+    for i in range(0, len(data), write_batch_size):
+        c.execute_cypher(statement, data=data[i:i + write_batch_size])
+
+
+def praat_number(value):
+    return None if value == '--undefined--' else float(value)
+
+
+def praat_batch_sibilants(praat_path, sound_path, segments):
+    """Measure the given segments of one sound file with a single run of the batch Praat script"""
+
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        f.write('begin\tend\tchannel\n')
+        for seg in segments:
+            f.write('{!r}\t{!r}\t{}\n'.format(seg.begin, seg.end, seg.channel))
+    try:
+        result = subprocess.run([praat_path, '--run', sibilant_batch_script_path, sound_path, f.name],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    finally:
+        os.remove(f.name)
+    lines = result.stdout.strip().splitlines()
+    measures = lines[0].split()[1:]
+    output = {}
+    for line in lines[1:]:
+        values = line.split()
+        output[segments[int(values[0]) - 1]] = {m: praat_number(v) for m, v in zip(measures, values[1:])}
+    return output
+
+
+def subset_mapping(segment_mapping, segments):
+    """A segment mapping holding only the given segments"""
 
+    subset = copy.copy(segment_mapping)
+    subset.segments = segments
+    return subset
+
+
+def measure_uncached(measure, segment_mapping):
+    if not segment_mapping.segments:
+        return {}
+    return measure(segment_mapping)
+
+
+def analyze_sibilants_praat(segment_mapping, praat_function, multiprocessing=True):
+    return analyze_segments(segment_mapping, praat_function, multiprocessing=multiprocessing)
+
+
+def analyze_sibilants_praat_batch(segment_mapping, praat_path):
+    """Measure a mapping of segments with one Praat run per sound file"""
+
+    by_file = {}
+    for seg in segment_mapping:
+        by_file.setdefault(seg.file_path, []).append(seg)
+    output = {}
+    for path, segments in sorted(by_file.items()):
+        output.update(praat_batch_sibilants(praat_path, path, segments))
+    return output
+
+
+def sibilant_acoustic_analysis(config, sibilant_segments, ignored_speakers=None, engine='praat', workers=None):
+    """Encode sibilant class and analyze sibilants using the praat script, or with the equivalent
+    NumPy measures (engine='numpy', see sibilant_measures.py), or with one Praat run per sound file
+    of the batch script (engine='praat_batch').  Discourses are spread over a pool of `workers`
+    processes; without `workers`, the NumPy and batch engines use all available cores and the
+    Praat script is run in parallel by conch as before."""
+
+    inputs = [sibilant_segments, ignored_speakers, file_fingerprint(sibilant_script_path)]
     with CorpusContext(config) as c:
-        if c.hierarchy.has_token_property('phone', 'cog'):
+        if stage_done(config, 'sibilant_acoustic_analysis', inputs, c.hierarchy.has_token_property('phone', 'cog')):
             print('Sibilant acoustics already analyzed, skipping.')
             return
         print('Beginning sibilant analysis')
@@ -330,20 +1202,211 @@ def sibilant_acoustic_analysis(config, sibilant_segments, ignored_speakers=None)
         save_performance_benchmark(config, 'sibilant_encoding', time_taken)
         print('sibilants encoded')
 
-        # analyze all sibilants using the Praat script (found at the path defined at the top of this script)
+        # analyze all sibilants using the Praat script (found at the path defined at the top of this script),
+        # one discourse at a time so that an interrupted analysis resumes from the discourses not yet measured
         beg = time.time()
-        c.analyze_script(annotation_type='phone', subset='sibilant', script_path=sibilant_script_path, duration_threshold=0.01)
+        done = completed_discourses(config, 'sibilant_acoustic_analysis', inputs)
+        if done:
+            print('Resuming sibilant analysis, {} discourses already measured'.format(len(done)))
+        segment_mapping = generate_segments(c, annotation_type='phone', subset='sibilant', file_type='consonant',
+                                            duration_threshold=0.01).grouped_mapping('discourse')
+        if workers is None and engine != 'praat':
+            workers = available_cores()
+        if engine == 'numpy':
+            measure = analyze_sibilants
+        elif engine == 'praat_batch':
+            measure = partial(analyze_sibilants_praat_batch, praat_path=c.config.praat_path)
+        else:
+            praat_function = PraatAnalysisFunction(sibilant_script_path, praat_path=c.config.praat_path)
+            ## with a pool of workers, each discourse's tokens are measured in its own worker
+            measure = partial(analyze_sibilants_praat, praat_function=praat_function,
+                              multiprocessing=workers is None)
+        ## discourses are measured by a pool of workers kept for the whole analysis, and saved in
+        ## order (many tokens per statement) as their measures come in; the NumPy engine computes
+        ## in the workers so needs processes, the others wait on Praat processes so use threads
+        ## tokens measured before (in an earlier import of the corpus) by the same engine and version of its
+        ## script are taken from the measurement cache
+        engine_paths = {'numpy': sibilant_numpy_path, 'praat_batch': sibilant_batch_script_path,
+                        'praat': sibilant_script_path}
+        cache = MeasureCache(acoustic_cache_path)
+        method = 'sibilant:{}:{}'.format(engine, content_hash(engine_paths[engine]))
+        to_measure = []
+        num_cached = 0
+        for (discourse,), discourse_mapping in segment_mapping.items():
+            if discourse in done:
+                continue
+            cached = cache.lookup(discourse_mapping, method)
+            num_cached += len(cached)
+            remaining = subset_mapping(discourse_mapping, [seg for seg in discourse_mapping if seg not in cached])
+            to_measure.append((discourse, cached, remaining))
+        workers = workers or 1
+        print('Measuring {} discourses with {} workers ({} tokens cached)'.format(len(to_measure), workers, num_cached))
+        pool = ProcessPoolExecutor if engine == 'numpy' else ThreadPoolExecutor
+        with pool(max_workers=workers) as executor:
+            outputs = ordered_map(executor, partial(measure_uncached, measure), [m for d, s, m in to_measure],
+                                  workers * 2)
+            for (discourse, cached, remaining), output in zip(to_measure, outputs):
+                cache.store(output, method)
+                output.update(cached)
+                save_phone_measures(c, output, sibilant_measures)
+                record_discourse(config, 'sibilant_acoustic_analysis', discourse, inputs)
+        cache.close()
         end = time.time()
         time_taken = time.time() - beg
         print('Sibilant analysis took: {}'.format(end - beg))
         save_performance_benchmark(config, 'sibilant_acoustic_analysis', time_taken)
+        record_stage(config, 'sibilant_acoustic_analysis', inputs, time_taken)
+
+
+def formant_segments(c, subset):
+    return generate_segments(c, annotation_type='phone', subset=subset, file_type='vowel',
+                             duration_threshold=duration_threshold)
+
+
+def formant_cache_method(cache, segments, inputs, vowel_prototypes_path):
+    prototypes = content_hash(vowel_prototypes_path) if os.path.exists(vowel_prototypes_path) else None
+    return 'formants:{}'.format(hash_inputs(inputs[:2] + inputs[3:] + [prototypes, cache.segment_set_hash(segments)]))
+
+
+def cache_formants(c, subset, inputs, vowel_prototypes_path, properties):
+    """Store the formant point measures just written to the database in the measurement cache"""
+
+    if not properties:
+        return
+    segments = formant_segments(c, subset)
+    statement = '''MATCH (n:phone:{corpus}) WHERE n.id IN $ids
+    RETURN n.id AS id, {values}'''.format(corpus=c.cypher_safe_name,
+                                           values=', '.join('n.`{0}` AS `{0}`'.format(p) for p, t in properties))
+    values = {}
+    ids = [seg['id'] for seg in segments]
+    for i in range(0, len(ids), write_batch_size):
+        for r in c.execute_cypher(statement, ids=ids[i:i + write_batch_size]):
+            values[r['id']] = {p: r[p] for p, t in properties}
+    with MeasureCache(acoustic_cache_path) as cache:
+        method = formant_cache_method(cache, segments, inputs, vowel_prototypes_path)
+        cache.store({seg: values.get(seg['id']) for seg in segments}, method)
+        cache.store_value(method, [[p, t.__name__] for p, t in properties])
+
+
+def load_cached_formants(c, subset, inputs, vowel_prototypes_path):
+    """Write cached formant point measures to the database if every vowel has them, returning whether it did"""
+
+    segments = formant_segments(c, subset)
+    with MeasureCache(acoustic_cache_path) as cache:
+        method = formant_cache_method(cache, segments, inputs, vowel_prototypes_path)
+        cached = cache.lookup(segments, method)
+        if not segments or len(cached) < len(segments):
+            return False
+        properties = cache.lookup_value(method)
+        if properties is None:
+            return False
+    types = {'float': float, 'int': int, 'str': str, 'bool': bool}
+    property_types = {p: types[t] for p, t in properties}
+    save_phone_measures(c, cached, [p for p, t in properties], property_types)
+    return True
+
+
+def speaker_groups(c, subset, workers, skip=None):
+    """Split the speakers of a subset (except those in `skip`) into at most `workers` groups with similar
+    numbers of vowels"""
+
+    q = c.query_graph(c.phone).filter(c.phone.subset == subset)
+    q = q.filter(c.phone.duration >= duration_threshold)
+    counts = {}
+    for r in q.columns(c.phone.speaker.name.column_name('speaker')).all():
+        if skip and r['speaker'] in skip:
+            continue
+        counts[r['speaker']] = counts.get(r['speaker'], 0) + 1
+    groups = [[] for _ in range(min(workers, len(counts)))]
+    loads = [0] * len(groups)
+    for speaker in sorted(counts, key=lambda x: counts[x], reverse=True):
+        i = loads.index(min(loads))
+        groups[i].append(speaker)
+        loads[i] += counts[speaker]
+    return groups
+
+
+def convergence_settings(convergence=None):
+    """The formant refinement convergence settings, with a corpus's overrides"""
+
+    settings = dict(formant_convergence)
+    unknown = set(convergence or {}) - set(settings)
+    if unknown:
+        raise ValueError('Unknown formant_convergence settings: {}'.format(', '.join(sorted(unknown))))
+    settings.update(convergence or {})
+    return settings
+
+
+def save_convergence_log(config, rows):
+    """Write the convergence statistics of each iteration of formant refinement, for tuning the
+    formant_convergence settings"""
+
+    path = os.path.join(base_dir, config.corpus_name, '{}_formant_convergence.csv'.format(config.corpus_name))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['speaker', 'vowel', 'tokens', 'iteration', 'share_changed', 'prototype_shift'])
+        for row in rows:
+            writer.writerow(['NA' if x is None else x for x in row])
+    iterations = {}
+    for speaker, vowel, tokens, iteration, share, shift in rows:
+        iterations[(speaker, vowel)] = iteration
+    if iterations:
+        print('Formant refinement took {:.1f} iterations on average (at most {}); statistics written to {}'.format(
+            sum(iterations.values()) / len(iterations), max(iterations.values()), path))
+
+
+def refine_speaker_group(config, kwargs, subset):
+    ## each group already has its own process, so its tokens are measured in that process rather than
+    ## by another pool of conch workers
+    kwargs = dict(kwargs, multiprocessing=False)
+    with CorpusContext(config) as c:
+        return refine_formant_points(c, subset, **kwargs)
+
 
+def refine_formants_by_speaker(config, subset, workers, stage, inputs, resume=True, **kwargs):
+    """Run formant refinement on groups of speakers in `workers` processes, each on a
+    temporary subset of the speakers' vowels, and merge their metadata.  Refinement re-estimates the
+    prototypes of each speaker separately, so the results are those of one run over all speakers.
+    The speakers of each finished group are recorded in the manifest, and with `resume` the speakers
+    already refined by an interrupted run are skipped."""
 
-def formant_acoustic_analysis(config, vowels, vowel_prototypes_path, ignored_speakers=None, drop_formant=False, output_tracks = False, subset="vowel", reset_formants=False):
+    done = completed_discourses(config, stage, inputs) if resume else set()
+    if done:
+        print('Resuming formant refinement, {} speakers already refined'.format(len(done)))
+    with CorpusContext(config) as c:
+        groups = speaker_groups(c, subset, workers, skip=done)
+        names = ['{}_speakers_{}'.format(subset, i) for i in range(len(groups))]
+        for name, group in zip(names, groups):
+            ## (clearing any left by an interrupted run)
+            c.query_graph(c.phone).filter(c.phone.subset == name).remove_subset(name)
+            q = c.query_graph(c.phone).filter(c.phone.subset == subset)
+            q.filter(c.phone.speaker.name.in_(group)).create_subset(name)
+    print('Refining formants of {} speakers in {} processes'.format(sum(len(x) for x in groups), len(groups)))
+    metadata = {}
+    convergence = []
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, len(groups))) as executor:
+            results = executor.map(partial(refine_speaker_group, config, kwargs), names)
+            for group, (result, stats) in zip(groups, results):
+                if result:
+                    metadata.update(result)
+                convergence.extend(stats)
+                for speaker in group:
+                    record_discourse(config, stage, speaker, inputs)
+    finally:
+        ## a new context, as the workers have added the formant properties to the hierarchy
+        with CorpusContext(config) as c:
+            for name in names:
+                c.query_graph(c.phone).filter(c.phone.subset == name).remove_subset(name)
+    return metadata, convergence
+
+
+def formant_acoustic_analysis(config, vowels, vowel_prototypes_path, ignored_speakers=None, drop_formant=False, output_tracks = False, subset="vowel", reset_formants=False, workers=1, convergence=None):
     ## Function for performing the formant estimation and analysis.
     ## Input:
     ## - list of vowels to analyse
     ## - path to the vowel prototype file
+    ## - convergence settings of the refinement (see formant_convergence above)
     ## Output:
     ## - static (single point) formant and bandwith (F1-3, B1-3)
     ##   for vowel phones included in the corpus
@@ -363,10 +1426,14 @@ def formant_acoustic_analysis(config, vowels, vowel_prototypes_path, ignored_spe
 
         ## Check if formant estimation has already been completed
         ## for this corpus, and skip if so.
-        if not reset_formants and not output_tracks and c.hierarchy.has_token_property('phone', 'F1'):
+        stage = 'formant_acoustic_analysis:{}'.format(subset)
+        convergence = convergence_settings(convergence)
+        inputs = [vowels, ignored_speakers, file_fingerprint(vowel_prototypes_path), drop_formant, output_tracks,
+                  convergence['max_iterations'], convergence['changed_share'], convergence['prototype_shift']]
+        if not reset_formants and not output_tracks and stage_done(config, stage, inputs, c.hierarchy.has_token_property('phone', 'F1')):
             print('Formant point analysis already done, skipping.')
             return
-        elif not reset_formants and output_tracks and 'formants' in c.hierarchy.acoustics:
+        elif not reset_formants and output_tracks and stage_done(config, stage, inputs, 'formants' in c.hierarchy.acoustics):
             print('Formant track analysis already done, skipping.')
             return
 
@@ -377,18 +1444,44 @@ def formant_acoustic_analysis(config, vowels, vowel_prototypes_path, ignored_spe
         print('vowels encoded')
         beg = time.time()
 
-        ## Call the formant estimation function from the PolyglotDB package. Please see the PolyglotDB documentation
-        ## (https://polyglotdb.readthedocs.io/en/latest/acoustics_encoding.html#encoding-formants) for details
-        ## about how formants are estimated
-        metadata = analyze_formant_points_refinement(c, subset, duration_threshold=duration_threshold,
-                                                     num_iterations=nIterations,
-                                                     vowel_prototypes_path=vowel_prototypes_path,
-                                                     drop_formant=drop_formant,
-                                                     output_tracks = output_tracks)
+        ## Point measures come from the measurement cache if this set of vowels was measured before with the
+        ## same settings (refinement depends on all of a speaker's vowels, so the key covers all of them)
+        if not output_tracks and load_cached_formants(c, subset, inputs, vowel_prototypes_path):
+            print('Formant measures loaded from cache')
+        else:
+            ## Formants are estimated by PolyglotDB's refinement algorithm, as implemented in formant_refinement.py
+            ## with vectorized prototype scoring. Please see the PolyglotDB documentation
+            ## (https://polyglotdb.readthedocs.io/en/latest/acoustics_encoding.html#encoding-formants) for details
+            ## about how formants are estimated.  With several workers, speakers are refined in parallel.
+            if workers > 1:
+                metadata, stats = refine_formants_by_speaker(config, subset, workers, stage, inputs,
+                                                             resume=not reset_formants,
+                                                             duration_threshold=duration_threshold,
+                                                             num_iterations=convergence['max_iterations'],
+                                                             changed_share=convergence['changed_share'],
+                                                             prototype_shift=convergence['prototype_shift'],
+                                                             vowel_prototypes_path=vowel_prototypes_path,
+                                                             drop_formant=drop_formant,
+                                                             output_tracks=output_tracks)
+            else:
+                metadata, stats = refine_formant_points(c, subset, duration_threshold=duration_threshold,
+                                                        num_iterations=convergence['max_iterations'],
+                                                        changed_share=convergence['changed_share'],
+                                                        prototype_shift=convergence['prototype_shift'],
+                                                        vowel_prototypes_path=vowel_prototypes_path,
+                                                        drop_formant=drop_formant,
+                                                        output_tracks = output_tracks)
+            save_convergence_log(config, stats)
+            if not output_tracks:
+                with CorpusContext(config) as refreshed:
+                    properties = [(p, t) for p, t in formant_point_properties
+                                  if refreshed.hierarchy.has_token_property('phone', p)]
+                    cache_formants(refreshed, subset, inputs, vowel_prototypes_path, properties)
         end = time.time()
         time_taken = time.time() - beg
         print('Analyzing formants took: {}'.format(end - beg))
         save_performance_benchmark(config, 'formant_acoustic_analysis', time_taken)
+        record_stage(config, stage, inputs, time_taken)
 
 
 def formant_export(config, corpus_name, dialect_code, speakers, vowels, ignored_speakers=None, output_tracks=True):
@@ -463,9 +1556,13 @@ def formant_export(config, corpus_name, dialect_code, speakers, vowels, ignored_
         print('Query took: {}'.format(end - beg))
         print("Results for query written to " + csv_path)
         save_performance_benchmark(config, 'formant_export', time_taken)
+        record_stage(config, 'formant_export', csv_path, time_taken)
+
 
+def sibilant_export(config, corpus_name, dialect_code, speakers, ignored_speakers=None, multitaper=False, workers=None):
+    """Export the word-initial sibilants to CSV; with `multitaper`, the exported tokens are also
+    streamed to a pool of `workers` processes taking the measures of generate_mts_measures.py"""
 
-def sibilant_export(config, corpus_name, dialect_code, speakers, ignored_speakers=None):
     csv_path = os.path.join(base_dir, corpus_name, '{}_sibilants.csv'.format(corpus_name))
     with CorpusContext(config) as c:
         # export to CSV all the measures taken by the script, along with a variety of data about each phone
@@ -525,12 +1622,65 @@ def sibilant_export(config, corpus_name, dialect_code, speakers, ignored_speaker
                     c.phone.word.surface_transcription.column_name('word_surface_transcription'))
 
         # write the query to a CSV
-        qr.to_csv(csv_path)
+        if multitaper:
+            multitaper_export(c, q, csv_path, workers)
+        else:
+            qr.to_csv(csv_path)
         end = time.time()
         time_taken = time.time() - beg
         print('Query took: {}'.format(end - beg))
         print("Results for query written to " + csv_path)
         save_performance_benchmark(config, 'sibilant_export', time_taken)
+        record_stage(config, 'sibilant_export', csv_path, time_taken)
+
+
+def multitaper_export(c, q, csv_path, workers=None):
+    """Write the results of a sibilant query to CSV, while measuring the multitaper spectra of the
+    tokens as they arrive: each discourse's tokens are measured as soon as the next discourse's
+    start, and their measures are appended to <corpus>_mts_sibilants.csv (and their spectra
+    written to <corpus>_all_multitapers/) as each discourse is done"""
+
+    if workers is None:
+        workers = available_cores()
+    corpus_dir = os.path.dirname(csv_path)
+    mts_path = os.path.join(corpus_dir, '{}_mts_sibilants.csv'.format(c.corpus_name))
+    store_path = os.path.join(corpus_dir, '{}_all_multitapers'.format(c.corpus_name))
+    print('Measuring multitaper spectra with {} processes'.format(workers))
+    beg = time.time()
+    ## tokens of a discourse arrive together, so each sound file is read once
+    q = q.order_by(c.phone.discourse.name)
+    rows = q.count()
+    results = q.all()
+    sound_files = {}
+    with open(csv_path, 'w', encoding='utf8', newline='') as f, \
+            open(mts_path, 'w', encoding='utf8', newline='') as mts_file, \
+            SpectraStore.create(store_path, rows, multitaper_measures.spectrum_bins,
+                                sampling_rate=multitaper_measures.sampling_rate, k=multitaper_measures.taper_count,
+                                nw=multitaper_measures.time_bandwidth) as store:
+        writer = csv.DictWriter(f, results.columns)
+        writer.writeheader()
+        mts_writer = csv.DictWriter(mts_file, results.columns + multitaper_measures.measure_names, restval='NA')
+        mts_writer.writeheader()
+
+        def write_measures(row, values):
+            mts_writer.writerow(dict(row, **{k: 'NA' if v is None else v for k, v in (values or {}).items()}))
+
+        with multitaper_measures.MultitaperStream(workers, store, write_measures) as stream:
+            for line in results:
+                row = {k: line[k] for k in results.columns}
+                writer.writerow(row)
+                discourse = row['discourse']
+                if discourse not in sound_files:
+                    sound_file = c.discourse_sound_file(discourse)
+                    sound_files[discourse] = sound_file['file_path'] if sound_file else None
+                ## as in generate_mts_measures.r, tokens without sound files are left unmeasured
+                if sound_files[discourse] is None or not os.path.exists(sound_files[discourse]):
+                    write_measures(row, None)
+                    continue
+                stream.add(sound_files[discourse], row['phone_begin'], row['phone_end'], row, row['phone_id'])
+    time_taken = time.time() - beg
+    print('Multitaper measures written to {} ({} seconds)'.format(mts_path, time_taken))
+    save_performance_benchmark(c.config, 'multitaper_measures', time_taken)
 
 def polysyllabic_export(config, corpus_name, dialect_code, speakers):
     csv_path = os.path.join(base_dir, corpus_name, '{}_polysyllabic.csv'.format(corpus_name))
@@ -561,6 +1711,7 @@ def polysyllabic_export(config, corpus_name, dialect_code, speakers):
         print('Query took: {}'.format(end - beg))
         print("Results for query written to " + csv_path)
         save_performance_benchmark(config, 'polysyllabic_export', time_taken)
+        record_stage(config, 'polysyllabic_export', csv_path, time_taken)
 
 def get_size_of_corpus(config):
     from polyglotdb.query.base.func import Sum
@@ -573,7 +1724,7 @@ def get_size_of_corpus(config):
         results = q.all()
     return results[0]['result']
 
-def check_database(corpus_name, token = load_token(), port = 8080):
+def check_database(corpus_name, token = load_token(), port = server_port):
     host = 'http://localhost:{}'.format(port)
     client = PGDBClient(host, token)
     try:
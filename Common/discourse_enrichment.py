@@ -0,0 +1,630 @@
+##################################################
+## Discourse-level enrichment for SPADE corpora ##
+##################################################
+
+## PolyglotDB's encoders (encode_pauses, encode_utterances, encode_syllables, encode_count, ...)
+## always run over the whole corpus.  The functions here produce the same annotations for
+## a chosen set of discourses, e.g. those added to a corpus by an incremental import, by
+## reading each discourse's words and phones in one query, working out the annotations in
+## Python and writing them back in batches.  The count, rate and position properties are
+## computed the same way for every discourse of a corpus, in place of separate passes of
+## encode_rate, encode_count and encode_position over the whole corpus.
+
+import re
+import time
+import uuid
+
+from neo4j.exceptions import TransientError
+from polyglotdb.exceptions import SubsetError
+from polyglotdb.io.helper import make_type_id
+
+## number of nodes or relationships written per statement, and the number of times a
+## statement is retried after a transient error (such as a deadlock between workers)
+write_batch_size = 5000
+write_retries = 5
+
+
+def write_batches(c, statement, data, **parameters):
+    for i in range(0, len(data), write_batch_size):
+        for attempt in range(write_retries + 1):
+            try:
+                c.execute_cypher(statement, data=data[i:i + write_batch_size], **parameters)
+                break
+            except TransientError:
+                ## the failed statement was rolled back, so it is safe to run again
+                if attempt == write_retries:
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
+
+
+def is_pause(label, pauses):
+    """Check a word label against the pause specification of a corpus (a regex or a list of labels)"""
+
+    if isinstance(pauses, str):
+        return re.fullmatch(pauses, label) is not None
+    return label in pauses
+
+
+def fetch_words(c, discourse):
+    """Get the words of a discourse in order, with their speaker and type properties"""
+
+    statement = '''MATCH (w:word:{corpus})-[:spoken_in]->(d:Discourse:{corpus}),
+    (w)-[:spoken_by]->(s:Speaker:{corpus}),
+    (w)-[:is_a]->(wt:word_type:{corpus})
+    WHERE d.name = $discourse
+    RETURN w.id AS id, wt.label AS label, w.begin AS begin, w.end AS end, s.name AS speaker,
+    wt.stresspattern AS stresspattern, 'pause' IN labels(w) AS pause
+    ORDER BY w.begin'''.format(corpus=c.cypher_safe_name)
+    return [dict(r) for r in c.execute_cypher(statement, discourse=discourse)]
+
+
+def fetch_phones(c, discourse):
+    """Get the phones of a discourse in order, with the word containing them"""
+
+    statement = '''MATCH (p:phone:{corpus})-[:contained_by*1..2]->(w:word:{corpus})-[:spoken_in]->(d:Discourse:{corpus}),
+    (p)-[:is_a]->(pt:phone_type:{corpus})
+    WHERE d.name = $discourse
+    RETURN DISTINCT p.id AS id, pt.label AS label, p.begin AS begin, p.end AS end, w.id AS word_id
+    ORDER BY p.begin'''.format(corpus=c.cypher_safe_name)
+    return [dict(r) for r in c.execute_cypher(statement, discourse=discourse)]
+
+
+def group_by(rows, key):
+    groups = {}
+    for r in rows:
+        groups.setdefault(r[key], []).append(r)
+    return groups
+
+
+def encode_discourse_pauses(c, discourse, words, pauses, speakers=None):
+    """Mark the pause words of a discourse and link the speech words on either side of them, as
+    encode_pauses does.  The discourse's speech_begin and speech_end are those of the last of its
+    speakers in the order encode_pauses takes them (c.speakers, unless given)"""
+
+    pause_ids = [w['id'] for w in words if is_pause(w['label'], pauses)]
+    ## as set_pause, the precedes relationships of a pause become precedes_pause ones
+    statement = '''UNWIND $data as d
+    MATCH (w:word:{corpus})-[:is_a]->(wt:word_type:{corpus}) WHERE w.id = d
+    SET w :pause, wt :pause_type
+    REMOVE w:speech
+    WITH w
+    OPTIONAL MATCH (prec)-[r1:precedes]->(w)
+    FOREACH (o IN CASE WHEN prec IS NOT NULL THEN [prec] ELSE [] END |
+        CREATE (prec)-[:precedes_pause]->(w))
+    DELETE r1
+    WITH w
+    OPTIONAL MATCH (w)-[r2:precedes]->(foll)
+    FOREACH (o IN CASE WHEN foll IS NOT NULL THEN [foll] ELSE [] END |
+        CREATE (w)-[:precedes_pause]->(foll))
+    DELETE r2'''.format(corpus=c.cypher_safe_name)
+    write_batches(c, statement, pause_ids)
+    pause_ids = set(pause_ids)
+    for w in words:
+        w['pause'] = w['id'] in pause_ids
+
+    ## speech words with only pauses between them precede each other directly
+    statement = '''MATCH (prec:word:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE d.name = $discourse AND NOT (prec)-[:precedes]->()
+    WITH prec
+    MATCH p = (prec)-[:precedes_pause*]->(foll:word:{corpus}:speech)
+    WHERE NONE (x IN nodes(p)[1..-1] WHERE x:speech)
+    MERGE (prec)-[:precedes]->(foll)'''.format(corpus=c.cypher_safe_name)
+    c.execute_cypher(statement, discourse=discourse)
+
+    bounds = {}
+    for w in words:
+        if w['pause']:
+            continue
+        if w['speaker'] in bounds:
+            begin, end = bounds[w['speaker']]
+            bounds[w['speaker']] = (min(begin, w['begin']), max(end, w['end']))
+        else:
+            bounds[w['speaker']] = (w['begin'], w['end'])
+    if speakers is None:
+        speakers = c.speakers
+    speakers = [s for s in speakers if s in bounds]
+    if speakers:
+        begin, end = bounds[speakers[-1]]
+        statement = '''MATCH (d:Discourse:{corpus}) WHERE d.name = $discourse
+        SET d.speech_begin = $begin, d.speech_end = $end'''.format(corpus=c.cypher_safe_name)
+        c.execute_cypher(statement, discourse=discourse, begin=begin, end=end)
+
+
+def utterance_boundaries(speaker_words, min_pause_length):
+    """The pauses that split a speaker's words into utterances, as PolyglotDB's get_utterance_ids finds
+    them: a speech word and the next one, with only pause words (at least one) between them and at
+    least min_pause_length apart"""
+
+    boundaries = []
+    previous = None
+    paused = False
+    for w in speaker_words:
+        if w['pause']:
+            paused = True
+            continue
+        if previous is not None and paused and w['begin'] - previous['end'] >= min_pause_length:
+            boundaries.append({'begin': previous['end'], 'begin_id': previous['id'],
+                               'end': w['begin'], 'end_id': w['id']})
+        previous = w
+        paused = False
+    return boundaries
+
+
+def speaker_utterances(speaker_words, min_pause_length, min_utterance_length=0):
+    """Get the first and last word ids of a speaker's utterances, following PolyglotDB's
+    get_utterance_ids (including its merging of utterances shorter than min_utterance_length)"""
+
+    speech = [w for w in speaker_words if not w['pause']]
+    if not speech:
+        return []
+    results = utterance_boundaries(speaker_words, min_pause_length)
+    collapsed = []
+    for r in results:
+        if collapsed and r['begin'] == collapsed[-1]['end']:
+            collapsed[-1]['end'] = r['end']
+        else:
+            collapsed.append(dict(r))
+    min_begin = min(w['begin'] for w in speech)
+    max_end = max(w['end'] for w in speech)
+    end_words = [w for w in speech if w['begin'] == min_begin or w['end'] == max_end]
+    last = end_words[1] if len(end_words) > 1 else end_words[0]
+
+    if not results:
+        return [(end_words[0]['id'], last['id'])]
+    if len(results) == 1:
+        if results[0]['begin'] == 0:
+            return [(results[0]['end_id'], last['id'])]
+        if results[0]['end'] == last['end']:
+            return [(end_words[0]['id'], last['id'])]
+
+    if results[0]['begin'] != 0:
+        current = 0
+        current_id = end_words[0]['id']
+    else:
+        current = None
+        current_id = None
+    utterances = []
+    previous = None
+    for i, r in enumerate(collapsed):
+        if current is not None:
+            if r['begin'] - current > min_utterance_length:
+                utterances.append((current_id, r['begin_id']))
+            elif i == len(results) - 1 and utterances:
+                utterances[-1] = (utterances[-1][0], r['begin_id'])
+            elif utterances:
+                ## a short utterance joins the previous one if that is closer than the next
+                if current - previous <= r['end'] - r['begin']:
+                    utterances[-1] = (utterances[-1][0], r['begin_id'])
+        previous = current
+        current = r['end']
+        current_id = r['end_id']
+    if current < last['end']:
+        if last['end'] - current > min_utterance_length or not utterances:
+            utterances.append((current_id, last['id']))
+        else:
+            utterances[-1] = (utterances[-1][0], last['id'])
+    return utterances
+
+
+def utterance_ranges(words, min_pause_length, min_utterance_length=0):
+    """Split each speaker's words into utterances, which hold the speech words from their first word
+    to their last"""
+
+    ranges = []
+    for speaker, speaker_words in group_by(words, 'speaker').items():
+        speech = [w for w in speaker_words if not w['pause']]
+        index = {w['id']: i for i, w in enumerate(speech)}
+        for begin_id, end_id in speaker_utterances(speaker_words, min_pause_length, min_utterance_length):
+            utterance_words = speech[index[begin_id]:index[end_id] + 1]
+            ranges.append({'id': str(uuid.uuid1()), 'speaker': speaker,
+                           'begin': utterance_words[0]['begin'], 'end': utterance_words[-1]['end'],
+                           'word_ids': [w['id'] for w in utterance_words]})
+    return ranges
+
+
+def encode_discourse_utterances(c, discourse, words, min_pause_length):
+    """Create the utterances of a discourse, as encode_utterances does for the whole corpus"""
+
+    utterances = utterance_ranges(words, min_pause_length)
+    statement = '''UNWIND $data as u
+    MATCH (d:Discourse:{corpus}), (s:Speaker:{corpus})
+    WHERE d.name = $discourse AND s.name = u.speaker
+    MATCH (ut:utterance_type:{corpus})
+    CREATE (utt:utterance:{corpus}:speech {{id: u.id, begin: u.begin, end: u.end}}),
+    (utt)-[:is_a]->(ut), (utt)-[:spoken_in]->(d), (utt)-[:spoken_by]->(s)
+    WITH utt, u
+    MATCH (w:word:{corpus}) WHERE w.id IN u.word_ids
+    CREATE (w)-[:contained_by]->(utt)'''.format(corpus=c.cypher_safe_name)
+    write_batches(c, statement, utterances, discourse=discourse)
+
+    links = []
+    for speaker_utterances in group_by(utterances, 'speaker').values():
+        for a, b in zip(speaker_utterances, speaker_utterances[1:]):
+            links.append({'from': a['id'], 'to': b['id']})
+    statement = '''UNWIND $data as d
+    MATCH (a:utterance:{corpus}), (b:utterance:{corpus}) WHERE a.id = d.from AND b.id = d.to
+    CREATE (a)-[:precedes]->(b)'''.format(corpus=c.cypher_safe_name)
+    write_batches(c, statement, links)
+    return utterances
+
+
+def find_onsets(c, syllabics):
+    """Get the possible onsets for max-onset syllabification, as PolyglotDB's find_onsets does: the
+    phones before the first syllabic phone of every word that has one (so the empty onset only if
+    some word begins with a syllabic phone)"""
+
+    statement = '''MATCH (p:phone:{corpus})-[:contained_by*1..2]->(w:word:{corpus}),
+    (p)-[:is_a]->(pt:phone_type:{corpus})
+    WITH DISTINCT w, p, pt ORDER BY p.begin
+    WITH w, collect(pt.label) AS phones
+    RETURN DISTINCT phones'''.format(corpus=c.cypher_safe_name)
+    onsets = set()
+    for r in c.execute_cypher(statement):
+        nuclei = [i for i, label in enumerate(r['phones']) if label in syllabics]
+        ## (PolyglotDB's path query finds onsets of at most ten phones)
+        if nuclei and nuclei[0] <= 10:
+            onsets.add(tuple(r['phones'][:nuclei[0]]))
+    return onsets
+
+
+def split_onset(cluster, onsets):
+    """Index in an intervocalic cluster where the longest possible onset begins, or None if the
+    cluster is empty or no onset fits (PolyglotDB's split_ons_coda_maxonset)"""
+
+    if not cluster:
+        return None
+    for i in range(len(cluster) + 1):
+        if tuple(cluster[i:]) in onsets:
+            return i
+    return None
+
+
+def split_nonsyllabic(labels, onsets):
+    """Index in the phones of a word without a syllabic phone where its longest possible onset ends,
+    or None if no onset fits (PolyglotDB's split_nonsyllabic_maxonset)"""
+
+    if not labels:
+        return None
+    for i in range(len(labels), -1, -1):
+        if tuple(labels[:i]) in onsets:
+            return i
+    return None
+
+
+def syllabify_word(phones, syllabics, onsets):
+    """Divide the phones of a word into syllables as encode_syllables('maxonset') does, returning
+    lists of (phone, position) pairs.  A word without a syllabic phone is one syllable without a
+    nucleus, whose phones are onset up to the split and coda after it (or neither if no onset fits).
+    Consonants between two nuclei that end in no possible onset belong to neither syllable."""
+
+    labels = [p['label'] for p in phones]
+    nuclei = [i for i, label in enumerate(labels) if label in syllabics]
+    if not nuclei:
+        split = split_nonsyllabic(labels, onsets)
+        if split is None:
+            return [[(p, None) for p in phones]]
+        return [[(p, 'onset' if i < split else 'coda') for i, p in enumerate(phones)]]
+    syllables = []
+    for j, i in enumerate(nuclei):
+        if j == 0:
+            begin = 0
+        else:
+            split = split_onset(labels[nuclei[j - 1] + 1:i], onsets)
+            begin = i if split is None else nuclei[j - 1] + 1 + split
+        if j == len(nuclei) - 1:
+            end = len(phones) - 1
+        else:
+            split = split_onset(labels[i + 1:nuclei[j + 1]], onsets)
+            end = i if split is None else i + split
+        syllables.append([(p, 'onset') for p in phones[begin:i]] + [(phones[i], 'nucleus')] +
+                         [(p, 'coda') for p in phones[i + 1:end + 1]])
+    return syllables
+
+
+def pattern_stress(word, index, num_syllables):
+    """Stress of a syllable from its word's stress pattern, as encode_stress_from_word_property sets
+    it: patterns are split on '-' and used only if they have one value per syllable"""
+
+    pattern = word.get('stresspattern')
+    if pattern is None:
+        return None
+    stresses = pattern.split('-')
+    if len(stresses) != num_syllables:
+        return None
+    return stresses[index]
+
+
+def label_stress(label, pattern='[0-9]'):
+    """Stress of a syllable type from its label, as encode_stress_to_syllables finds it: the match of
+    the pattern in the last phone that has one (or else in the first phone)"""
+
+    segments = label.split('.')
+    nucleus = segments[0]
+    for segment in segments:
+        if re.search(pattern, segment) is not None:
+            nucleus = segment
+    match = re.search(pattern, nucleus)
+    if match is None:
+        return None
+    return match.group(0).replace('_', '')
+
+
+def encode_discourse_syllables(c, discourse, words, phones, syllabics, onsets, stress_source=None):
+    """Create the syllables of a discourse, as encode_syllables('maxonset') does for the whole corpus.
+    Pause words get no syllables (PolyglotDB leaves theirs unattached to any word).  Stress from vowel
+    labels is a property of the syllable types, as encode_stress_to_syllables makes it."""
+
+    phones_by_word = group_by(phones, 'word_id')
+    syllables = []
+    for w in words:
+        if w['pause'] or w['id'] not in phones_by_word:
+            continue
+        word_syllables = syllabify_word(phones_by_word[w['id']], syllabics, onsets)
+        for index, syllable in enumerate(word_syllables):
+            label = '.'.join(p['label'] for p, _ in syllable)
+            stress = type_stress = None
+            if stress_source == 'stresspattern':
+                stress = pattern_stress(w, index, len(word_syllables))
+            elif stress_source == 'vowel_labels':
+                type_stress = label_stress(label)
+            syllables.append({'id': str(uuid.uuid1()), 'word_id': w['id'], 'speaker': w['speaker'],
+                              'label': label, 'type_id': make_type_id([label], c.corpus_name), 'begin': syllable[0][0]['begin'], 'end': syllable[-1][0]['end'],
+                              'position_in_word': index + 1, 'num_phones': len(syllable),
+                              'stress': stress, 'type_stress': type_stress,
+                              'phones': [{'id': p['id'], 'position': position} for p, position in syllable]})
+
+    ## syllable nodes sit between phones and their word
+    statement = '''UNWIND $data as s
+    MATCH (w:word:{corpus})-[:spoken_in]->(d:Discourse:{corpus}), (w)-[:spoken_by]->(sp:Speaker:{corpus})
+    WHERE w.id = s.word_id
+    MERGE (st:syllable_type:{corpus} {{id: s.type_id}})
+    ON CREATE SET st.label = s.label
+    CREATE (syl:syllable:{corpus}:speech {{id: s.id, label: s.label, begin: s.begin, end: s.end,
+    position_in_word: s.position_in_word, num_phones: s.num_phones}}),
+    (syl)-[:is_a]->(st), (syl)-[:contained_by]->(w), (syl)-[:spoken_in]->(d), (syl)-[:spoken_by]->(sp)
+    SET syl.stress = s.stress
+    FOREACH (x IN CASE WHEN s.type_stress IS NOT NULL THEN [1] ELSE [] END | SET st.stress = s.type_stress)
+    WITH syl, s
+    UNWIND s.phones as sp
+    MATCH (p:phone:{corpus})-[r:contained_by]->(:word:{corpus}) WHERE p.id = sp.id
+    DELETE r
+    CREATE (p)-[:contained_by]->(syl)
+    SET p.syllable_position = sp.position
+    FOREACH (x IN CASE WHEN sp.position = 'onset' THEN [1] ELSE [] END | SET p :onset)
+    FOREACH (x IN CASE WHEN sp.position = 'nucleus' THEN [1] ELSE [] END | SET p :nucleus)
+    FOREACH (x IN CASE WHEN sp.position = 'coda' THEN [1] ELSE [] END | SET p :coda)'''.format(
+        corpus=c.cypher_safe_name)
+    write_batches(c, statement, syllables)
+
+    ## each speaker's syllables form one chain through the discourse
+    links = []
+    for speaker_syllables in group_by(syllables, 'speaker').values():
+        for a, b in zip(speaker_syllables, speaker_syllables[1:]):
+            links.append({'from': a['id'], 'to': b['id']})
+    statement = '''UNWIND $data as d
+    MATCH (a:syllable:{corpus}), (b:syllable:{corpus}) WHERE a.id = d.from AND b.id = d.to
+    CREATE (a)-[:precedes]->(b)'''.format(corpus=c.cypher_safe_name)
+    write_batches(c, statement, links)
+    return syllables
+
+
+def utterance_features(num_words, num_syllables, begin, end):
+    """The count and rate properties of an utterance, as encode_count and encode_rate give them: the words
+    counted are those contained by the utterance, which (as in PolyglotDB) are only its speech words,
+    never the pauses within it"""
+
+    duration = end - begin
+    return {'num_words': num_words, 'num_syllables': num_syllables,
+            'speech_rate': num_syllables / duration if duration > 0 else None}
+
+
+def encode_discourse_counts(c, words, utterances, syllables):
+    """Write the count and rate properties of utterances and words (syllable counts are set when
+    syllables are created)"""
+
+    syllables_per_word = {}
+    for s in syllables:
+        syllables_per_word[s['word_id']] = syllables_per_word.get(s['word_id'], 0) + 1
+    data = []
+    for u in utterances:
+        num_syllables = sum(syllables_per_word.get(w, 0) for w in u['word_ids'])
+        data.append({'id': u['id'], 'props': utterance_features(len(u['word_ids']), num_syllables,
+                                                                u['begin'], u['end'])})
+    statement = '''UNWIND $data as d
+    MATCH (n:utterance:{corpus}) WHERE n.id = d.id
+    SET n += d.props'''.format(corpus=c.cypher_safe_name)
+    write_batches(c, statement, data)
+
+    ## as with encode_count, pause words get a count of zero
+    data = [{'id': w['id'], 'props': {'num_syllables': syllables_per_word.get(w['id'], 0)}} for w in words]
+    statement = '''UNWIND $data as d
+    MATCH (n:word:{corpus}) WHERE n.id = d.id
+    SET n += d.props'''.format(corpus=c.cypher_safe_name)
+    write_batches(c, statement, data)
+
+
+def prepare_utterance_encoding(c):
+    """Clear any pauses and add the utterance type and annotation level, before pauses and utterances
+    are encoded by discourse"""
+
+    c.reset_pauses()
+    c.execute_cypher('MERGE (:utterance_type:{corpus})'.format(corpus=c.cypher_safe_name))
+    if 'utterance' not in c.hierarchy.annotation_types:
+        c.hierarchy.add_annotation_type('utterance', above='word')
+        c.encode_hierarchy()
+
+
+def prepare_syllable_encoding(c):
+    """Add the syllable annotation level, before syllables are created by discourse.  Syllable types
+    are merged on their (corpus-specific) ids, which PolyglotDB's own syllable import also keeps unique,
+    so workers encoding discourses at once cannot create the same type twice"""
+
+    c.execute_cypher('CREATE CONSTRAINT ON (st:syllable_type) ASSERT st.id IS UNIQUE')
+    if 'syllable' not in c.hierarchy.annotation_types:
+        c.hierarchy.add_annotation_type('syllable', above='phone', below='word')
+        c.encode_hierarchy()
+
+
+def finish_syllable_encoding(c):
+    """Add the phones' syllable positions to the hierarchy once every discourse is encoded, as
+    encode_syllables does"""
+
+    c.hierarchy.add_token_subsets(c, 'phone', ['onset', 'coda', 'nucleus'])
+    c.hierarchy.add_token_properties(c, 'phone', [('syllable_position', str)])
+    c.encode_hierarchy()
+
+
+def finish_utterance_encoding(c, pauses):
+    """Add the pause subset and the discourses' speech times to the hierarchy once every discourse is
+    encoded; as encode_pauses does, fail if no word was a pause"""
+
+    if c.query_graph(c.pause).count() == 0:
+        raise SubsetError('No words matched {} for creating pauses'.format(pauses))
+    c.hierarchy.add_token_subsets(c, 'word', ['pause'])
+    c.hierarchy.add_discourse_properties(c, [('speech_begin', float), ('speech_end', float)])
+    c.encode_hierarchy()
+
+
+def encode_utterance_stage(c, discourse, pauses, min_pause_length=0.15, speakers=None):
+    """Encode the pauses and utterances of one discourse"""
+
+    words = fetch_words(c, discourse)
+    encode_discourse_pauses(c, discourse, words, pauses, speakers=speakers)
+    encode_discourse_utterances(c, discourse, words, min_pause_length)
+
+
+def encode_syllable_stage(c, discourse, syllabics, onsets):
+    """Encode the syllables of one discourse (stress is encoded afterwards for the whole corpus)"""
+
+    words = fetch_words(c, discourse)
+    phones = fetch_phones(c, discourse)
+    encode_discourse_syllables(c, discourse, words, phones, syllabics, onsets)
+
+
+def fetch_discourse_table(c, discourse):
+    """Get the speech words of a discourse with their utterance and phones, in order, in one query,
+    split into words, phones and utterances as used by the functions above"""
+
+    statement = '''MATCH (w:word:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus}),
+    (w)-[:spoken_by]->(s:Speaker:{corpus}), (w)-[:is_a]->(wt:word_type:{corpus})
+    WHERE d.name = $discourse
+    OPTIONAL MATCH (w)-[:contained_by]->(u:utterance:{corpus})
+    OPTIONAL MATCH (p:phone:{corpus})-[:contained_by]->(w), (p)-[:is_a]->(pt:phone_type:{corpus})
+    RETURN w.id AS word_id, wt.label AS word_label, w.begin AS word_begin, w.end AS word_end,
+    s.name AS speaker, wt.stresspattern AS stresspattern,
+    u.id AS utterance_id, u.begin AS utterance_begin, u.end AS utterance_end,
+    p.id AS phone_id, pt.label AS phone_label, p.begin AS phone_begin, p.end AS phone_end
+    ORDER BY w.begin, p.begin'''.format(corpus=c.cypher_safe_name)
+    words = []
+    phones = []
+    utterances = {}
+    for r in c.execute_cypher(statement, discourse=discourse):
+        if not words or words[-1]['id'] != r['word_id']:
+            words.append({'id': r['word_id'], 'label': r['word_label'], 'begin': r['word_begin'],
+                          'end': r['word_end'], 'speaker': r['speaker'], 'stresspattern': r['stresspattern'],
+                          'pause': False})
+            if r['utterance_id'] is not None:
+                utterance = utterances.setdefault(r['utterance_id'], {'id': r['utterance_id'],
+                                                                      'begin': r['utterance_begin'],
+                                                                      'end': r['utterance_end'],
+                                                                      'word_ids': []})
+                utterance['word_ids'].append(r['word_id'])
+        if r['phone_id'] is not None:
+            phones.append({'id': r['phone_id'], 'label': r['phone_label'], 'begin': r['phone_begin'],
+                           'end': r['phone_end'], 'word_id': r['word_id']})
+    return words, phones, list(utterances.values())
+
+
+def encode_syllables_and_counts(c, discourse, syllabics, onsets, stress_source=None):
+    """Encode the syllables (with stress) of one discourse and set all of its count, rate and position
+    properties, from a single read of the discourse"""
+
+    words, phones, utterances = fetch_discourse_table(c, discourse)
+    syllables = encode_discourse_syllables(c, discourse, words, phones, syllabics, onsets,
+                                           stress_source=stress_source)
+    encode_discourse_counts(c, words, utterances, syllables)
+    ## the table has only speech words, so the pause words' counts are set separately
+    statement = '''MATCH (w:word:{corpus}:pause)-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE d.name = $discourse
+    SET w.num_syllables = 0'''.format(corpus=c.cypher_safe_name)
+    c.execute_cypher(statement, discourse=discourse)
+
+
+def fetch_counts_table(c, discourse):
+    """Get the utterance, word and syllable of every word of a discourse in one query, with the
+    number of phones in each syllable (pause words have neither utterance nor syllables)"""
+
+    statement = '''MATCH (w:word:{corpus})-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE d.name = $discourse
+    OPTIONAL MATCH (w)-[:contained_by]->(u:utterance:{corpus})
+    OPTIONAL MATCH (s:syllable:{corpus})-[:contained_by]->(w)
+    OPTIONAL MATCH (p:phone:{corpus})-[:contained_by]->(s)
+    RETURN u.id AS utterance_id, u.begin AS utterance_begin, u.end AS utterance_end,
+    w.id AS word_id, s.id AS syllable_id, s.begin AS syllable_begin, count(p) AS num_phones'''.format(
+        corpus=c.cypher_safe_name)
+    return [dict(r) for r in c.execute_cypher(statement, discourse=discourse)]
+
+
+def count_features(rows):
+    """Compute the properties set by encode_rate, encode_count and encode_position from a discourse's
+    counts table, returning the properties to set on utterances, words and syllables"""
+
+    utterances = {}
+    words = {}
+    syllables = {}
+    for r in rows:
+        word = words.setdefault(r['word_id'], {'num_syllables': 0})
+        if r['utterance_id'] is not None:
+            utterance = utterances.setdefault(r['utterance_id'], {'begin': r['utterance_begin'],
+                                                                  'end': r['utterance_end'],
+                                                                  'words': set(), 'syllables': 0})
+            utterance['words'].add(r['word_id'])
+        if r['syllable_id'] is None:
+            continue
+        word['num_syllables'] += 1
+        word.setdefault('syllables', []).append((r['syllable_begin'], r['syllable_id']))
+        syllables[r['syllable_id']] = {'num_phones': r['num_phones']}
+        if r['utterance_id'] is not None:
+            utterances[r['utterance_id']]['syllables'] += 1
+
+    for word in words.values():
+        for position, (begin, syllable_id) in enumerate(sorted(word.pop('syllables', [])), 1):
+            syllables[syllable_id]['position_in_word'] = position
+    utterances = {k: utterance_features(len(u['words']), u['syllables'], u['begin'], u['end'])
+                  for k, u in utterances.items()}
+    return utterances, words, syllables
+
+
+def encode_discourse_features(c, discourse, syllables=True):
+    """Set speech rate, word and syllable counts, syllable positions and phone counts for a discourse
+    in one read and a few batched writes (the same values as encode_rate, encode_count and
+    encode_position give)"""
+
+    utterances, words, syllable_features = count_features(fetch_counts_table(c, discourse))
+    if not syllables:
+        utterances = {k: {'num_words': v['num_words']} for k, v in utterances.items()}
+    for annotation_type, features in [('utterance', utterances), ('word', words), ('syllable', syllable_features)]:
+        if annotation_type != 'utterance' and not syllables:
+            continue
+        statement = '''UNWIND $data as d
+        MATCH (n:{annotation_type}:{corpus}) WHERE n.id = d.id
+        SET n += d.props'''.format(annotation_type=annotation_type, corpus=c.cypher_safe_name)
+        write_batches(c, statement, [{'id': k, 'props': v} for k, v in features.items()])
+
+
+def enrich_discourses(c, discourses, syllabics, pauses, min_pause_length=0.15, stress_source=None):
+    """Encode pauses, utterances, syllables, counts and stress for the given discourses (which must
+    not have been enriched yet)"""
+
+    onsets = find_onsets(c, syllabics) if syllabics else set()
+    speakers = c.speakers
+    for discourse in discourses:
+        words = fetch_words(c, discourse)
+        encode_discourse_pauses(c, discourse, words, pauses, speakers=speakers)
+        utterances = encode_discourse_utterances(c, discourse, words, min_pause_length)
+        syllables = []
+        if syllabics:
+            phones = fetch_phones(c, discourse)
+            syllables = encode_discourse_syllables(c, discourse, words, phones, syllabics, onsets,
+                                                   stress_source=stress_source)
+        encode_discourse_counts(c, words, utterances, syllables)
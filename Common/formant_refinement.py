@@ -0,0 +1,306 @@
+#################################################
+## Formant point refinement for SPADE corpora ##
+#################################################
+
+## A version of PolyglotDB's analyze_formant_points_refinement.  Each vowel token is measured
+## with several numbers of formants (and, with drop_formant, with a spurious formant left out),
+## and the candidate closest to the speaker's prototype for the vowel, by Mahalanobis distance
+## over the prototype parameters (F1-F3, B1-B3, A1A2diff, A2A3diff), is kept; the prototype is
+## then re-estimated from the kept candidates and the selection repeated.  PolyglotDB scores
+## every candidate of every token with a separate scipy call in each iteration; here the
+## candidates of a speaker's vowel are held in one array, the inverse covariance is computed
+## once per iteration, and all candidates of all tokens are scored in one matrix operation.
+## The candidates, selection and prototypes are otherwise those of PolyglotDB, except that a
+## candidate with a prototype parameter not measured is never selected and does not enter the
+## prototype (PolyglotDB scores it with the missing values as 0).  Refinement of
+## a speaker's vowel stops once few enough tokens change their selection, or the prototype
+## means stop moving (see refine_vowel), rather than only when no selection changes.
+
+import os
+import csv
+import math
+
+import numpy as np
+
+from conch import analyze_segments
+from polyglotdb.acoustics.segments import generate_vowel_segments
+from polyglotdb.acoustics.formants.helper import (generate_variable_formants_point_function,
+                                                  save_formant_point_data, extract_and_save_formant_tracks)
+
+base_formant_columns = ['F1', 'F2', 'F3', 'B1', 'B2', 'B3']
+output_columns = ['F1', 'F2', 'F3', 'B1', 'B2', 'B3', 'A1', 'A2', 'A3', 'Ax', 'A1A2diff', 'A2A3diff']
+
+## Praat's number of formants (one more than the formants measured) of the candidates
+min_formants = 4
+default_formant = 5
+
+## speakers' vowels with fewer tokens keep the default candidate
+minimum_tokens = 6
+
+
+def read_prototypes(path):
+    """Prototype means and covariance matrices of each phone, and the prototype parameters"""
+
+    prototypes = {}
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        parameters = [p.split('_')[0] for p in next(reader) if p not in ['type', 'phone']]
+        print('Reading prototypes from {} (parameters: {})'.format(path, ', '.join(parameters)))
+        for line in reader:
+            if not line:
+                continue
+            means, matrix = prototypes.setdefault(line[1], ([], []))
+            values = [float(v) for v in line[2:]]
+            if line[0] == 'means':
+                means[:] = values
+            elif line[0] == 'matrix':
+                matrix.append(values)
+    return {phone: (np.array(means), np.array(matrix)) for phone, (means, matrix) in prototypes.items()}, parameters
+
+
+def amplitude_fit(measurements):
+    """Regression of the amplitudes of the first four (or three) formants on their log2 frequencies,
+    as (amplitudes, log frequencies, slope, intercept); no fit with only two formants, None with fewer"""
+
+    for count in (4, 3):
+        try:
+            amplitudes = [measurements['A{}'.format(i)] for i in range(1, count + 1)]
+            frequencies = [math.log2(measurements['F{}'.format(i)]) for i in range(1, count + 1)]
+            design = np.array([frequencies, np.ones(count)]).T
+            slope, intercept = np.linalg.lstsq(design, amplitudes, rcond=-1)[0]
+            return amplitudes, frequencies, slope, intercept
+        except Exception:
+            continue
+    try:
+        return ([measurements['A1'], measurements['A2']],
+                [math.log2(measurements['F1']), math.log2(measurements['F2'])], 0, 0)
+    except Exception:
+        return None
+
+
+def add_dropped_formant_candidates(data):
+    """Add a token's leave-one-out candidates: a candidate's formant n (of the first three) is dropped
+    where its amplitude is below the regression line of amplitude on log frequency"""
+
+    new_data = {}
+    ignored_candidates = []
+    for candidate, measurements in data.items():
+        fit = amplitude_fit(measurements)
+        if fit is None:
+            ## no formants with these settings
+            ignored_candidates.append(candidate)
+            continue
+        amplitudes, frequencies, slope, intercept = fit
+        for leave_out in range(1, 1 + min(3, candidate)):
+            if leave_out < len(amplitudes) and \
+                    amplitudes[leave_out - 1] < intercept + slope * frequencies[leave_out - 1]:
+                new_measurements = {'Ax': measurements['A{}'.format(leave_out)]}
+                for parameter, value in measurements.items():
+                    number = int(parameter[-1])
+                    if number < leave_out:
+                        new_measurements[parameter] = value
+                    elif number > leave_out:
+                        new_measurements[parameter[0] + str(number - 1)] = value
+                new_data['{}x{}'.format(candidate, leave_out)] = new_measurements
+        measurements['Ax'] = measurements.get('A4')
+    data = {k: v for k, v in data.items() if k not in ignored_candidates}
+    data.update(new_data)
+    return data
+
+
+def add_amplitude_differences(measurements):
+    try:
+        measurements['A1A2diff'] = measurements['A1'] - measurements['A2']
+        try:
+            measurements['A2A3diff'] = measurements['A2'] - measurements['A3']
+        except (KeyError, TypeError):
+            measurements['A2A3diff'] = measurements['A2']
+    except (KeyError, TypeError):
+        measurements['A1A2diff'] = measurements.get('A1', 0)
+        measurements['A2A3diff'] = 0
+
+
+def candidate_array(output, parameters):
+    """The candidates of each token as an array of (tokens, candidates, parameters), missing values
+    as NaN, with the candidate names of each token and a mask of the candidates present with every
+    parameter measured"""
+
+    names = [list(data) for data in output.values()]
+    width = max(len(x) for x in names)
+    points = np.full((len(names), width, len(parameters)), np.nan)
+    for i, data in enumerate(output.values()):
+        for j, measurements in enumerate(data.values()):
+            points[i, j] = [np.nan if measurements.get(p) is None else measurements[p] for p in parameters]
+    mask = ~np.isnan(points).any(axis=2)
+    return points, names, mask
+
+
+def mahalanobis_distances(points, means, inverse_covariance):
+    """Mahalanobis distances of every candidate of every token (an array of (tokens, candidates,
+    parameters)) from the prototype means"""
+
+    difference = points - means
+    with np.errstate(invalid='ignore'):
+        return np.sqrt(np.einsum('tcp,pq,tcq->tc', difference, inverse_covariance, difference))
+
+
+def inverse_covariance(covariance):
+    """Pseudo-inverse of a prototype's covariance matrix, warning if the matrix is singular (the
+    distances are then taken in the subspace the prototype's candidates span)"""
+
+    rank = np.linalg.matrix_rank(covariance)
+    if rank < covariance.shape[0]:
+        print('Warning: prototype covariance matrix is singular (rank {} of {}), '
+              'using its pseudo-inverse'.format(rank, covariance.shape[0]))
+    return np.linalg.pinv(covariance)
+
+
+def select_candidates(points, mask, means, inverse):
+    """Index of the closest candidate of each token (the first, on ties; the first candidate where
+    none has a distance)"""
+
+    distances = mahalanobis_distances(points, means, inverse)
+    distances = np.where(mask & ~np.isnan(distances), distances, np.inf)
+    return np.argmin(distances, axis=1)
+
+
+def estimate_prototype(selected):
+    """Means and covariance matrix of the selected candidates (tokens, parameters), leaving out
+    candidates with a parameter not measured"""
+
+    selected = selected[~np.isnan(selected).any(axis=1)]
+    return selected.mean(axis=0), np.cov(selected.T)
+
+
+def mean_shift(previous_means, means, inverse):
+    """Mahalanobis distance between successive prototype means, under the new covariance (given
+    by its inverse)"""
+
+    difference = means - previous_means
+    return float(np.sqrt(difference @ inverse @ difference))
+
+
+def refine_vowel(points, mask, prototype, max_iterations, changed_share=0, shift=None):
+    """Select each token's candidate and re-estimate the prototype from the selection, until the
+    share of tokens whose selection changed is at most `changed_share` (by default, until the selection
+    stops changing), the prototype means moved by at most `shift` (if given), or after `max_iterations`.
+    Returns the selected candidate indices, the last prototype and the (share of tokens changed, prototype
+    shift) of each iteration run; no share is given for the first."""
+
+    means, covariance = prototype
+    inverse = inverse_covariance(covariance)
+    tokens = np.arange(points.shape[0])
+    previous = None
+    stats = []
+    for iteration in range(max(1, max_iterations)):
+        best = select_candidates(points, mask, means, inverse)
+        previous_means = means
+        means, covariance = estimate_prototype(points[tokens, best])
+        ## the new prototype's inverse scores its shift here and the selection of the next iteration
+        inverse = inverse_covariance(covariance)
+        changed = None if previous is None else float(np.mean(best != previous))
+        moved = mean_shift(previous_means, means, inverse)
+        stats.append((changed, moved))
+        if changed is not None and (changed <= changed_share or (shift is not None and moved <= shift)):
+            break
+        previous = best
+    return best, (means, covariance), stats
+
+
+def best_measurements(measurements, candidate):
+    best = {k: measurements.get(k) for k in output_columns}
+    best['num_formants'] = float(str(candidate).split('x')[0])
+    best['Fx'] = int(str(candidate)[0])
+    best['drop_formant'] = int(str(candidate).split('x')[-1]) if 'x' in str(candidate) else 0
+    return best
+
+
+def format_stats(values):
+    return ', '.join('NA' if x is None else '{:.3f}'.format(x) for x in values)
+
+
+def refine_formant_points(corpus_context, vowel_label='vowel', duration_threshold=0, num_iterations=1,
+                          vowel_prototypes_path='', drop_formant=False, output_tracks=False, multiprocessing=True,
+                          changed_share=0, prototype_shift=None):
+    """Measure F1-F3 and B1-B3 of the vowels in a subset, refining the number of formants of each
+    token against per-speaker prototypes (see refine_vowel for the convergence criteria), and save them
+    as analyze_formant_points_refinement does; returns the last prototype of each vowel and rows of
+    (speaker, vowel, tokens, iteration, share of tokens changed, prototype shift)"""
+
+    if not corpus_context.hierarchy.has_type_subset('phone', vowel_label) and \
+            not corpus_context.hierarchy.has_token_subset('phone', vowel_label):
+        raise Exception('Phones do not have a "{}" subset.'.format(vowel_label))
+    if vowel_prototypes_path and os.path.exists(vowel_prototypes_path):
+        prototypes, parameters = read_prototypes(vowel_prototypes_path)
+    else:
+        prototypes, parameters = {}, base_formant_columns
+
+    segment_mapping = generate_vowel_segments(corpus_context, duration_threshold=duration_threshold, padding=0.1,
+                                              vowel_label=vowel_label)
+    max_formants = 8 if drop_formant else 7
+    formant_function = generate_variable_formants_point_function(corpus_context, min_formants, max_formants)
+    best_data = {}
+    metadata = {}
+    log_output = []
+    groups = segment_mapping.grouped_mapping('speaker', 'label')
+    for i, ((speaker, vowel), seg) in enumerate(groups.items()):
+        if len(seg) == 0:
+            continue
+        print('{} {}: {} of {}: {} tokens'.format(speaker, vowel, i + 1, len(groups), len(seg)))
+        output = analyze_segments(seg, formant_function, multiprocessing=multiprocessing)
+        if len(seg) < minimum_tokens:
+            print('Not enough observations of vowel {}, at least {} are needed, only found {}.'.format(
+                vowel, minimum_tokens, len(seg)))
+            for s, data in output.items():
+                best_data[s] = {k: data[default_formant][k] for k in base_formant_columns}
+            continue
+
+        for s, data in output.items():
+            if drop_formant:
+                data = add_dropped_formant_candidates(data)
+            else:
+                for measurements in data.values():
+                    measurements['Ax'] = measurements.get('A4')
+            for measurements in data.values():
+                add_amplitude_differences(measurements)
+            output[s] = data
+        output = {k: v for k, v in output.items() if v}
+        if not output:
+            continue
+        points, names, mask = candidate_array(output, parameters)
+        if mask.any(axis=1).sum() < minimum_tokens:
+            print('Not enough measured observations of vowel {}, at least {} are needed, only found {}.'.format(
+                vowel, minimum_tokens, mask.any(axis=1).sum()))
+            for s, data in output.items():
+                if default_formant in data:
+                    best_data[s] = best_measurements(data[default_formant], default_formant)
+            continue
+
+        if vowel in prototypes:
+            prototype = prototypes[vowel]
+        else:
+            ## without a prototype, start from the default number of formants
+            print('no prototype for', vowel, 'so using the default candidates')
+            default = [x.index(default_formant) if default_formant in x else 0 for x in names]
+            prototype = estimate_prototype(points[np.arange(len(names)), default])
+        best, (means, covariance), stats = refine_vowel(points, mask, prototype, num_iterations,
+                                                        changed_share, prototype_shift)
+        metadata[vowel] = [means.tolist(), covariance.tolist()]
+        for (s, data), candidates, j in zip(output.items(), names, best):
+            best_data[s] = best_measurements(data[candidates[j]], candidates[j])
+        log_output.append((speaker, vowel, len(output), stats))
+
+    convergence = []
+    for speaker, vowel, token_count, stats in log_output:
+        changed, moved = zip(*stats)
+        print('Speaker {} for vowel {} had {} tokens and completed refinement in {} iterations '
+              '(share changed: {}; prototype shift: {})'.format(speaker, vowel, token_count, len(stats),
+                                                                format_stats(changed), format_stats(moved)))
+        for iteration, (share, shift) in enumerate(stats):
+            convergence.append((speaker, vowel, token_count, iteration + 1, share, shift))
+    if output_tracks:
+        extract_and_save_formant_tracks(corpus_context, best_data, num_formants=True,
+                                        multiprocessing=multiprocessing)
+    else:
+        save_formant_point_data(corpus_context, best_data, num_formants=True)
+    return metadata, convergence
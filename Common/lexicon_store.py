@@ -0,0 +1,114 @@
+#############################################
+## Compiled UNISYN lexicon store for SPADE ##
+#############################################
+
+## The UNISYN enrichment files are large CSVs shared by every corpus of a dialect.  They are
+## compiled once into a store: a hash table of words (lower case) pointing at each word's
+## CSV row, in a single file that is memory-mapped when read, so that looking up the words
+## of a corpus costs one probe per word rather than a pass over the whole CSV.
+##
+## File layout: magic, number of slots and header length, the CSV header line, the slots
+## (file offsets of records, 0 for empty), then the records (key length, row length, key, row).
+
+import os
+import io
+import csv
+import mmap
+import struct
+import zlib
+
+magic = b'SPADELEX1\n'
+header_format = '<II'
+slot_format = '<Q'
+record_format = '<HI'
+
+
+def key_hash(key):
+    return zlib.crc32(key)
+
+
+def compile_lexicon(csv_path, store_path):
+    """Compile an enrichment CSV into a store (later rows for a word replace earlier ones, as when loaded)"""
+
+    with open(csv_path, 'r', encoding='utf8', newline='') as f:
+        header = f.readline()
+        try:
+            dialect = csv.Sniffer().sniff(header, delimiters=',\t')
+        except csv.Error:
+            ## e.g. a header with a single column, for which the delimiter does not matter
+            dialect = csv.excel
+        rows = {}
+        for row in csv.reader(f, dialect):
+            if row:
+                rows[row[0].lower()] = row
+
+    header_bytes = header.encode('utf8')
+    slot_count = max(1, len(rows) * 2)
+    slot_size = struct.calcsize(slot_format)
+    offset = len(magic) + struct.calcsize(header_format) + len(header_bytes) + slot_count * slot_size
+    slots = [0] * slot_count
+    records = bytearray()
+    for key, row in rows.items():
+        line = io.StringIO()
+        csv.writer(line, dialect).writerow(row)
+        key = key.encode('utf8')
+        line = line.getvalue().encode('utf8')
+        i = key_hash(key) % slot_count
+        while slots[i]:
+            i = (i + 1) % slot_count
+        slots[i] = offset + len(records)
+        records += struct.pack(record_format, len(key), len(line)) + key + line
+
+    temp_path = '{}.{}.tmp'.format(store_path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(magic)
+        f.write(struct.pack(header_format, slot_count, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(struct.pack('<{}Q'.format(slot_count), *slots))
+        f.write(records)
+    os.replace(temp_path, store_path)
+    return len(rows)
+
+
+class LexiconStore(object):
+    """Read-only view of a compiled store"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(magic)] != magic:
+            self.close()
+            raise ValueError('{} is not a lexicon store.'.format(path))
+        position = len(magic)
+        self.slot_count, header_length = struct.unpack_from(header_format, self.map, position)
+        position += struct.calcsize(header_format)
+        self.header = self.map[position:position + header_length].decode('utf8')
+        self.slots_start = position + header_length
+
+    def get(self, word):
+        """The CSV row (as a line) for a word, or None"""
+
+        key = word.lower().encode('utf8')
+        slot_size = struct.calcsize(slot_format)
+        record_size = struct.calcsize(record_format)
+        i = key_hash(key) % self.slot_count
+        while True:
+            offset, = struct.unpack_from(slot_format, self.map, self.slots_start + i * slot_size)
+            if not offset:
+                return None
+            key_length, line_length = struct.unpack_from(record_format, self.map, offset)
+            start = offset + record_size
+            if self.map[start:start + key_length] == key:
+                start += key_length
+                return self.map[start:start + line_length].decode('utf8')
+            i = (i + 1) % self.slot_count
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
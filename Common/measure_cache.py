@@ -0,0 +1,108 @@
+#####################################################
+## Persistent acoustic measurement cache for SPADE ##
+#####################################################
+
+## Acoustic measures of a token depend only on its audio and the method used to measure
+## it, so they are kept across resets of a corpus database in a local SQLite file, keyed
+## by (hash of the audio file's contents, begin, end, channel, method), where the method
+## key is a hash of the script or parameters used.  File hashes are remembered by path,
+## size and modification time so that unchanged audio is not read again.
+
+import os
+import json
+import sqlite3
+import hashlib
+
+## times are compared to the microsecond
+time_precision = 6
+
+
+def content_hash(path):
+    """SHA-1 of a file's contents"""
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class MeasureCache(object):
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS files
+            (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT)''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS measures
+            (audio TEXT, begin REAL, end REAL, channel INTEGER, method TEXT, measures TEXT,
+            PRIMARY KEY (audio, begin, end, channel, method)) WITHOUT ROWID''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS "values"
+            (name TEXT PRIMARY KEY, value TEXT)''')
+        self.connection.commit()
+        self.file_hashes = {}
+
+    def audio_hash(self, path):
+        """Hash of a sound file, only read again if the file has changed"""
+
+        if path in self.file_hashes:
+            return self.file_hashes[path]
+        stat = os.stat(path)
+        row = self.connection.execute('SELECT size, mtime, hash FROM files WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            file_hash = row[2]
+        else:
+            file_hash = content_hash(path)
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                    (path, stat.st_size, stat.st_mtime, file_hash))
+            self.connection.commit()
+        self.file_hashes[path] = file_hash
+        return file_hash
+
+    def key(self, seg, method):
+        return (self.audio_hash(seg.file_path), round(seg.begin, time_precision), round(seg.end, time_precision),
+                seg.channel, method)
+
+    def segment_set_hash(self, segments):
+        """Hash of the audio and times of a set of segments, for measures that depend on all of them"""
+
+        keys = sorted(self.key(seg, '')[:4] for seg in segments)
+        return hashlib.sha1(json.dumps(keys).encode('utf8')).hexdigest()
+
+    def lookup(self, segments, method):
+        """Cached measures of the segments that have them"""
+
+        found = {}
+        for seg in segments:
+            row = self.connection.execute('''SELECT measures FROM measures
+                WHERE audio = ? AND begin = ? AND end = ? AND channel = ? AND method = ?''',
+                                          self.key(seg, method)).fetchone()
+            if row is not None:
+                found[seg] = json.loads(row[0])
+        return found
+
+    def store(self, output, method):
+        """Cache the measures of segments (those without measures are left out)"""
+
+        rows = [self.key(seg, method) + (json.dumps(values),) for seg, values in output.items() if values]
+        self.connection.executemany('INSERT OR REPLACE INTO measures VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.connection.commit()
+
+    def store_value(self, name, value):
+        """Cache a value that is not a measure of one segment (e.g. what a method measures)"""
+
+        self.connection.execute('INSERT OR REPLACE INTO "values" VALUES (?, ?)', (name, json.dumps(value)))
+        self.connection.commit()
+
+    def lookup_value(self, name):
+        row = self.connection.execute('SELECT value FROM "values" WHERE name = ?', (name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,296 @@
+#########################################
+## NumPy multitaper measures for SPADE ##
+#########################################
+
+## Computes the measures of generate_mts_measures.r without R.  The R script reads a 25 ms
+## window around the midpoint of each sibilant, downsamples it to 22050 Hz and estimates its
+## spectrum with 8 DPSS tapers (NW = 4), computing the tapers again for every token.  Here the
+## taper matrix is computed once per window length, and the spectra of all the windows of
+## the same length are computed together, as one batched FFT, in chunks of windows.  The
+## steps follow tuneR (readWave, downsample) and the classes in auxiliary/ (Multitaper,
+## Spectrum), so the measures are those of the R script.  Rather than reading (and
+## downsampling) the audio of every token separately, tokens are grouped by sound file, each
+## file is opened once, and the windows are gathered from it, already decimated, one window
+## length at a time.  Files are measured in parallel.
+
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+import numpy as np
+from scipy.signal import windows as signal_windows
+
+from sibilant_measures import read_sound
+
+## settings of generate_mts_measures.r
+sampling_rate = 22050
+window_length = 0.025
+taper_count = 8
+time_bandwidth = 4
+
+## the most bins a spectrum can have (of the longest window at 22050 Hz)
+spectrum_bins = (int(np.ceil(window_length * sampling_rate)) + 1) // 2 + 1
+
+## number of windows whose spectra are computed in one FFT
+chunk_size = 2000
+
+## measures in the order the R script adds them: (name, kind, low Hz, high Hz)
+measures = [('spectral_peak_full', 'peak', 1000, 11000),
+            ('spectral_cog', 'centroid', 1000, 11000),
+            ('spectral_peak_mid', 'peak', 2000, 7000),
+            ('spectral_peak_2k8k', 'peak', 2000, 8000),
+            ('spectral_peak_2k9k', 'peak', 2000, 9000),
+            ('spectral_peak_lower_mid', 'peak', 2000, 5000),
+            ('spectral_spread', 'variance', 1000, 11000),
+            ('spectral_ampdiff_s', 'ampdiff', (1000, 3000), (3000, 7000)),
+            ('spectral_ampdiff_sh', 'ampdiff', (1000, 2000), (2000, 6000)),
+            ('spectral_lower_slope', 'slope', 1000, 4000),
+            ('spectral_cog_8k', 'centroid', 1000, 8000)]
+measure_names = [m[0] for m in measures]
+
+
+def window_bounds(file_rate, midpoints, length=window_length):
+    """First and last (exclusive) samples of windows centred on times, as readWave(from, to,
+    units = 'seconds') reads them"""
+
+    midpoints = np.asarray(midpoints, dtype=np.float64)
+    first = np.round((midpoints - length / 2) * file_rate + 1).astype(int) - 1
+    last = np.round((midpoints + length / 2) * file_rate).astype(int)
+    return first, last
+
+
+@lru_cache(maxsize=None)
+def decimation_offsets(n, file_rate):
+    """Offsets of the samples that downsample(..., 22050) keeps from a window of n samples: every
+    (file rate / 22050)th, index <- round(seq(1, n, by = file rate / 22050)).  tuneR does not
+    low-pass filter, and files below 22050 Hz are left at their own rate."""
+
+    if file_rate <= sampling_rate:
+        return np.arange(n)
+    step = file_rate / sampling_rate
+    count = int(np.floor((n - 1) / step + 1e-10)) + 1
+    return np.round(1 + np.arange(count) * step).astype(int) - 1
+
+
+def read_windows(data, file_rate, midpoints):
+    """Windows centred on times, read from the samples of one sound file (e.g. memory-mapped) with
+    one gather per window length: channels averaged and decimated to 22050 Hz.  Windows that run
+    past the ends of the file are clipped.  Yields the indices of the windows (in midpoints),
+    their samples (rows) and sampling rate."""
+
+    rate = min(file_rate, sampling_rate)
+    first, last = window_bounds(file_rate, midpoints)
+    inside = (first >= 0) & (last <= data.shape[0])
+    lengths = last - first
+    for n in np.unique(lengths[inside]):
+        indices = np.flatnonzero(inside & (lengths == n))
+        samples = first[indices][:, None] + decimation_offsets(int(n), file_rate)[None, :]
+        yield indices, np.asarray(data[samples], dtype=np.float64).mean(axis=-1), rate
+    for i in np.flatnonzero(~inside):
+        x = np.asarray(data[max(first[i], 0):min(last[i], data.shape[0])], dtype=np.float64).mean(axis=-1)
+        yield np.array([i]), x[decimation_offsets(len(x), file_rate)][None, :], rate
+
+
+@lru_cache(maxsize=None)
+def dpss_tapers(n):
+    """The DPSS tapers of a window length, as rows of unit energy (multitaper's dpss(n, k, nw)$v)"""
+
+    return signal_windows.dpss(n, time_bandwidth, taper_count, norm=2)
+
+
+def multitaper_spectra(windows, rate):
+    """Multitaper spectra of windows of the same length (the rows of an array), as
+    Multitaper(k = 8, nw = 4): the mean of the tapered periodograms, scaled by the sample
+    period and window length, from 0 Hz to the Nyquist frequency"""
+
+    n = windows.shape[1]
+    eigenspectra = np.abs(np.fft.rfft(windows[:, None, :] * dpss_tapers(n), axis=-1)) ** 2
+    spectra = eigenspectra.mean(axis=1) * (rate / n)
+    frequencies = np.arange(spectra.shape[1]) * (rate / n)
+    return frequencies, spectra
+
+
+def band(frequencies, low, high):
+    return (frequencies >= low) & (frequencies <= high)
+
+
+def peak_frequency(frequencies, spectra, low, high):
+    """peakHz: the frequency of the (first) largest value in the band"""
+
+    inside = band(frequencies, low, high)
+    return frequencies[inside][np.argmax(spectra[:, inside], axis=1)]
+
+
+def decibel_weights(frequencies, spectra, low, high):
+    """Values of the band in dB above the band's minimum, as centroid and variance weight them"""
+
+    inside = band(frequencies, low, high)
+    values = spectra[:, inside]
+    return frequencies[inside], 10 * np.log10(values / values.min(axis=1, keepdims=True))
+
+
+def centroid(frequencies, spectra, low, high):
+    """centroid(scale = 'decibel')"""
+
+    f, weights = decibel_weights(frequencies, spectra, low, high)
+    return (weights * f).sum(axis=1) / weights.sum(axis=1)
+
+
+def variance(frequencies, spectra, low, high):
+    """variance(scale = 'decibel'): the second moment about the centroid"""
+
+    f, weights = decibel_weights(frequencies, spectra, low, high)
+    mean = (weights * f).sum(axis=1) / weights.sum(axis=1)
+    return (weights * (f - mean[:, None]) ** 2).sum(axis=1) / weights.sum(axis=1)
+
+
+def amplitude_difference(frequencies, spectra, low_band, high_band):
+    """maxAmp over the high band less minAmp over the low band, in dB (the reference cancels)"""
+
+    low = spectra[:, band(frequencies, *low_band)].min(axis=1)
+    high = spectra[:, band(frequencies, *high_band)].max(axis=1)
+    return 10 * np.log10(high / low)
+
+
+def spectral_slope(frequencies, spectra, low, high):
+    """spectralSlope: the regression slope of standardized dB on standardized frequency, over the
+    bins strictly inside the band, which is the correlation of the two"""
+
+    inside = (frequencies > low) & (frequencies < high)
+    x = frequencies[inside] - frequencies[inside].mean()
+    y = 10 * np.log10(spectra[:, inside])
+    y = y - y.mean(axis=1, keepdims=True)
+    return (y @ x) / np.sqrt((x ** 2).sum() * (y ** 2).sum(axis=1))
+
+
+measure_functions = {'peak': peak_frequency, 'centroid': centroid, 'variance': variance,
+                     'ampdiff': amplitude_difference, 'slope': spectral_slope}
+
+
+def spectral_measures(frequencies, spectra):
+    """All the measures of the spectra (rows), as a dictionary of measure names to arrays"""
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {name: measure_functions[kind](frequencies, spectra, low, high)
+                for name, kind, low, high in measures}
+
+
+def measure_file(path, midpoints):
+    """Measure windows centred on times in one sound file, reading the file once.  Returns the
+    measures of each window (None where a window was too short to measure), with the
+    frequencies and spectrum of each."""
+
+    file_rate, data = read_sound(path)
+    output = [None] * len(midpoints)
+    spectra_output = [None] * len(midpoints)
+    for indices, windows, rate in read_windows(data, file_rate, midpoints):
+        if windows.shape[1] <= taper_count:
+            continue
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            frequencies, spectra = multitaper_spectra(windows[start:start + chunk_size], rate)
+            values = spectral_measures(frequencies, spectra)
+            for j, i in enumerate(chunk):
+                output[i] = {name: float(values[name][j]) if np.isfinite(values[name][j]) else None
+                             for name in measure_names}
+                spectra_output[i] = (frequencies, spectra[j].copy())
+    return output, spectra_output
+
+
+def measure_file_tokens(item):
+    path, midpoints = item
+    return measure_file(path, midpoints)
+
+
+def measure_tokens(tokens, workers=1, store=None):
+    """Measure tokens given as (sound file path, begin, end), from windows centred on their
+    midpoints.  Tokens are grouped by sound file, and files (largest first) are measured in
+    `workers` processes.  The spectrum of token i is written to row i of `store` (a
+    SpectraStore) as soon as its file is measured."""
+
+    by_file = {}
+    for i, (path, begin, end) in enumerate(tokens):
+        by_file.setdefault(path, []).append((i, begin + (end - begin) / 2))
+    paths = sorted(by_file, key=lambda x: -len(by_file[x]))
+    output = [None] * len(tokens)
+
+    def save(path, file_output, file_spectra):
+        for (i, midpoint), values, spectrum in zip(by_file[path], file_output, file_spectra):
+            output[i] = values
+            if store is not None and spectrum is not None:
+                store.write(i, *spectrum)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(measure_file_tokens, (path, [m for i, m in by_file[path]])): path
+                       for path in paths}
+            for future in as_completed(futures):
+                save(futures[future], *future.result())
+    else:
+        for path in paths:
+            save(path, *measure_file_tokens((path, [m for i, m in by_file[path]])))
+    return output
+
+
+class MultitaperStream(object):
+    """Measures tokens as they arrive (e.g. from an export query): the tokens of a sound file are
+    collected until a token of another file is added, and the file is then measured in a pool of
+    `workers` processes while more tokens arrive.  As each file is done, every token's spectrum is
+    written to its row of `store` (rows in order of arrival) and `callback(token, values)` is
+    called.  Tokens are best added grouped by sound file."""
+
+    def __init__(self, workers, store=None, callback=None):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.ahead = workers * 2
+        self.store = store
+        self.callback = callback
+        self.path = None
+        self.tokens = []
+        self.pending = {}
+        self.count = 0
+
+    def add(self, path, begin, end, token, phone_id=None):
+        if path != self.path:
+            self.submit()
+            self.path = path
+        self.tokens.append((self.count, begin + (end - begin) / 2, token, phone_id))
+        self.count += 1
+
+    def submit(self):
+        if self.tokens:
+            future = self.executor.submit(measure_file_tokens, (self.path, [t[1] for t in self.tokens]))
+            self.pending[future] = self.tokens
+            self.tokens = []
+        while len(self.pending) >= self.ahead:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self.save(future)
+
+    def save(self, future):
+        tokens = self.pending.pop(future)
+        file_output, file_spectra = future.result()
+        for (row, midpoint, token, phone_id), values, spectrum in zip(tokens, file_output, file_spectra):
+            if self.store is not None:
+                if spectrum is not None:
+                    self.store.write(row, *spectrum, phone_id=phone_id)
+                elif phone_id is not None:
+                    self.store.phone_ids[row] = phone_id
+                    self.store.rows[phone_id] = row
+            if self.callback is not None:
+                self.callback(token, values)
+
+    def close(self):
+        """Measure the remaining tokens and wait for all of them"""
+
+        self.submit()
+        for future in as_completed(list(self.pending)):
+            self.save(future)
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,208 @@
+#######################################
+## NumPy sibilant measures for SPADE ##
+#######################################
+
+## Computes the measures of sibilant_jane_optimized.praat (spectral centre of gravity and
+## spread, and the frequency of the LTAS peak and the LTAS slope) without Praat: each sound
+## file is read once (memory-mapped) and all of its tokens are measured in Python, rather
+## than starting a Praat process and opening the file for every token.  The steps follow
+## Praat's own algorithms (see the comments below), so the results agree with the script's
+## to its output precision; check_sibilant_engine.py compares the two on a corpus.
+
+import numpy as np
+from scipy.io import wavfile
+
+## settings of sibilant_jane_optimized.praat
+from_percent = 0.25
+to_percent = 0.75
+filter_low = 1000
+filter_high = 11000
+filter_smoothing = 100
+slope_low_band = (0, 1000)
+slope_high_band = (1000, 4000)
+
+## measures are reported to the same precision as the Praat script; the largest
+## differences from the script's output accepted by compare_measures
+precision = 4
+tolerances = {'cog': 1.0, 'spread': 1.0, 'peak': 1.0, 'slope': 0.01}
+
+
+def read_sound(path):
+    """Read a WAV file as a (memory-mapped where possible) array of shape (samples, channels)"""
+
+    sampling_rate, data = wavfile.read(path, mmap=True)
+    if data.ndim == 1:
+        data = data[:, None]
+    return sampling_rate, data
+
+
+def extract_part(data, sampling_rate, begin, end, channel=0):
+    """The samples of one channel whose times (sample centres, as in Praat) lie within begin and end, as floats"""
+
+    ## computed as Praat's Sampled_getWindowSamples does, so that samples centred exactly on a
+    ## boundary are kept or left out as they are by Praat
+    dx = 1.0 / sampling_rate
+    x1 = 0.5 * dx
+    first = max(int(np.ceil((begin - x1) / dx)), 0)
+    last = min(int(np.floor((end - x1) / dx)), data.shape[0] - 1)
+    x = np.asarray(data[first:last + 1, channel], dtype=np.float64)
+    if data.dtype.kind in 'iu':
+        ## Praat reads integer samples scaled to [-1, 1]
+        x /= float(2 ** (8 * data.dtype.itemsize - 1))
+    return x
+
+
+def fft_size(n):
+    """Praat's 'fast' spectrum pads to the next power of two"""
+
+    nfft = 2
+    while nfft < n:
+        nfft *= 2
+    return nfft
+
+
+def pass_hann_band(x, sampling_rate, low=filter_low, high=filter_high, smoothing=filter_smoothing):
+    """Praat's Filter (pass Hann band): zero-padded FFT, raised-cosine edges of width 2 * smoothing,
+    inverse FFT and truncation to the original length"""
+
+    nfft = fft_size(len(x))
+    spectrum = np.fft.rfft(x, nfft)
+    frequencies = np.arange(len(spectrum)) * sampling_rate / nfft
+    nyquist = sampling_rate / 2
+    f1, f2, f3, f4 = low - smoothing, low + smoothing, high - smoothing, high + smoothing
+    factor = np.ones(len(spectrum))
+    factor[(frequencies < f1) | (frequencies > f4)] = 0
+    if low > 0:
+        rising = (frequencies >= f1) & (frequencies < f2)
+        factor[rising] *= 0.5 - 0.5 * np.cos(np.pi / (2 * smoothing) * (frequencies[rising] - f1))
+    if high < nyquist:
+        falling = (frequencies > f3) & (frequencies <= f4)
+        factor[falling] *= 0.5 + 0.5 * np.cos(np.pi / (2 * smoothing) * (frequencies[falling] - f3))
+    return np.fft.irfft(spectrum * factor, nfft)[:len(x)]
+
+
+def power_spectrum(x, sampling_rate):
+    """Frequencies and power of Praat's To Spectrum (fast)"""
+
+    nfft = fft_size(len(x))
+    power = np.abs(np.fft.rfft(x, nfft)) ** 2
+    return np.arange(len(power)) * sampling_rate / nfft, power
+
+
+def centre_of_gravity(frequencies, power):
+    return np.sum(frequencies * power) / np.sum(power)
+
+
+def spread(frequencies, power, cog):
+    return np.sqrt(np.sum((frequencies - cog) ** 2 * power) / np.sum(power))
+
+
+def ltas_peak(frequencies, db):
+    """Praat's Get frequency of maximum (parabolic) on a 1-to-1 Ltas: the end bins as they are,
+    inner local maxima improved by a parabola through their neighbours"""
+
+    step = frequencies[1] - frequencies[0]
+    best, best_index = db[0], 0.0
+    if db[-1] > best:
+        best, best_index = db[-1], float(len(db) - 1)
+    inner = np.arange(1, len(db) - 1)
+    peaks = inner[(db[inner] > db[inner - 1]) & (db[inner] >= db[inner + 1])]
+    dy = 0.5 * (db[peaks + 1] - db[peaks - 1])
+    d2y = 2 * db[peaks] - db[peaks - 1] - db[peaks + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offsets = np.where(d2y != 0, dy / d2y, 0.0)
+        values = np.where(d2y != 0, db[peaks] + 0.5 * dy * dy / d2y, db[peaks])
+    if len(peaks) and values.max() > best:
+        i = int(np.argmax(values))
+        best_index = peaks[i] + offsets[i]
+    return frequencies[0] + best_index * step
+
+
+def band_mean_db(frequencies, energy, band):
+    """Mean energy over a band in dB, each bin weighted by how much of its width lies in the band
+    (Praat's Get mean with energy averaging)"""
+
+    step = frequencies[1] - frequencies[0]
+    weights = np.clip(np.minimum(frequencies + step / 2, band[1]) - np.maximum(frequencies - step / 2, band[0]),
+                      0, None)
+    if not np.any(weights):
+        return None
+    return 10 * np.log10(np.sum(energy * weights) / np.sum(weights))
+
+
+def ltas_slope(frequencies, power):
+    """Praat's Ltas Get slope (energy averaging): difference in dB of the mean energy in the high and low bands"""
+
+    ## Ltas values are floored at -300 dB
+    energy = np.maximum(power, np.max(power) * 1e-30)
+    low = band_mean_db(frequencies, energy, slope_low_band)
+    high = band_mean_db(frequencies, energy, slope_high_band)
+    if low is None or high is None:
+        return None
+    return high - low
+
+
+def measure_sibilant(x, sampling_rate):
+    """Measure the middle 50% of a token's samples, as sibilant_jane_optimized.praat does"""
+
+    if len(x) < 2 or not np.any(x):
+        return None
+    filtered = pass_hann_band(x, sampling_rate)
+    frequencies, power = power_spectrum(filtered, sampling_rate)
+    if not np.any(power):
+        return None
+    cog = centre_of_gravity(frequencies, power)
+    db = 10 * np.log10(np.maximum(power, np.max(power) * 1e-30))
+    measures = {'cog': cog, 'spread': spread(frequencies, power, cog),
+                'peak': ltas_peak(frequencies, db), 'slope': ltas_slope(frequencies, power)}
+    return {k: None if v is None else round(float(v), precision) for k, v in measures.items()}
+
+
+def analyze_file(path, segments):
+    """Measure all the segments of one sound file, reading it once"""
+
+    sampling_rate, data = read_sound(path)
+    output = {}
+    for seg in segments:
+        duration = seg.end - seg.begin
+        begin = seg.begin + duration * from_percent
+        end = seg.begin + duration * to_percent
+        output[seg] = measure_sibilant(extract_part(data, sampling_rate, begin, end, seg.channel), sampling_rate)
+    return output
+
+
+def analyze_sibilants(segment_mapping):
+    """Measure a mapping of segments (as from generate_segments), grouping the segments by sound file;
+    returns a dictionary of segments to measures, as analyze_segments does"""
+
+    by_file = {}
+    for seg in segment_mapping:
+        by_file.setdefault(seg.file_path, []).append(seg)
+    output = {}
+    for path, segments in sorted(by_file.items()):
+        output.update(analyze_file(path, segments))
+    return output
+
+
+def compare_measures(reference, output, tolerances=tolerances):
+    """Compare measures of the same segments (e.g. Praat's and this module's), returning the largest
+    difference of each measure and the segments whose differences exceed the tolerances"""
+
+    differences = {m: 0.0 for m in tolerances}
+    failures = []
+    for seg, values in reference.items():
+        other = output.get(seg)
+        if not values or not other:
+            if bool(values) != bool(other):
+                failures.append((seg, 'measured by only one engine'))
+            continue
+        for m, tolerance in tolerances.items():
+            if values.get(m) is None or other.get(m) is None:
+                if values.get(m) != other.get(m):
+                    failures.append((seg, m))
+                continue
+            difference = abs(values[m] - other[m])
+            differences[m] = max(differences[m], difference)
+            if difference > tolerance:
+                failures.append((seg, m))
+    return differences, failures
@@ -0,0 +1,88 @@
+###############################################
+## Memory-mapped store of multitaper spectra ##
+###############################################
+
+## generate_mts_measures.r keeps the spectrum of every token as S1..Sn columns of its data
+## frame and saves them all as one .RData object, which must be held in memory and can only be
+## read from R.  Here spectra are written, as they are computed, to a float32 .npy array
+## (memory-mapped, one row per token) in a directory with the frequency axis of each row and
+## the phone ids, so that single tokens can be read without loading the whole matrix (from
+## Python with SpectraStore, from R with e.g. RcppCNPy or reticulate).
+##
+## Directory layout:
+## - spectra.npy: float32 (tokens, bins), rows zero-padded to the longest spectrum, as in R
+## - bin_widths.npy: float64 (tokens), the bin width of each row (0 for unmeasured tokens)
+## - bin_counts.npy: int32 (tokens), the number of bins of each row
+## - metadata.json: phone ids (in row order), sampling rate, number of tapers and NW
+
+import os
+import json
+
+import numpy as np
+
+
+class SpectraStore(object):
+    def __init__(self, path, mode='r'):
+        """Open a store; `mode` is 'r' to read or 'r+' to write rows"""
+
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, 'metadata.json'), 'r', encoding='utf8') as f:
+            self.metadata = json.load(f)
+        self.phone_ids = self.metadata['phone_ids']
+        self.rows = {phone_id: i for i, phone_id in enumerate(self.phone_ids)}
+        self.spectra = np.load(os.path.join(path, 'spectra.npy'), mmap_mode=mode)
+        self.bin_widths = np.load(os.path.join(path, 'bin_widths.npy'), mmap_mode=mode)
+        self.bin_counts = np.load(os.path.join(path, 'bin_counts.npy'), mmap_mode=mode)
+
+    @classmethod
+    def create(cls, path, rows, bins, phone_ids=None, **metadata):
+        """Create an empty store of `rows` tokens with spectra of at most `bins` values; phone ids
+        not given here are given as rows are written"""
+
+        os.makedirs(path, exist_ok=True)
+        np.lib.format.open_memmap(os.path.join(path, 'spectra.npy'), mode='w+', dtype=np.float32,
+                                  shape=(rows, bins)).flush()
+        np.save(os.path.join(path, 'bin_widths.npy'), np.zeros(rows, dtype=np.float64))
+        np.save(os.path.join(path, 'bin_counts.npy'), np.zeros(rows, dtype=np.int32))
+        metadata['phone_ids'] = list(phone_ids) if phone_ids is not None else [None] * rows
+        with open(os.path.join(path, 'metadata.json'), 'w', encoding='utf8') as f:
+            json.dump(metadata, f)
+        return cls(path, mode='r+')
+
+    def write(self, row, frequencies, values, phone_id=None):
+        count = min(len(values), self.spectra.shape[1])
+        self.spectra[row, :count] = values[:count]
+        self.bin_widths[row] = frequencies[1] - frequencies[0]
+        self.bin_counts[row] = count
+        if phone_id is not None:
+            self.phone_ids[row] = phone_id
+            self.rows[phone_id] = row
+
+    def row(self, row):
+        """Frequencies and values of a row (None for an unmeasured token)"""
+
+        count = int(self.bin_counts[row])
+        if not count:
+            return None
+        return np.arange(count) * float(self.bin_widths[row]), np.asarray(self.spectra[row, :count], dtype=np.float64)
+
+    def get(self, phone_id):
+        """Frequencies and values of a token's spectrum, as rebuildMultitaper gives them"""
+
+        return self.row(self.rows[phone_id])
+
+    def close(self):
+        for array in (self.spectra, self.bin_widths, self.bin_counts):
+            if isinstance(array, np.memmap):
+                array.flush()
+        if self.mode != 'r':
+            with open(os.path.join(self.path, 'metadata.json'), 'w', encoding='utf8') as f:
+                json.dump(self.metadata, f)
+        self.spectra = self.bin_widths = self.bin_counts = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -80,6 +80,7 @@ if __name__ == '__main__':
     parser.add_argument('-r', '--reset', help="Reset the corpus", action='store_true')
     parser.add_argument('-e', '--export_file', help='Path of CSV to export')
     parser.add_argument('-v', '--vot', help='Reset and re-encode VOT', action='store_true',default=False)
+    parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
 
     args = parser.parse_args()
     corpus_name = args.corpus_name
@@ -97,8 +98,11 @@ if __name__ == '__main__':
     corpus_conf = load_config(corpus_name)
 
     print('Processing...')
-    #Connect to local database at 8080
-    with ensure_local_database_running(corpus_name, port=8080, token = common.load_token()) as params:
+    ip = common.server_ip
+    if args.docker:
+        ip = common.docker_ip
+    #Connect to the local database (on the port set by run_all_corpora.py, 8080 by default)
+    with ensure_local_database_running(corpus_name, port=common.server_port, ip=ip, token=common.load_token()) as params:
         #Load corpus context and config info
         config = CorpusConfig(corpus_name, **params)
         config.formant_source = 'praat'
@@ -107,10 +111,7 @@ if __name__ == '__main__':
             with CorpusContext(config) as c:
                 print("Resetting the corpus.")
                 c.reset()
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
         with CorpusContext(config) as g:
 
             #Sets of stops and vowels
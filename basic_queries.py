@@ -47,12 +47,7 @@ if __name__ == '__main__':
         with CorpusContext(config) as c:
             print(c.hierarchy)
         # Common set up
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
 
         common.basic_queries(config)
 
@@ -46,7 +46,7 @@ if __name__ == '__main__':
         with CorpusContext(config) as c:
             print(c.hierarchy)
         # Common set up
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
+        common.prepare_corpus(config, corpus_conf, enrich=False)
 
         common.basic_size_queries(config)
 
@@ -0,0 +1,281 @@
+###################################################
+## SPADE discourse enrichment comparison script ##
+###################################################
+
+## Checks that the discourse encoders (Common/discourse_enrichment.py) give the same
+## pauses, utterances, syllables, stress and count, rate and position properties as PolyglotDB's
+## own encoders, both as the worker pool runs them and as the client engine does.  A small fixture
+## corpus (written here as TextGrids) covers the corner cases of max-onset
+## syllabification: words without a syllabic phone, consonant clusters that fit no
+## onset, vowel hiatus, stress patterns that do not match the number of syllables, and
+## pauses of different lengths.  The fixture is imported three times, enriched once
+## with each set of encoders, and the annotations are compared; the script exits with
+## an error if any differ.
+
+## Input:
+## - none (the fixture is generated in a temporary directory)
+## Output:
+## - differences between the two enrichments, if any
+
+import sys
+import os
+import shutil
+import argparse
+import tempfile
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import common
+import discourse_enrichment
+
+from polyglotdb import CorpusContext
+from polyglotdb.utils import ensure_local_database_running
+from polyglotdb.config import CorpusConfig
+
+## words of the fixture, with their phones and stress patterns: no onset fits the clusters of
+## 'banquet', 'created' and 'rhythm' (no word begins with a vowel, so not even the empty onset),
+## 'hmm' and 'shh' have no syllabic phone, and the patterns of 'hymnal' and 'rhythm' do not
+## have one value per syllable
+fixture_lexicon = {'strong': (['S', 'T', 'R', 'AO1', 'NG'], '1'),
+                   'created': (['K', 'R', 'IY0', 'EY1', 'T', 'IH0', 'D'], '0-1-0'),
+                   'hymnal': (['HH', 'IH1', 'M', 'N', 'AH0', 'L'], '10'),
+                   'banquet': (['B', 'AE1', 'NG', 'K', 'W', 'AH0', 'T'], '1-0'),
+                   'nice': (['N', 'AY1', 'S'], '1'),
+                   'rhythm': (['R', 'IH1', 'DH', 'AH0', 'M'], '1-0-0'),
+                   'hmm': (['HH', 'M'], '1'),
+                   'shh': (['SH'], None)}
+fixture_syllabics = ['AO1', 'IY0', 'EY1', 'IH0', 'IH1', 'AH0', 'AE1', 'AY1']
+fixture_pauses = ['sp', '<SIL>']
+
+## the words of each speaker of each discourse; numbers are silences (in seconds) without a pause word.  Some
+## pauses are too short to end an utterance (alone or, in fixture2, together), so fall within one
+fixture_discourses = {'fixture1': {'A': ['strong', 'created', ('sp', 0.3), 'hymnal', 0.3, 'banquet', ('sp', 0.1),
+                                         'nice', ('<SIL>', 0.5), 'hmm', 'shh', 'rhythm'],
+                                   'B': [0.05, 'nice', ('sp', 0.2), 'strong', ('sp', 0.1), 'created']},
+                      'fixture2': {'A': [('sp', 0.4), 'banquet', 'hymnal', ('sp', 0.2), 'created', ('sp', 0.05),
+                                         ('sp', 0.3), 'strong', ('sp', 0.2)]}}
+phone_duration = 0.07
+min_pause_length = 0.15
+
+
+def fill_tier(intervals, xmax):
+    """Fill the gaps between the intervals of a tier with empty ones"""
+
+    filled = []
+    time = 0
+    for begin, end, label in intervals:
+        if begin > time:
+            filled.append((time, begin, ''))
+        filled.append((begin, end, label))
+        time = end
+    if time < xmax:
+        filled.append((time, xmax, ''))
+    return filled
+
+
+def write_textgrid(path, tiers, xmax):
+    lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', '', 'xmin = 0', 'xmax = {}'.format(xmax),
+             'tiers? <exists>', 'size = {}'.format(len(tiers)), 'item []:']
+    for i, (name, intervals) in enumerate(tiers, 1):
+        filled = fill_tier(intervals, xmax)
+        lines += ['    item [{}]:'.format(i), '        class = "IntervalTier"', '        name = "{}"'.format(name),
+                  '        xmin = 0', '        xmax = {}'.format(xmax), '        intervals: size = {}'.format(len(filled))]
+        for j, (begin, end, label) in enumerate(filled, 1):
+            lines += ['        intervals [{}]:'.format(j), '            xmin = {}'.format(begin),
+                      '            xmax = {}'.format(end), '            text = "{}"'.format(label)]
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_fixture(directory):
+    """Write the fixture discourses as MFA-style TextGrids, with a words and a phones tier per speaker"""
+
+    for discourse, speakers in fixture_discourses.items():
+        tiers = []
+        xmax = 0
+        for speaker, items in sorted(speakers.items()):
+            words = []
+            phones = []
+            time = 0
+            for item in items:
+                if isinstance(item, float):
+                    time = round(time + item, 4)
+                    continue
+                if isinstance(item, tuple):
+                    label, duration = item
+                    end = round(time + duration, 4)
+                    words.append((time, end, label))
+                    phones.append((time, end, 'sp'))
+                    time = end
+                    continue
+                begin = time
+                for phone in fixture_lexicon[item][0]:
+                    end = round(time + phone_duration, 4)
+                    phones.append((time, end, phone))
+                    time = end
+                words.append((begin, time, item))
+            tiers += [('{} - words'.format(speaker), words), ('{} - phones'.format(speaker), phones)]
+            xmax = max(xmax, time)
+        write_textgrid(os.path.join(directory, '{}.TextGrid'.format(discourse)), tiers, round(xmax + 0.5, 4))
+
+
+def serial_enrichment(c):
+    """Enrich the fixture with PolyglotDB's encoders"""
+
+    c.encode_pauses(fixture_pauses)
+    c.encode_utterances(min_pause_length=min_pause_length)
+    c.encode_syllabic_segments(fixture_syllabics)
+    c.encode_syllables('maxonset')
+    c.encode_stress_from_word_property('stresspattern')
+    c.encode_rate('utterance', 'syllable', 'speech_rate')
+    c.encode_count('utterance', 'word', 'num_words')
+    c.encode_count('utterance', 'syllable', 'num_syllables')
+    c.encode_count('word', 'syllable', 'num_syllables')
+    c.encode_position('word', 'syllable', 'position_in_word')
+    c.encode_count('syllable', 'phone', 'num_phones')
+
+
+def pool_encoders(c):
+    """Enrich the fixture with the discourse encoders, as basic_enrichment does with enrichment_workers"""
+
+    discourse_enrichment.prepare_utterance_encoding(c)
+    speakers = c.speakers
+    for discourse in sorted(c.discourses):
+        discourse_enrichment.encode_utterance_stage(c, discourse, fixture_pauses, min_pause_length=min_pause_length,
+                                                    speakers=speakers)
+    discourse_enrichment.finish_utterance_encoding(c, fixture_pauses)
+    c.encode_syllabic_segments(fixture_syllabics)
+    onsets = discourse_enrichment.find_onsets(c, fixture_syllabics)
+    discourse_enrichment.prepare_syllable_encoding(c)
+    for discourse in sorted(c.discourses):
+        discourse_enrichment.encode_syllable_stage(c, discourse, fixture_syllabics, onsets)
+    discourse_enrichment.finish_syllable_encoding(c)
+    for discourse in sorted(c.discourses):
+        discourse_enrichment.encode_discourse_features(c, discourse)
+    c.encode_stress_from_word_property('stresspattern')
+
+
+def client_encoders(c):
+    """Enrich the fixture with the discourse encoders, as basic_enrichment does with the client engine"""
+
+    discourse_enrichment.prepare_utterance_encoding(c)
+    speakers = c.speakers
+    for discourse in sorted(c.discourses):
+        discourse_enrichment.encode_utterance_stage(c, discourse, fixture_pauses, min_pause_length=min_pause_length,
+                                                    speakers=speakers)
+    discourse_enrichment.finish_utterance_encoding(c, fixture_pauses)
+    c.encode_syllabic_segments(fixture_syllabics)
+    onsets = discourse_enrichment.find_onsets(c, fixture_syllabics)
+    discourse_enrichment.prepare_syllable_encoding(c)
+    for discourse in sorted(c.discourses):
+        discourse_enrichment.encode_syllables_and_counts(c, discourse, fixture_syllabics, onsets,
+                                                         stress_source='stresspattern')
+    discourse_enrichment.finish_syllable_encoding(c)
+
+
+## the annotations compared, as rows of values
+comparison_queries = {
+    'pauses': '''MATCH (w:word:{corpus})-[:spoken_in]->(d:Discourse:{corpus}), (w)-[:is_a]->(wt:word_type:{corpus})
+    RETURN d.name AS discourse, w.begin AS begin, w:pause AS pause, w:speech AS speech, wt:pause_type AS pause_type''',
+    'word order': '''MATCH (a:word:{corpus})-[r:precedes|precedes_pause]->(b:word:{corpus}),
+    (a)-[:spoken_in]->(d:Discourse:{corpus})
+    RETURN d.name AS discourse, a.begin AS begin, type(r) AS relationship, b.begin AS next''',
+    'speech times': '''MATCH (d:Discourse:{corpus})
+    RETURN d.name AS discourse, d.speech_begin AS speech_begin, d.speech_end AS speech_end''',
+    'utterances': '''MATCH (u:utterance:{corpus})-[:spoken_in]->(d:Discourse:{corpus}), (u)-[:spoken_by]->(s:Speaker:{corpus})
+    OPTIONAL MATCH (w:word:{corpus})-[:contained_by]->(u)
+    RETURN d.name AS discourse, s.name AS speaker, u.begin AS begin, u.end AS end, collect(w.begin) AS words,
+    size([x IN collect(w) WHERE x:pause]) AS pauses''',
+    'utterance order': '''MATCH (a:utterance:{corpus})-[:precedes]->(b:utterance:{corpus}),
+    (a)-[:spoken_in]->(d:Discourse:{corpus})
+    RETURN d.name AS discourse, a.begin AS begin, b.begin AS next''',
+    'syllables': '''MATCH (s:syllable:{corpus})-[:contained_by]->(w:word:{corpus})-[:spoken_in]->(d:Discourse:{corpus}),
+    (s)-[:spoken_by]->(sp:Speaker:{corpus}), (s)-[:is_a]->(st:syllable_type:{corpus})
+    RETURN d.name AS discourse, sp.name AS speaker, w.begin AS word, s.label AS label, st.label AS type,
+    s.begin AS begin, s.end AS end, s.stress AS stress''',
+    'syllable order': '''MATCH p = (a:syllable:{corpus})-[:precedes*1..]->(b:syllable:{corpus}),
+    (a)-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE (a)-[:contained_by]->(:word:{corpus}) AND (b)-[:contained_by]->(:word:{corpus})
+    AND NONE (x IN nodes(p)[1..-1] WHERE (x)-[:contained_by]->(:word:{corpus}))
+    RETURN d.name AS discourse, a.begin AS begin, b.begin AS next''',
+    'phones': '''MATCH (p:phone:{corpus})-[:spoken_in]->(d:Discourse:{corpus}), (p)-[:is_a]->(pt:phone_type:{corpus})
+    OPTIONAL MATCH (p)-[:contained_by]->(s:syllable:{corpus})
+    RETURN d.name AS discourse, p.begin AS begin, pt.label AS label, p.syllable_position AS position,
+    [x IN labels(p) WHERE x IN ['onset', 'nucleus', 'coda']] AS subsets, s.begin AS syllable''',
+    'utterance counts': '''MATCH (u:utterance:{corpus})-[:spoken_in]->(d:Discourse:{corpus})
+    RETURN d.name AS discourse, u.begin AS begin, u.num_words AS num_words, u.num_syllables AS num_syllables,
+    u.speech_rate AS speech_rate''',
+    'word counts': '''MATCH (w:word:{corpus})-[:spoken_in]->(d:Discourse:{corpus}), (w)-[:spoken_by]->(s:Speaker:{corpus})
+    RETURN d.name AS discourse, s.name AS speaker, w.begin AS begin, w.num_syllables AS num_syllables''',
+    'syllable counts': '''MATCH (s:syllable:{corpus})-[:spoken_in]->(d:Discourse:{corpus}),
+    (s)-[:spoken_by]->(sp:Speaker:{corpus})
+    RETURN d.name AS discourse, sp.name AS speaker, s.begin AS begin, s.position_in_word AS position,
+    s.num_phones AS num_phones''',
+}
+
+
+def fetch_annotations(c):
+    annotations = {}
+    for name, statement in comparison_queries.items():
+        rows = []
+        for r in c.execute_cypher(statement.format(corpus=c.cypher_safe_name)):
+            rows.append(tuple(round(v, 4) if isinstance(v, float) else
+                              tuple(sorted(v, key=str)) if isinstance(v, list) else v for v in r.values()))
+        annotations[name] = sorted(rows, key=str)
+    return annotations
+
+
+def enrich_fixture(corpus_name, fixture_dir, encoders, ip):
+    with ensure_local_database_running(corpus_name, port=common.server_port, ip=ip, token=common.load_token()) as params:
+        config = CorpusConfig(corpus_name, **params)
+        with CorpusContext(config) as c:
+            c.reset()
+            parser = common.get_parser(fixture_dir, 'mfa')
+            c.load(parser, fixture_dir)
+            c.enrich_lexicon({word: {'stresspattern': pattern} for word, (_, pattern) in fixture_lexicon.items()
+                              if pattern is not None}, type_data={'stresspattern': str})
+            encoders(c)
+            annotations = fetch_annotations(c)
+            c.reset()
+    return annotations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
+
+    args = parser.parse_args()
+    ip = common.server_ip
+    if args.docker:
+        ip = common.docker_ip
+
+    fixture_dir = tempfile.mkdtemp()
+    try:
+        write_fixture(fixture_dir)
+        print('Enriching the fixture with the PolyglotDB encoders')
+        expected = enrich_fixture('spade-check-serial', fixture_dir, serial_enrichment, ip)
+        found = {}
+        for engine, encoders in [('pool', pool_encoders), ('client', client_encoders)]:
+            print('Enriching the fixture with the discourse encoders ({} engine)'.format(engine))
+            found[engine] = enrich_fixture('spade-check-{}'.format(engine), fixture_dir, encoders, ip)
+    finally:
+        shutil.rmtree(fixture_dir)
+
+    differences = 0
+    for engine in sorted(found):
+        print('{} engine:'.format(engine))
+        for name in sorted(expected):
+            missing = sorted(set(expected[name]) - set(found[engine][name]), key=str)
+            extra = sorted(set(found[engine][name]) - set(expected[name]), key=str)
+            print('    {:<20}{} rows, {} differ'.format(name, len(expected[name]), len(missing) + len(extra)))
+            for row in missing:
+                print('        only from PolyglotDB: {}'.format(row))
+            for row in extra:
+                print('        only from discourse encoders: {}'.format(row))
+            differences += len(missing) + len(extra)
+    if differences:
+        sys.exit(1)
+    print('The discourse encoders agree with PolyglotDB.')
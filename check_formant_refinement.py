@@ -0,0 +1,184 @@
+###############################################
+## SPADE formant refinement reference check ##
+###############################################
+
+## Checks the formant refinement of Common/formant_refinement.py against PolyglotDB's
+## analyze_formant_points_refinement without a corpus database: synthetic formant candidates
+## of a few vowels (several numbers of formants per token, some with a formant dropped) are
+## generated from fixed seeds, and each vowel is refined both by refine_vowel and by
+## PolyglotDB's selection loop (its get_mean_SD and get_mahalanobis, iterated as in
+## analyze_formant_points_refinement), starting from a prototype file's prototype or from the
+## default candidates.  The script exits with an error if any token's selected candidate
+## differs, or the final prototypes differ by more than the tolerance below.  Some candidates
+## have a parameter not measured; refine_vowel never selects these, so PolyglotDB is given
+## the candidates without them.
+
+## Input:
+## - none (the candidates are generated from fixed seeds)
+## Output:
+## - number of vowels and tokens compared, and those that differ
+
+import sys
+import os
+import math
+import argparse
+
+import numpy as np
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import formant_refinement
+
+from polyglotdb.acoustics.formants.helper import get_mean_SD, get_mahalanobis
+
+## relative tolerance of the final prototype means and covariances
+tolerance = 1e-6
+
+prototype_parameters = formant_refinement.base_formant_columns + ['A1A2diff', 'A2A3diff']
+
+## mean and standard deviation of each prototype parameter of the synthetic vowels
+vowels = {'IY': ([300, 2300, 3000, 60, 120, 200, 8, 6], [40, 150, 200, 15, 30, 50, 3, 3]),
+          'AA': ([750, 1200, 2600, 90, 110, 180, 4, 10], [60, 100, 180, 20, 25, 45, 3, 3]),
+          'UW': ([320, 1100, 2400, 70, 130, 220, 12, 5], [40, 200, 150, 15, 30, 50, 3, 3])}
+candidate_names = [4, 5, 6, 7, '5x1', '6x2']
+
+
+class Token(object):
+    """Stands in for conch's segments, which get_mean_SD reads the vowel label from"""
+
+    def __init__(self, label, number):
+        self.label = label
+        self.number = number
+
+    def __getitem__(self, key):
+        return {'label': self.label}[key]
+
+
+def synthetic_candidates(random, vowel, num_tokens, missing_share):
+    """Candidates of each token: one close to the token's true values (usually the default
+    number of formants), the others further off; a share of the other candidates miss a parameter"""
+
+    means, sds = (np.array(x, dtype=float) for x in vowels[vowel])
+    output = {}
+    for number in range(num_tokens):
+        truth = means + random.standard_normal(len(means)) * sds
+        good = formant_refinement.default_formant if random.uniform() < 0.6 else \
+            candidate_names[random.randint(len(candidate_names))]
+        data = {}
+        for name in candidate_names:
+            spread = 0.2 if name == good else random.uniform(0.5, 2)
+            values = truth + random.standard_normal(len(means)) * sds * spread
+            measurements = dict(zip(prototype_parameters, values.tolist()))
+            if name != good and name != formant_refinement.default_formant and random.uniform() < missing_share:
+                measurements[prototype_parameters[random.randint(len(prototype_parameters))]] = None
+            data[name] = measurements
+        output[Token(vowel, number)] = data
+    return output
+
+
+def polyglotdb_refinement(output, vowel, prototype_metadata, num_iterations):
+    """The selection loop of PolyglotDB's analyze_formant_points_refinement: the selected candidate
+    of each token and the last prototype"""
+
+    prev_prototype_metadata = prototype_metadata
+    best_prototype_metadata = {}
+    for iteration in range(num_iterations):
+        best_numbers = []
+        selected_tracks = {}
+        prototype_means = prev_prototype_metadata[vowel][0]
+        covariance = np.array(prev_prototype_metadata[vowel][1])
+        inverse_covariance = np.linalg.pinv(covariance)
+        best_number = 5
+        for s, data in output.items():
+            best_distance = math.inf
+            best_track = 0
+            for number, point in data.items():
+                point = [point[x] if point[x] else 0 for x in prototype_parameters]
+                distance = get_mahalanobis(prototype_means, point, inverse_covariance)
+                if distance < best_distance:
+                    best_distance = distance
+                    best_track = point
+                    best_number = number
+            selected_tracks[s] = {k: best_track[i] for i, k in enumerate(prototype_parameters)}
+            best_numbers.append(best_number)
+        prototype_metadata = get_mean_SD(selected_tracks, prototype_parameters)
+        prev_prototype_metadata = prototype_metadata
+        best_prototype_metadata.update(prototype_metadata)
+        if iteration > 0:
+            if sum(bn != last_iteration_best_numbers[b_i] for b_i, bn in enumerate(best_numbers)) == 0:
+                break
+        last_iteration_best_numbers = best_numbers
+    return best_numbers, best_prototype_metadata[vowel]
+
+
+def prototype_difference(reference, means, covariance):
+    """Largest difference between two prototypes, relative to the reference's values"""
+
+    difference = 0
+    for expected, value in ((reference[0], means), (reference[1], covariance)):
+        expected = np.array(expected)
+        scale = np.maximum(np.abs(expected), 1)
+        difference = max(difference, float(np.max(np.abs(np.array(value) - expected) / scale)))
+    return difference
+
+
+def compare(output, vowel, from_file, num_iterations):
+    """Refine one vowel both ways; returns the tokens whose selections differ and the prototype difference"""
+
+    complete = {s: {name: m for name, m in data.items() if all(m[p] is not None for p in prototype_parameters)}
+                for s, data in output.items()}
+    if from_file:
+        means, sds = vowels[vowel]
+        prototype_metadata = {vowel: [list(means), np.diag(np.square(sds)).tolist()]}
+    else:
+        prototype_metadata = get_mean_SD({s: data[formant_refinement.default_formant]
+                                          for s, data in complete.items()}, prototype_parameters)
+    reference_numbers, reference_prototype = polyglotdb_refinement(complete, vowel, prototype_metadata,
+                                                                   num_iterations)
+
+    points, names, mask = formant_refinement.candidate_array(output, prototype_parameters)
+    prototype = tuple(np.array(x) for x in prototype_metadata[vowel])
+    best, (means, covariance), stats = formant_refinement.refine_vowel(points, mask, prototype, num_iterations)
+    numbers = [candidates[j] for candidates, j in zip(names, best)]
+    differing = [(s.number, expected, number) for s, expected, number in zip(output, reference_numbers, numbers)
+                 if expected != number]
+    return differing, prototype_difference(reference_prototype, means, covariance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--seeds', help="Number of random seeds to generate candidates from", type=int,
+                        default=5)
+    parser.add_argument('-t', '--tokens', help="Tokens of each vowel", type=int, default=40)
+
+    args = parser.parse_args()
+
+    failures = []
+    compared = 0
+    largest_difference = 0
+    for seed in range(args.seeds):
+        random = np.random.RandomState(seed)
+        for vowel in sorted(vowels):
+            output = synthetic_candidates(random, vowel, args.tokens, missing_share=0.1)
+            for from_file in (True, False):
+                for num_iterations in (1, 3, 20):
+                    differing, difference = compare(output, vowel, from_file, num_iterations)
+                    compared += 1
+                    largest_difference = max(largest_difference, difference)
+                    if differing or difference > tolerance:
+                        failures.append((seed, vowel, from_file, num_iterations, differing, difference))
+
+    print('Compared {} refinements of {} tokens'.format(compared, args.tokens))
+    print('Largest relative prototype difference {:.2e} (tolerance {})'.format(largest_difference, tolerance))
+    for seed, vowel, from_file, num_iterations, differing, difference in failures:
+        print('Differs: seed {} vowel {} ({} prototype, {} iterations): {} selections differ, prototype '
+              'difference {:.2e}'.format(seed, vowel, 'file' if from_file else 'default', num_iterations,
+                                         len(differing), difference))
+        for number, expected, selected in differing:
+            print('    token {}: PolyglotDB selected {}, refine_vowel {}'.format(number, expected, selected))
+    if failures:
+        sys.exit(1)
+    print("The refinement agrees with PolyglotDB's.")
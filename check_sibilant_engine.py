@@ -0,0 +1,97 @@
+#############################################
+## SPADE sibilant engine comparison script ##
+#############################################
+
+## Checks that the NumPy sibilant measures (Common/sibilant_measures.py) agree with
+## those of the Praat script on a corpus, before switching the corpus to
+## `sibilant_engine: numpy`.  Both engines measure the sibilants of the first
+## discourses of the corpus and the largest differences are reported; the script
+## exits with an error if any exceed the tolerances in sibilant_measures.py.
+
+## Input:
+## - corpus name (e.g., Buckeye, SOTC)
+## - corpus metadata (stored in a YAML file)
+## Output:
+## - largest difference of each measure, and the tokens outside the tolerances
+
+import sys
+import os
+import time
+import argparse
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import common
+import sibilant_measures
+
+from polyglotdb import CorpusContext
+from polyglotdb.utils import ensure_local_database_running
+from polyglotdb.config import CorpusConfig
+from polyglotdb.acoustics.segments import generate_segments
+
+from conch import analyze_segments
+from conch.analysis.praat import PraatAnalysisFunction
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus_name', help='Name of the corpus')
+    parser.add_argument('-n', '--num_tokens', help='Minimum number of sibilant tokens to compare', type=int, default=500)
+    parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
+
+    args = parser.parse_args()
+    corpus_name = args.corpus_name
+    docker = args.docker
+    directories = [x for x in os.listdir(base_dir) if os.path.isdir(x) and x != 'Common']
+
+    if args.corpus_name not in directories:
+        print(
+            'The corpus {0} does not have a directory (available: {1}).  Please make it with a {0}.yaml file inside.'.format(
+                args.corpus_name, ', '.join(directories)))
+        sys.exit(1)
+    corpus_conf = common.load_config(corpus_name)
+    print('Processing...')
+
+    # sanity check database access
+    common.check_database(corpus_name)
+
+    ip = common.server_ip
+    if docker:
+        ip = common.docker_ip
+
+    with ensure_local_database_running(corpus_name, port=common.server_port, ip=ip, token=common.load_token()) as params:
+        config = CorpusConfig(corpus_name, **params)
+        common.prepare_corpus(config, corpus_conf)
+
+        with CorpusContext(config) as c:
+            if not c.hierarchy.has_type_subset('phone', 'sibilant'):
+                c.encode_class(corpus_conf['sibilant_segments'], 'sibilant')
+            segment_mapping = generate_segments(c, annotation_type='phone', subset='sibilant', file_type='consonant',
+                                                duration_threshold=0.01).grouped_mapping('discourse')
+            praat_function = PraatAnalysisFunction(common.sibilant_script_path, praat_path=c.config.praat_path)
+
+            praat_output = {}
+            numpy_output = {}
+            praat_time = numpy_time = 0
+            for discourse, discourse_mapping in sorted(segment_mapping.items()):
+                if len(praat_output) >= args.num_tokens:
+                    break
+                beg = time.time()
+                praat_output.update(analyze_segments(discourse_mapping, praat_function))
+                praat_time += time.time() - beg
+                beg = time.time()
+                numpy_output.update(sibilant_measures.analyze_sibilants(discourse_mapping))
+                numpy_time += time.time() - beg
+
+    differences, failures = sibilant_measures.compare_measures(praat_output, numpy_output)
+    print('Compared {} tokens (Praat: {:.1f} s, NumPy: {:.1f} s)'.format(len(praat_output), praat_time, numpy_time))
+    for measure, difference in sorted(differences.items()):
+        print('{:<8}largest difference {:.4f} (tolerance {})'.format(
+            measure, difference, sibilant_measures.tolerances[measure]))
+    for seg, measure in failures:
+        print('Outside tolerance: {} {:.3f}-{:.3f} ({})'.format(seg.file_path, seg.begin, seg.end, measure))
+    if failures:
+        sys.exit(1)
+    print('The NumPy engine agrees with the Praat script.')
@@ -0,0 +1,161 @@
+###########################################
+## SPADE sibilant engine reference check ##
+###########################################
+
+## Checks the NumPy sibilant measures (Common/sibilant_measures.py) without Praat or a
+## corpus database: a few synthetic sound files (fricative-like noise of different
+## spectral shapes, at different sampling rates, sample formats and channels) are
+## generated from fixed seeds, their tokens are measured with the NumPy engine, and the
+## measures are compared with those sibilant_jane_optimized.praat gave for the same
+## tokens, stored in Common/sibilant_praat_reference.csv.  The script exits with an
+## error if any differ by more than the tolerances in sibilant_measures.py.
+## `-r` measures the tokens with Praat instead and rewrites the stored measures (e.g.
+## after the synthetic sounds or the Praat script change).
+
+## Input:
+## - none (the sound files are generated in a temporary directory)
+## Output:
+## - largest difference of each measure, and the tokens outside the tolerances
+
+import sys
+import os
+import csv
+import shutil
+import argparse
+import tempfile
+import subprocess
+from collections import namedtuple
+
+import numpy as np
+from scipy.io import wavfile
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import sibilant_measures
+
+sibilant_script_path = os.path.join(script_dir, 'sibilant_jane_optimized.praat')
+reference_path = os.path.join(script_dir, 'sibilant_praat_reference.csv')
+
+## tokens have the attributes analyze_sibilants uses from generate_segments' segments
+Token = namedtuple('Token', ['file_path', 'begin', 'end', 'channel'])
+
+## the synthetic sounds: sampling rate, sample type, and for each channel the spectral shape of each
+## 0.3 s stretch of noise, as (centre frequency, bandwidth) of a Gaussian bump, or None for flat noise
+stretch_duration = 0.3
+synthetic_sounds = {'fricatives_16k.wav': (16000, np.int16, [[(3500, 800), (6000, 1200), None, (2500, 400)]]),
+                    'fricatives_22k_int32.wav': (22050, np.int32, [[(7000, 1500), (4000, 600), (5000, 3000), None]]),
+                    'fricatives_44k_stereo.wav': (44100, np.int16, [[(6500, 1000), None, (3200, 500), (9000, 2000)],
+                                                                    [(4500, 700), (8000, 1500), None, (3000, 300)]])}
+
+
+def shaped_noise(random, sampling_rate, shape):
+    n = int(round(stretch_duration * sampling_rate))
+    spectrum = np.fft.rfft(random.standard_normal(n))
+    if shape is not None:
+        centre, bandwidth = shape
+        frequencies = np.fft.rfftfreq(n, 1 / sampling_rate)
+        spectrum *= np.exp(-0.5 * ((frequencies - centre) / bandwidth) ** 2) + 0.01
+    x = np.fft.irfft(spectrum, n)
+    return 0.3 * x / np.max(np.abs(x))
+
+
+def write_sounds(directory):
+    """Write the synthetic sounds and return the tokens to measure in them"""
+
+    tokens = []
+    for i, (name, (sampling_rate, sample_type, channels)) in enumerate(sorted(synthetic_sounds.items())):
+        random = np.random.RandomState(i)
+        data = np.stack([np.concatenate([shaped_noise(random, sampling_rate, shape) for shape in shapes])
+                         for shapes in channels], axis=1)
+        scale = np.iinfo(sample_type).max
+        path = os.path.join(directory, name)
+        wavfile.write(path, sampling_rate, np.round(data * scale).astype(sample_type))
+        num_stretches = len(channels[0])
+        for channel in range(len(channels)):
+            for j in range(num_stretches):
+                begin = j * stretch_duration
+                ## a whole stretch, a short token within it, and a token across the next boundary
+                tokens.append(Token(path, round(begin + 0.05, 4), round(begin + 0.25, 4), channel))
+                tokens.append(Token(path, round(begin + 0.1, 4), round(begin + 0.13, 4), channel))
+                if j < num_stretches - 1:
+                    tokens.append(Token(path, round(begin + 0.2, 4), round(begin + 0.4, 4), channel))
+    return tokens
+
+
+def measure_with_praat(tokens, praat_path):
+    """Measure the tokens with the Praat script, as analyze_segments does"""
+
+    output = {}
+    for token in tokens:
+        result = subprocess.run([praat_path, '--run', sibilant_script_path, token.file_path, str(token.begin),
+                                 str(token.end), str(token.channel), '0'],
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        names, values = result.stdout.strip().splitlines()[-2:]
+        output[token] = {name: None if value == '--undefined--' else float(value)
+                         for name, value in zip(names.split(), values.split())}
+    return output
+
+
+def token_key(token):
+    return os.path.basename(token.file_path), token.begin, token.end, token.channel
+
+
+def save_reference(measures):
+    with open(reference_path, 'w', encoding='utf8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'begin', 'end', 'channel', 'cog', 'spread', 'peak', 'slope'])
+        for token, values in sorted(measures.items(), key=lambda x: token_key(x[0])):
+            writer.writerow(list(token_key(token)) + [values[m] for m in ['cog', 'spread', 'peak', 'slope']])
+
+
+def load_reference(tokens):
+    by_key = {token_key(t): t for t in tokens}
+    reference = {}
+    with open(reference_path, 'r', encoding='utf8', newline='') as f:
+        for row in csv.DictReader(f):
+            key = (row['file'], float(row['begin']), float(row['end']), int(row['channel']))
+            if key not in by_key:
+                continue
+            reference[by_key[key]] = {m: None if row[m] == '' else float(row[m])
+                                      for m in ['cog', 'spread', 'peak', 'slope']}
+    return reference
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--record', help="Measure the tokens with Praat and store the measures",
+                        action='store_true')
+    parser.add_argument('-p', '--praat', help="Path to the Praat executable (used with -r)", default='praat')
+
+    args = parser.parse_args()
+
+    sound_dir = tempfile.mkdtemp()
+    try:
+        tokens = write_sounds(sound_dir)
+        if args.record:
+            save_reference(measure_with_praat(tokens, args.praat))
+            print('Stored the Praat measures of {} tokens in {}'.format(len(tokens), reference_path))
+            sys.exit(0)
+        reference = load_reference(tokens)
+        numpy_output = sibilant_measures.analyze_sibilants(tokens)
+    finally:
+        shutil.rmtree(sound_dir)
+
+    if len(reference) != len(tokens):
+        print('The stored measures cover {} of the {} tokens; rerun with -r to record them.'.format(
+            len(reference), len(tokens)))
+        sys.exit(1)
+    differences, failures = sibilant_measures.compare_measures(reference, numpy_output)
+    print('Compared {} tokens'.format(len(reference)))
+    for measure, difference in sorted(differences.items()):
+        print('{:<8}largest difference {:.4f} (tolerance {})'.format(
+            measure, difference, sibilant_measures.tolerances[measure]))
+    for token, measure in failures:
+        print('Outside tolerance: {} {:.3f}-{:.3f} channel {} ({})'.format(
+            os.path.basename(token.file_path), token.begin, token.end, token.channel, measure))
+    if failures:
+        sys.exit(1)
+    print('The NumPy engine agrees with the stored Praat measures.')
@@ -192,12 +192,7 @@ if __name__ == '__main__':
         # Common set up
         ## Check if the corpus already exists as a database: if not, import the audio and
         ## transcripts and store in graph format
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        ## Add information to the corpus regarding lexical, speaker, and linguistic information
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
 
         ## Call the duration export function, as defined above
         duration_export(config, corpus_name, corpus_conf['corpus_directory'], corpus_conf['dialect_code'], corpus_conf['speakers'], corpus_conf['vowel_inventory'], stressed_vowels=stressed_vowels, baseline = baseline, ignored_speakers=ignored_speakers)
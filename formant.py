@@ -74,13 +74,7 @@ if __name__ == '__main__':
         ## Common set up: see commony.py for details of these functions ##
         ## Check if the corpus already has an associated graph object; if not,
         ## perform importing and parsing of the corpus files
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        ## Perform linguistic, speaker, and acoustic enrichment
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
 
         ## Check if the YAML specifies the path to the YAML file
         ## if not, load the prototypes file from the default location
@@ -98,7 +92,9 @@ if __name__ == '__main__':
 
         ## Perform formant estimation and analysis
         ## see common.py for the details of this implementation
-        common.formant_acoustic_analysis(config, vowels_to_analyze, vowel_prototypes_path, drop_formant=drop_formant, reset_formants=reset_formants)
+        common.formant_acoustic_analysis(config, vowels_to_analyze, vowel_prototypes_path, drop_formant=drop_formant, reset_formants=reset_formants,
+                                         workers=corpus_conf.get('formant_workers', 1),
+                                         convergence=corpus_conf.get('formant_convergence'))
 
         ## Output the query (determined in common.py) as a CSV file
         common.formant_export(config, corpus_name, corpus_conf['dialect_code'],
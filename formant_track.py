@@ -40,7 +40,7 @@ from polyglotdb import CorpusContext
 from polyglotdb.utils import ensure_local_database_running
 from polyglotdb import CorpusConfig
 
-def formant_track_export(config, corpus_name, corpus_directory, dialect_code, speakers, vowel_inventory, vowel_prototypes_path, reset_formants, vowel_subset, ignored_speakers = None):
+def formant_track_export(config, corpus_name, corpus_directory, dialect_code, speakers, vowel_inventory, vowel_prototypes_path, reset_formants, vowel_subset, ignored_speakers = None, formant_workers = 1, formant_convergence = None):
     ## Main function for processing and generating formant tracks
 
     ## Determine which vowels to apply over:
@@ -97,7 +97,8 @@ def formant_track_export(config, corpus_name, corpus_directory, dialect_code, sp
     ## Perform acoustic analysis on the defined subset, enriching the corpus
     ## with 21-point formant tracks for the tokens in the subset.
     ## See common.py for the details of this function.
-    common.formant_acoustic_analysis(config, None, vowel_prototypes_path, drop_formant = drop_formant, output_tracks = True, subset="unisyn_subset")
+    common.formant_acoustic_analysis(config, None, vowel_prototypes_path, drop_formant = drop_formant, output_tracks = True, subset="unisyn_subset",
+                                     workers = formant_workers, convergence = formant_convergence)
 
     with CorpusContext(config) as c:
         print('Beginning formant export')
@@ -219,13 +220,7 @@ if __name__ == '__main__':
         # Common set up
         ## Check whether the corpus has already been imported (i.e., has a database file);
         ## if not, import the corpus using the audio and transcript files
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        ## Add lexical, speaker, and linguistic/acoustic enrichments to the database
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
 
         ## Check if the YAML contains a path to the vowel prototypes file;
         ## if not, use the default path (inside the corpus directory)
@@ -236,5 +231,7 @@ if __name__ == '__main__':
         ## Call formant track function defined above
         formant_track_export(config, corpus_name, corpus_conf['corpus_directory'], corpus_conf['dialect_code'],
                             corpus_conf['speakers'], corpus_conf['vowel_inventory'], vowel_prototypes_path = vowel_prototypes_path,
-                            reset_formants = reset_formants, vowel_subset = vowel_subset, ignored_speakers = ignored_speakers)
+                            reset_formants = reset_formants, vowel_subset = vowel_subset, ignored_speakers = ignored_speakers,
+                            formant_workers = corpus_conf.get('formant_workers', 1),
+                            formant_convergence = corpus_conf.get('formant_convergence'))
         print('Finishing up!')
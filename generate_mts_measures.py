@@ -0,0 +1,113 @@
+######################################
+## SPADE multitaper sibilant script ##
+######################################
+
+## Python version of generate_mts_measures.r, taking the same arguments: measures the
+## multitaper spectra of the sibilants in a *_sibilants.csv file (as written by
+## sibilant_export) and writes them to <corpus>_mts_sibilants.csv in the output directory.
+## The measures are computed by Common/multitaper_measures.py.
+
+## Input:
+## - CSV file of sibilants (phone_begin, phone_end, and discourse, speaker, sound_file_name
+##   or recording columns to find the sound files)
+## - top-level directory of the sound files
+## Output:
+## - the CSV file with the spectral_* measures added
+## - the spectra of the tokens, in <corpus>_all_multitapers/ (see Common/spectra_store.py)
+
+import sys
+import os
+import re
+import csv
+import time
+import argparse
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import multitaper_measures
+from spectra_store import SpectraStore
+
+
+def sound_file_path(row, sound_dir, directories=False, speakers=False):
+    """Path of a token's sound file, found as the R script's get_file_path does"""
+
+    if speakers:
+        sound_file = row['speaker'] + '.wav'
+    elif 'sound_file_name' in row:
+        sound_file = row['sound_file_name'].replace('.WAV', '') + '.wav'
+    elif 'recording' in row:
+        sound_file = row['recording'] + '.wav'
+    else:
+        sound_file = row['discourse'] + '.wav'
+    sound_file = sound_file.replace('.wav.wav', '.wav')
+    if directories:
+        return os.path.join(sound_dir, row['speaker'], sound_file)
+    return os.path.join(sound_dir, sound_file)
+
+
+def format_measure(value):
+    return 'NA' if value is None else value
+
+
+def generate_mts_measures(input_file, sound_dir, output_dir, directories=False, numbers=False, speakers=False,
+                          workers=1):
+    corpus_name = re.search(r'([A-Za-z0-9_-]*)_sibilants\.csv', input_file).group(1)
+    print('File: {}'.format(input_file))
+    print('Corpus name: {}'.format(corpus_name))
+    beg = time.time()
+    with open(input_file, 'r', encoding='utf8', newline='') as f:
+        reader = csv.DictReader(f)
+        fieldnames = [x for x in reader.fieldnames if x not in multitaper_measures.measure_names]
+        rows = list(reader)
+    if numbers:
+        for row in rows:
+            row['discourse'] = '{:03d}'.format(int(row['discourse']))
+
+    ## tokens whose sound files are missing are left unmeasured, as in the R script
+    tokens = []
+    measured_rows = []
+    for row in rows:
+        path = sound_file_path(row, sound_dir, directories, speakers)
+        if os.path.exists(path):
+            tokens.append((path, float(row['phone_begin']), float(row['phone_end'])))
+            measured_rows.append(row)
+    ## spectra are kept in a store indexed by phone id (or by row, without a phone_id column)
+    phone_ids = [row.get('phone_id', str(i)) for i, row in enumerate(measured_rows)]
+    store_path = os.path.join(output_dir, '{}_all_multitapers'.format(corpus_name))
+    with SpectraStore.create(store_path, len(phone_ids), multitaper_measures.spectrum_bins, phone_ids,
+                             sampling_rate=multitaper_measures.sampling_rate, k=multitaper_measures.taper_count,
+                             nw=multitaper_measures.time_bandwidth) as store:
+        output = multitaper_measures.measure_tokens(tokens, workers, store)
+    for row, values in zip(measured_rows, output):
+        if values is not None:
+            row.update(values)
+
+    output_path = os.path.join(output_dir, '{}_mts_sibilants.csv'.format(corpus_name))
+    with open(output_path, 'w', encoding='utf8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames + multitaper_measures.measure_names, restval='NA')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: format_measure(v) for k, v in row.items()})
+    print('Measured {} of {} tokens in {:.1f} seconds'.format(sum(x is not None for x in output), len(rows),
+                                                              time.time() - beg))
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate multitaper sibilant measurements')
+    parser.add_argument('input_file', help='CSV file containing sibilants observations to measure')
+    parser.add_argument('sound_dir', help='Path to the top-level directory containg the audio files')
+    parser.add_argument('output_dir', help='Directory to write the mts-measured CSV file')
+    parser.add_argument('-d', '--directories', help='The audio file contains speaker-level subdirectories',
+                        action='store_true')
+    parser.add_argument('-n', '--numbers', help='Speaker names are defined with numbers (integers) instead of letters',
+                        action='store_true')
+    parser.add_argument('-s', '--speakers', help='Use speaker codes for audio file names', action='store_true')
+    parser.add_argument('-w', '--workers', help='Number of processes measuring sound files at once', type=int,
+                        default=os.cpu_count())
+    args = parser.parse_args()
+    generate_mts_measures(args.input_file, args.sound_dir, args.output_dir, args.directories, args.numbers,
+                          args.speakers, args.workers)
@@ -0,0 +1,188 @@
+####################################
+## SPADE multiple analysis script ##
+####################################
+
+## Runs several SPADE analyses (formants, sibilants, duration, SVLR, utterances)
+## on one corpus in a single database session. The import and enrichment shared
+## by the individual scripts is done once, acoustic analyses are then run one
+## after another, and the exports (which need no further acoustic measurement)
+## are run concurrently, except those that also write to the database, which are
+## run one at a time first.  The script exits with an error if any export failed.
+
+## Input:
+## - corpus name (e.g., Buckeye, SOTC)
+## - list of analyses to run
+## - corpus metadata (stored in a YAML file)
+## Output:
+## - the CSV files written by each of the individual analysis scripts
+
+import sys
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import common
+
+from duration import duration_export
+from svlr import svlr_export
+from utterances import utterance_export
+
+from polyglotdb.utils import ensure_local_database_running
+from polyglotdb.config import CorpusConfig
+
+## analyses in the order they should be run
+stage_names = ['formant', 'sibilant', 'duration', 'svlr', 'utterances']
+
+
+def get_vowels_to_analyze(corpus_conf):
+    if corpus_conf['stressed_vowels']:
+        return corpus_conf['stressed_vowels']
+    return corpus_conf['vowel_inventory']
+
+
+def formant_analysis(config, corpus_name, corpus_conf, options):
+    ## As in formant.py: load the prototypes from the corpus directory if the
+    ## YAML does not give their path
+    vowel_prototypes_path = corpus_conf.get('vowel_prototypes_path', '')
+    if not vowel_prototypes_path:
+        vowel_prototypes_path = os.path.join(base_dir, corpus_name, '{}_prototypes.csv'.format(corpus_name))
+    common.formant_acoustic_analysis(config, get_vowels_to_analyze(corpus_conf), vowel_prototypes_path,
+                                     drop_formant=True, reset_formants=options.formant_reset,
+                                     workers=corpus_conf.get('formant_workers', 1),
+                                     convergence=corpus_conf.get('formant_convergence'))
+
+
+def sibilant_analysis(config, corpus_name, corpus_conf, options):
+    common.sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'],
+                                      ignored_speakers=corpus_conf.get('ignore_speakers', []),
+                                      engine=corpus_conf.get('sibilant_engine', 'praat'))
+
+
+def formant_stage_export(config, corpus_name, corpus_conf, options):
+    common.formant_export(config, corpus_name, corpus_conf['dialect_code'], corpus_conf['speakers'],
+                          get_vowels_to_analyze(corpus_conf), output_tracks=False)
+
+
+def sibilant_stage_export(config, corpus_name, corpus_conf, options):
+    common.sibilant_export(config, corpus_name, corpus_conf['dialect_code'], corpus_conf.get('speakers', []),
+                           ignored_speakers=corpus_conf.get('ignore_speakers', []),
+                           multitaper=corpus_conf.get('multitaper_measures', False))
+
+
+def duration_stage_export(config, corpus_name, corpus_conf, options):
+    duration_export(config, corpus_name, corpus_conf['corpus_directory'], corpus_conf['dialect_code'],
+                    corpus_conf['speakers'], corpus_conf['vowel_inventory'],
+                    stressed_vowels=corpus_conf.get('stressed_vowels', []), baseline=options.baseline,
+                    ignored_speakers=corpus_conf.get('ignore_speakers', []))
+
+
+def svlr_stage_export(config, corpus_name, corpus_conf, options):
+    svlr_export(config, corpus_name, corpus_conf['corpus_directory'], corpus_conf['dialect_code'],
+                corpus_conf['speakers'], corpus_conf['vowel_inventory'],
+                stressed_vowels=corpus_conf.get('stressed_vowels', []), baseline=options.baseline,
+                ignored_speakers=corpus_conf.get('ignore_speakers', []))
+
+
+def utterance_stage_export(config, corpus_name, corpus_conf, options):
+    utterance_export(config, corpus_name, corpus_conf['corpus_directory'], corpus_conf['dialect_code'],
+                     corpus_conf['speakers'], ignored_speakers=corpus_conf.get('ignore_speakers', []))
+
+
+## acoustic measurements each stage needs before it can be exported
+acoustic_stages = {'formant': formant_analysis,
+                   'sibilant': sibilant_analysis}
+
+export_stages = {'formant': formant_stage_export,
+                 'sibilant': sibilant_stage_export,
+                 'duration': duration_stage_export,
+                 'svlr': svlr_stage_export,
+                 'utterances': utterance_stage_export}
+
+## exports that enrich the database before querying it (the Buckeye vowel-obstruent lexicon and
+## the baseline durations), which would race each other if run at once
+writing_exports = ['duration', 'svlr']
+
+
+def run_stages(config, corpus_name, corpus_conf, stages, options):
+    """Run the acoustic analyses of the chosen stages in turn, then their exports (those that write to
+    the database one at a time, the others concurrently), returning the stages whose export failed"""
+
+    for stage in stages:
+        if stage in acoustic_stages:
+            print('Running {} analysis'.format(stage))
+            acoustic_stages[stage](config, corpus_name, corpus_conf, options)
+
+    failed = []
+    for stage in stages:
+        if stage in writing_exports:
+            print('Exporting {}'.format(stage))
+            try:
+                export_stages[stage](config, corpus_name, corpus_conf, options)
+            except Exception as e:
+                print('{} export failed: {}'.format(stage, e))
+                failed.append(stage)
+
+    concurrent = [x for x in stages if x not in writing_exports]
+    if concurrent:
+        print('Exporting {}'.format(', '.join(concurrent)))
+    with ThreadPoolExecutor(max_workers=options.workers) as executor:
+        futures = {stage: executor.submit(export_stages[stage], config, corpus_name, corpus_conf, options)
+                   for stage in concurrent}
+    for stage, future in futures.items():
+        if future.exception() is not None:
+            print('{} export failed: {}'.format(stage, future.exception()))
+            failed.append(stage)
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus_name', help='Name of the corpus')
+    parser.add_argument('stages', nargs='+', choices=stage_names, help='Analyses to run')
+    parser.add_argument('-r', '--reset', help="Reset the corpus", action='store_true')
+    parser.add_argument('-f', '--formant_reset', help="Reset formant measures", action='store_true', default=False)
+    parser.add_argument('-b', '--baseline', help='Calculate baseline duration', action='store_true')
+    parser.add_argument('-w', '--workers', help='Number of exports to run at once', type=int, default=len(stage_names))
+    parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
+
+    args = parser.parse_args()
+    corpus_name = args.corpus_name
+    reset = args.reset
+    docker = args.docker
+    stages = [x for x in stage_names if x in args.stages]
+    directories = [x for x in os.listdir(base_dir) if os.path.isdir(x) and x != 'Common']
+
+    if args.corpus_name not in directories:
+        print(
+            'The corpus {0} does not have a directory (available: {1}).  Please make it with a {0}.yaml file inside.'.format(
+                args.corpus_name, ', '.join(directories)))
+        sys.exit(1)
+    corpus_conf = common.load_config(corpus_name)
+    print('Processing...')
+
+    # sanity check database access
+    common.check_database(corpus_name)
+
+    if reset:
+        common.reset(corpus_name)
+    ip = common.server_ip
+    if docker:
+        ip = common.docker_ip
+
+    with ensure_local_database_running(corpus_name, port=common.server_port, ip=ip, token=common.load_token()) as params:
+        config = CorpusConfig(corpus_name, **params)
+        config.formant_source = 'praat'
+
+        ## Common set up, done once for all stages: see common.py for details
+        common.prepare_corpus(config, corpus_conf)
+
+        failed = run_stages(config, corpus_name, corpus_conf, stages, args)
+        print('Finishing up!')
+    if failed:
+        print('Failed exports: {}'.format(', '.join(failed)))
+        sys.exit(1)
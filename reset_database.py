@@ -17,6 +17,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('corpus_name', help='Name of the corpus')
     parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
+    parser.add_argument('-R', '--restore', help="Restore the imported and enriched snapshot of the corpus "
+                                                "instead of deleting it, if one exists", action='store_true')
 
     args = parser.parse_args()
     corpus_name = args.corpus_name
@@ -33,5 +35,7 @@ if __name__ == '__main__':
     if docker:
         ip = common.docker_ip
     print('Processing...')
-    client = PGDBClient('http://{}:{}'.format(ip, 8080), token=token)
+    if args.restore and common.restore_snapshot(corpus_name, corpus_conf, ip=ip):
+        sys.exit(0)
+    client = PGDBClient('http://{}:{}'.format(ip, common.server_port), token=token)
     client.delete_database(corpus_name)
@@ -32,7 +32,7 @@ from polyglotdb import CorpusContext
 from polyglotdb.utils import ensure_local_database_running
 from polyglotdb import CorpusConfig
 
-def rhotics_export(config, corpus_name, corpus_directory, dialect_code, speakers, vowel_prototypes_path, reset_formants, ignored_speakers=None):
+def rhotics_export(config, corpus_name, corpus_directory, dialect_code, speakers, vowel_prototypes_path, reset_formants, ignored_speakers=None, formant_workers=1, formant_convergence=None):
     csv_path = os.path.join(base_dir, corpus_name, '{}_rhotics.csv'.format(corpus_name))
     '''
     Main function for processing rhotics. Takes in corpus information and returns
@@ -82,7 +82,8 @@ def rhotics_export(config, corpus_name, corpus_directory, dialect_code, speakers
 
     ## perform formant tracking
     ## see common.py for how this is implemented
-    common.formant_acoustic_analysis(config, None, vowel_prototypes_path, drop_formant = drop_formant, output_tracks = True, subset="unisyn_subset")
+    common.formant_acoustic_analysis(config, None, vowel_prototypes_path, drop_formant = drop_formant, output_tracks = True, subset="unisyn_subset",
+                                     workers=formant_workers, convergence=formant_convergence)
 
     with CorpusContext(config) as c:
         ## since the subsetting for measuring tokens
@@ -204,10 +205,7 @@ if __name__ == '__main__':
        
         ## add basic enrichments for the corpus, such as syllables, utterances,
         ## lexical and speaker information
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
 
         ## check for the presence of vowel prototypes:
         ## this is not actively used for detecting formants,
@@ -220,5 +218,7 @@ if __name__ == '__main__':
         ## call above-defined formant function
         ## and write export CSV file
         rhotics_export(config, corpus_name, corpus_conf['corpus_directory'], corpus_conf['dialect_code'],
-                              corpus_conf['speakers'], vowel_prototypes_path = vowel_prototypes_path, reset_formants = reset_formants, ignored_speakers=ignored_speakers)
+                              corpus_conf['speakers'], vowel_prototypes_path = vowel_prototypes_path, reset_formants = reset_formants, ignored_speakers=ignored_speakers,
+                              formant_workers=corpus_conf.get('formant_workers', 1),
+                              formant_convergence=corpus_conf.get('formant_convergence'))
         print('Finishing up!')
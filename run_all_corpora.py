@@ -1,47 +1,143 @@
 import os
+import sys
+import datetime
+import time
+import queue
 import argparse
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 parser = argparse.ArgumentParser()
 parser.add_argument("corpusdir", help = "Path to the directory containing corpus directories")
 parser.add_argument("script", help = "name of the script to be run")
+parser.add_argument("-j", "--workers", help = "Number of corpora to process at once", type = int, default = 1)
+parser.add_argument("-p", "--base_port", help = "Server port of the first worker; worker i uses base_port + i "
+                                               "(default: every worker uses the same server)", type = int, default = None)
+parser.add_argument("-m", "--max_memory", help = "Memory cap (in GB) for each worker's processes", type = float, default = None)
+parser.add_argument("-S", "--snapshots", help = "Reset corpora by restoring a snapshot of the imported and enriched "
+                                               "database (made on first use) instead of re-importing", action = "store_true")
+parser.add_argument("-c", "--cpus", help = "Number of CPU cores each worker is pinned to", type = int, default = None)
+parser.add_argument("-o", "--ordered", help = "Start corpora in alphabetical order instead of longest predicted "
+                                             "runtime first", action = "store_true")
 args = parser.parse_args()
 
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(base_dir, 'Common'))
+
 ## lists of corpora to skip
 ## and failed to run
 skipped = ['spade-Penn-Neighborhood']
 failed = []
 
 ## first check that the script exists
-assert(os.path.isfile(args.script), "{} should be a script that exists".format(args.script))
+assert os.path.isfile(args.script), "{} should be a script that exists".format(args.script)
 
 ## get the corpora from the directory
 corpora = [f for f in sorted(os.listdir(args.corpusdir)) if f.startswith("spade-")]
 
+def worker_limits(slot):
+    """Build the function applied to each child process of a worker: caps the address space
+       and pins the process to the worker's own block of cores (Linux only)"""
+
+    def apply_limits():
+        if args.max_memory is not None:
+            import resource
+            limit = int(args.max_memory * 1024 ** 3)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if args.cpus is not None and hasattr(os, 'sched_setaffinity'):
+            n_cores = os.cpu_count()
+            cores = {(slot * args.cpus + i) % n_cores for i in range(args.cpus)}
+            os.sched_setaffinity(0, cores)
+    return apply_limits
+
+def worker_env(slot):
+    """Environment for a worker's processes: its own server port and thread count"""
+    env = os.environ.copy()
+    if args.base_port is not None:
+        env['SPADE_SERVER_PORT'] = str(args.base_port + slot)
+    if args.cpus is not None:
+        env['OMP_NUM_THREADS'] = str(args.cpus)
+    return env
+
+def run_corpus(corpus, slot):
+    """Reset the corpus, run the script on it and reset it again, returning the
+       exit status and wall time of the run"""
+    call_args = {'env': worker_env(slot)}
+    if sys.platform.startswith('linux'):
+        call_args['preexec_fn'] = worker_limits(slot)
+    print("Processing {} (worker {})".format(corpus, slot))
+    beg = time.time()
+    try:
+        ## first reset the corpus, either from its snapshot (created here if missing)
+        ## or by deleting it so that the script imports it again
+        if args.snapshots:
+            subprocess.call(['python', 'snapshot_database.py', corpus], **call_args)
+            subprocess.call(['python', 'reset_database.py', corpus, '-R'], **call_args)
+        else:
+            subprocess.call(['python', 'reset_database.py', corpus], **call_args)
+
+        ## run the script on the corpus
+        status = subprocess.call(['python', args.script, corpus, "-s"], **call_args)
+
+        ## reset corpus afterwards to save memory
+        subprocess.call(['python', 'reset_database.py', corpus], **call_args)
+    except Exception as e:
+        print("Error processing {}: {}".format(corpus, e))
+        status = None
+    return {'corpus': corpus, 'status': status, 'time': time.time() - beg}
+
+def run_pool(to_run):
+    """Run corpora across the worker pool, handing each job a free worker slot"""
+    slots = queue.Queue()
+    for i in range(args.workers):
+        slots.put(i)
+
+    def job(corpus):
+        slot = slots.get()
+        try:
+            return run_corpus(corpus, slot)
+        finally:
+            slots.put(slot)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        return list(executor.map(job, to_run))
+
 ## loop through corpus files
+to_run = []
 for corpus in corpora:
     ## check if the file is actually a directory since that is the expected format for the
     ## analysis scripts
-    if os.path.isdir(corpus):
+    if os.path.isdir(os.path.join(args.corpusdir, corpus)):
         if corpus in skipped:
             print("Skipping {}".format(corpus))
             continue
-        try:
-            print("Processing {}".format(corpus))
-            ## first reset the corpus
-            subprocess.call(['python', 'reset_database.py', corpus])
+        to_run.append(corpus)
 
-            ## run the script on the corpus
-            subprocess.call(['python', args.script, corpus, "-s"])
+## start the corpora predicted (from benchmarks/benchmarks.csv) to take longest first,
+## so that large corpora do not hold up the end of the batch
+if not args.ordered:
+    import common
+    stages = common.script_stages.get(os.path.basename(args.script))
+    if stages is None:
+        print("No stage list for {}, predicting the runtime of import and enrichment only".format(args.script))
+        stages = common.preparation_stages
+    predictions = common.predict_runtimes(to_run, stages)
+    to_run, makespan = common.schedule_longest_first(predictions, args.workers)
+    print("{} of {} corpora have benchmark history".format(
+        sum(1 for x in predictions.values() if x is not None), len(to_run)))
+    print("Estimated makespan: {}".format(datetime.timedelta(seconds=round(makespan))))
 
-            ## reset corpus afterwards to save memory
-            try:
-                subprocess.call(['python', 'reset_database.py', corpus])
-            except:
-                continue
+beg = time.time()
+results = run_pool(to_run)
+total_time = time.time() - beg
 
-        except:
-            failed.append(corpus)
-            continue
+## summarise the runs
 print("Complete!")
-print("Following corpora were not run: {}", failed)
+print("{:<40}{:>10}{:>14}".format("Corpus", "Status", "Time (s)"))
+for r in sorted(results, key=lambda x: x['corpus']):
+    status = 'error' if r['status'] is None else r['status']
+    print("{:<40}{:>10}{:>14.1f}".format(r['corpus'], status, r['time']))
+    if r['status'] != 0:
+        failed.append(r['corpus'])
+print("Total wall time: {:.1f} s with {} worker(s)".format(total_time, args.workers))
+print("Following corpora were not run: {}".format(failed))
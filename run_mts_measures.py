@@ -1,16 +1,21 @@
 ## Script for running multitaper script on all SPADE corpora
 ## James Tanner Nov 2020
 
+import sys
 import subprocess
 import re
 import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 parser = argparse.ArgumentParser()
 parser.add_argument("InputDir", help = "Path to the list of sibilant files")
 parser.add_argument("SoundDir", help = "Path to the top level of sound files")
 parser.add_argument("OutputDir", help = "Path to write out CSVs")
 parser.add_argument("-b", "--batch", help = "Run script on defined batch", action = "store_true")
+parser.add_argument("-e", "--engine", help = "Measure with generate_mts_measures.py (python) or .r (r)",
+                    choices = ["python", "r"], default = "python")
+parser.add_argument("-j", "--jobs", help = "Number of corpora to process at once", type = int, default = 4)
 args = parser.parse_args()
 
 ## batch to run: fill if necessary
@@ -40,24 +45,29 @@ def getCorpusName(file):
     return corpus
 
 def runMTS(corpus, file, flag = []):
-    """Call R process to run mts script"""
+    """Call R (or Python) process to run mts script"""
 
     inPath = os.path.join(args.InputDir, file)
     SoundPath = os.path.join(args.SoundDir, corpus, "audio_and_transcripts")
 
     ## command line call
-    cmd = ['Rscript', 'generate_mts_measures.r', inPath, SoundPath, args.OutputDir]
+    if args.engine == "r":
+        cmd = ['Rscript', 'generate_mts_measures.r', inPath, SoundPath, args.OutputDir]
+    else:
+        ## the cores are shared between the corpora processed at once
+        workers = max(1, (os.cpu_count() or 1) // args.jobs)
+        cmd = [sys.executable, 'generate_mts_measures.py', inPath, SoundPath, args.OutputDir, '-w', str(workers)]
 
     ## insert flags into command line call
     if len(flag) > 0:
         for i, fl in enumerate(flag):
             cmd.insert(i + 2, fl)
 
-    ## make R call
+    ## make call
     print(cmd)
-    subprocess.call(cmd)
+    return subprocess.call(cmd)
 
-def processFile(file, f = []):
+def processFile(file):
     """Get corpus name and run MTS
        script with arguments"""
 
@@ -68,6 +78,7 @@ def processFile(file, f = []):
         if corpus in skipped:
             return
 
+        f = []
         if corpus in subdirs:
             f.append('-d')
 
@@ -77,10 +88,12 @@ def processFile(file, f = []):
         if corpus in speakers:
             f.append('-s')
 
-        runMTS(corpus, file, flag = f)
+        return corpus, runMTS(corpus, file, flag = f)
 
-## run over directory
-if args.batch:
-    list(map(processFile, b))
-else:
-    list(map(processFile, os.listdir(args.InputDir)))
+## run over directory, several corpora at once
+files = b if args.batch else os.listdir(args.InputDir)
+with ThreadPoolExecutor(max_workers = args.jobs) as executor:
+    results = [r for r in executor.map(processFile, files) if r is not None]
+for corpus, code in results:
+    if code != 0:
+        print("{} failed (exit status {})".format(corpus, code))
@@ -32,6 +32,7 @@ if __name__ == '__main__':
     parser.add_argument('corpus_name', help='Name of the corpus')
     parser.add_argument('-r', '--reset', help="Reset the corpus", action='store_true')
     parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
+    parser.add_argument('-w', '--workers', help="Number of processes measuring discourses at once", type=int, default=None)
 
     args = parser.parse_args()
     corpus_name = args.corpus_name
@@ -64,14 +65,13 @@ if __name__ == '__main__':
         # Process corpus and enrich with information
         # about the lexical properties of words in the
         # corpus, speakers, and linguistic structure
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
 
         # Analyse sibilant data, generate query and export data
         # the sibilants used in the analysis are defined in the
         # corpus's YAML configuration file
-        common.sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'], ignored_speakers=ignored_speakers)
-        common.sibilant_export(config, corpus_name, corpus_conf['dialect_code'], included_speakers, ignored_speakers=ignored_speakers)
+        common.sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'], ignored_speakers=ignored_speakers,
+                                          engine=corpus_conf.get('sibilant_engine', 'praat'), workers=args.workers)
+        common.sibilant_export(config, corpus_name, corpus_conf['dialect_code'], included_speakers, ignored_speakers=ignored_speakers,
+                               multitaper=corpus_conf.get('multitaper_measures', False), workers=args.workers)
         print('Finishing up!')
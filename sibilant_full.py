@@ -166,6 +166,7 @@ if __name__ == '__main__':
     parser.add_argument('-r', '--reset', help="Reset the corpus", action='store_true')
     parser.add_argument('-b', '--baseline', help='Calculate baseline duration', action='store_true')
     parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
+    parser.add_argument('-w', '--workers', help="Number of processes measuring discourses at once", type=int, default=None)
 
     args = parser.parse_args()
     corpus_name = args.corpus_name
@@ -201,20 +202,15 @@ if __name__ == '__main__':
         # Common set up
         ## Check if the corpus already exists as a database: if not, import the audio and
         ## transcripts and store in graph format
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        ## Add information to the corpus regarding lexical, speaker, and linguistic information
-        ## These functions are defined in common.py
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
+        common.prepare_corpus(config, corpus_conf)
 
         ## Call the siblant analysis function
         ## the specifics of the sibilant acoustic analysis is found in common.py; the segments
         ## over which it applies is defined in the corpus-specific YAML file (under
         ## 'sibilant_segments'). Change the list of segments in order to change over what phones
         ## the sibilant enrichment/extraction applies
-        common.sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'], ignored_speakers=ignored_speakers)
+        common.sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'], ignored_speakers=ignored_speakers,
+                                          engine=corpus_conf.get('sibilant_engine', 'praat'), workers=args.workers)
         ## Once the set of sibilant tokens have been enriched for acoustic measures,
         ## extract the data in tabular (CSV) format. Columns included in this output file
         ## are defined in the function at the beginning of this script
@@ -0,0 +1,63 @@
+####################################
+## SPADE database snapshot script ##
+####################################
+
+## Imports and enriches a corpus (as done at the start of every analysis script),
+## then saves a copy of the resulting database so that later resets can restore it
+## (reset_database.py -R) instead of importing the corpus from scratch.
+
+## Input:
+## - corpus name (e.g., Buckeye, SOTC)
+## - corpus metadata (stored in a YAML file)
+## Output:
+## - snapshot of the database in snapshots/<corpus name>_<config hash>
+
+import sys
+import os
+import argparse
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import common
+
+from polyglotdb.utils import ensure_local_database_running
+from polyglotdb.config import CorpusConfig
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus_name', help='Name of the corpus')
+    parser.add_argument('-f', '--force', help="Remake the snapshot even if one exists", action='store_true')
+    parser.add_argument('-d', '--docker', help="This script is being called from Docker", action='store_true')
+
+    args = parser.parse_args()
+    corpus_name = args.corpus_name
+    docker = args.docker
+    directories = [x for x in os.listdir(base_dir) if os.path.isdir(x) and x != 'Common']
+
+    if args.corpus_name not in directories:
+        print(
+            'The corpus {0} does not have a directory (available: {1}).  Please make it with a {0}.yaml file inside.'.format(
+                args.corpus_name, ', '.join(directories)))
+        sys.exit(1)
+    corpus_conf = common.load_config(corpus_name)
+
+    if not args.force and os.path.exists(common.get_snapshot_path(corpus_name, corpus_conf)):
+        print('Snapshot for the current configuration of {} already exists, skipping.'.format(corpus_name))
+        sys.exit(0)
+    print('Processing...')
+    ip = common.server_ip
+    if docker:
+        ip = common.docker_ip
+    with ensure_local_database_running(corpus_name, port=common.server_port, ip=ip, token=common.load_token()) as params:
+        config = CorpusConfig(corpus_name, **params)
+        config.formant_source = 'praat'
+
+        ## Common set up: import the corpus and perform linguistic and speaker enrichment
+        common.prepare_corpus(config, corpus_conf)
+
+    ## the database is stopped on leaving the block above, so its files can be copied
+    common.save_snapshot(corpus_name, corpus_conf, ip=ip)
+    print('Finishing up!')